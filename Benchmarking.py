@@ -3,8 +3,6 @@ import json
 import time
 import numpy as np
 from collections import defaultdict
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 class BenchmarkFramework:
     def __init__(self):
@@ -58,8 +56,12 @@ class BenchmarkFramework:
                     datasets.append(dataset_name)
                     values.append(dataset_results[metric])
         
-        # Create DataFrame for seaborn
+        # Plotting libraries are only needed here, not to collect results
+        import matplotlib.pyplot as plt
         import pandas as pd
+        import seaborn as sns
+        
+        # Create DataFrame for seaborn
         df = pd.DataFrame({
             'Model': models,
             'Dataset': datasets,
@@ -79,16 +81,37 @@ class BenchmarkFramework:
         
         print(f"Visualization saved to {save_path}")
         
-    def calculate_average_performance(self, metric='f1'):
+    def record_run(self, history, run_id=None, commit=None):
+        """
+        Append the current results to a BenchmarkHistory as a new run
+        
+        Args:
+            history: benchmark_history.BenchmarkHistory to append to
+            run_id: Run identifier (generated when omitted)
+            commit: Commit the run measured (defaults to the checked-out commit)
+        
+        Returns:
+            The run id
+        """
+        return history.record(self.results, run_id=run_id, commit=commit)
+        
+    def calculate_average_performance(self, metric='f1', history=None, **filters):
         """
         Calculate average performance of each model across datasets
         
         Args:
             metric: Metric to use for average calculation
+            history: Optional BenchmarkHistory; when given, the average is
+                computed by the database over every stored run matching the
+                filters (model, dataset, run_id, commit, machine, since, until)
+                instead of over the in-memory results
         
         Returns:
             Dictionary of model names to average performance
         """
+        if history is not None:
+            return history.average_performance(metric, **filters)
+        
         averages = {}
         
         for model_name, model_results in self.results.items():
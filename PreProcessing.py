@@ -1,54 +1,438 @@
 # save as data/preprocess_squad.py
+import hashlib
+import itertools
 import json
 import os
-import pandas as pd
 import numpy as np
-from datasets import load_from_disk, Dataset
-import torch
-from transformers import BertTokenizer, AutoTokenizer
+from datasets import load_from_disk, Dataset, Features, Sequence, Value
+from transformers import BertTokenizerFast, AutoTokenizer
+# Streams raw .json files, so ingestion never parses a whole file at once
+import ijson
 
-def preprocess_squad(model_type="bert"):
+# Fail instead of downloading SQuAD when the raw files are missing
+OFFLINE = os.environ.get('SENTISPEECH_OFFLINE', '0') == '1'
+
+SQUAD_COLUMNS = ("id", "title", "context", "question", "answers")
+SQUAD_FEATURES = Features({
+    "id": Value("string"),
+    "title": Value("string"),
+    "context": Value("string"),
+    "question": Value("string"),
+    "answers": Sequence({"text": Value("string"), "answer_start": Value("int32")}),
+})
+
+def preprocess_squad(model_type="bert", num_proc=None, batch_size=1000, force=False, offline=None, **options):
     """
     Preprocess SQuAD dataset for different model types
     
     Args:
         model_type: Type of model ("bert", "gpt", "lstm")
+        num_proc: Dataset.map worker processes (None runs in this process).
+            Outputs are the same for any number of workers
+        batch_size: Examples per Dataset.map batch
+        force: Rebuild every split even when its saved artifact is fresh
+        offline: Raise FileNotFoundError when the raw files are missing
+            instead of downloading SQuAD (defaults to SENTISPEECH_OFFLINE)
+        options: Passed to the model's preprocess_for_* function
     
     Returns:
         Processed datasets
     """
-    # Load dataset
-    try:
-        with open('data/raw/squad_train.json', 'r') as f:
-            train_data = json.load(f)
-        with open('data/raw/squad_validation.json', 'r') as f:
-            val_data = json.load(f)
-        
-        train_dataset = Dataset.from_dict(train_data)
-        val_dataset = Dataset.from_dict(val_data)
-    except:
+    # Load dataset from data/raw/squad_{train,validation}.jsonl or .json
+    paths = {split: raw_squad_path(split) for split in ("train", "validation")}
+    if all(paths.values()):
+        input_hashes = {split: file_sha256(path) for split, path in paths.items()}
+        train_dataset = load_squad_file(paths["train"], batch_size, input_hashes["train"])
+        val_dataset = load_squad_file(paths["validation"], batch_size, input_hashes["validation"])
+    elif OFFLINE if offline is None else offline:
+        missing = ', '.join(f"data/raw/squad_{split}.json[l]" for split, path in paths.items() if not path)
+        raise FileNotFoundError(f"Raw SQuAD files not found ({missing}) and offline mode is on")
+    else:
         # If local files don't exist, download from Hugging Face
         from datasets import load_dataset
         dataset = load_dataset('rajpurkar/squad')
         train_dataset = dataset['train']
         val_dataset = dataset['validation']
+        # Hub datasets are fingerprinted by their cached files
+        input_hashes = None
     
     # Create output directory
     os.makedirs(f'data/processed/{model_type}', exist_ok=True)
     
     # Apply different preprocessing based on model type
     if model_type == "bert":
-        return preprocess_for_bert(train_dataset, val_dataset)
+        return preprocess_for_bert(
+            train_dataset, val_dataset, num_proc, batch_size,
+            input_hashes=input_hashes, force=force, **options
+        )
     elif model_type == "gpt":
-        return preprocess_for_gpt(train_dataset, val_dataset)
+        return preprocess_for_gpt(
+            train_dataset, val_dataset, num_proc, batch_size,
+            input_hashes=input_hashes, force=force, **options
+        )
     elif model_type == "lstm":
-        return preprocess_for_lstm(train_dataset, val_dataset)
+        return preprocess_for_lstm(
+            train_dataset, val_dataset, num_proc, batch_size,
+            input_hashes=input_hashes, force=force, **options
+        )
     else:
         raise ValueError(f"Unknown model_type: {model_type}")
 
-def preprocess_for_bert(train_dataset, val_dataset):
-    """Preprocess for BERT-based models"""
-    tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
+def file_sha256(path, chunk_size=1 << 20):
+    """Hex SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def artifact_fingerprint(input_hash, tokenizer=None, **params):
+    """
+    Fingerprint of a processed split: the hash of its input data, the
+    tokenizer name and the library versions it was built with, and the
+    preprocessing parameters. Returns (fingerprint, description).
+    """
+    import datasets
+    import transformers
+    description = {
+        "input": input_hash,
+        "tokenizer": getattr(tokenizer, "name_or_path", None) if tokenizer is not None else None,
+        "tokenizer_class": type(tokenizer).__name__ if tokenizer is not None else None,
+        "transformers": transformers.__version__,
+        "datasets": datasets.__version__,
+        "params": params,
+    }
+    if tokenizer is not None:
+        import tokenizers
+        description["tokenizers"] = tokenizers.__version__
+    encoded = json.dumps(description, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest(), description
+
+def _fingerprint_path(path):
+    return f"{path}.fingerprint.json"
+
+def is_fresh(path, fingerprint):
+    """Whether the artifact at path exists and was built with this fingerprint"""
+    try:
+        with open(_fingerprint_path(path)) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return saved.get("fingerprint") == fingerprint and os.path.exists(path)
+
+def _invalidate(path):
+    # Drop the fingerprint first, so an interrupted rebuild is never taken as fresh
+    if os.path.exists(_fingerprint_path(path)):
+        os.remove(_fingerprint_path(path))
+
+def _write_fingerprint(path, fingerprint, description):
+    with open(_fingerprint_path(path), 'w') as f:
+        json.dump({"fingerprint": fingerprint, **description}, f, indent=2, sort_keys=True, default=str)
+
+def _input_hash(dataset, split, input_hashes):
+    # Datasets built in memory are fingerprinted by content, hub ones by their files
+    return (input_hashes or {}).get(split) or dataset._fingerprint
+
+def raw_squad_path(split):
+    """The raw file of a split, preferring JSON Lines, or None when there is none"""
+    for path in (f'data/raw/squad_{split}.jsonl', f'data/raw/squad_{split}.json'):
+        if os.path.exists(path):
+            return path
+    return None
+
+def _squad_example(record, title=None):
+    # Answers come as {"text": [...], "answer_start": [...]} or as a list of
+    # {"text", "answer_start"} objects, as in the nested SQuAD files
+    answers = record.get("answers") or {"text": [], "answer_start": []}
+    if isinstance(answers, list):
+        answers = {
+            "text": [answer["text"] for answer in answers],
+            "answer_start": [answer["answer_start"] for answer in answers],
+        }
+    return {
+        "id": record["id"],
+        "title": record.get("title", title) or "",
+        "context": record["context"],
+        "question": record["question"],
+        "answers": {"text": list(answers["text"]), "answer_start": [int(start) for start in answers["answer_start"]]},
+    }
+
+def _article_examples(article):
+    # One article of the nested format: {"title", "paragraphs": [{"context", "qas": [...]}]}
+    for paragraph in article.get("paragraphs", []):
+        for qa in paragraph.get("qas", []):
+            yield _squad_example({**qa, "context": paragraph["context"]}, article.get("title"))
+
+def _json_layout(path):
+    """'nested' for {"data": [...]} files, 'columns' for {"id": [...], ...} files"""
+    with open(path, 'rb') as f:
+        for prefix, event, value in ijson.parse(f):
+            if prefix == '' and event == 'map_key':
+                if value == 'data':
+                    return 'nested'
+                if value in SQUAD_COLUMNS:
+                    return 'columns'
+    raise ValueError(f"{path} is neither nested SQuAD JSON nor a mapping of SQuAD columns")
+
+def iter_squad_examples(path):
+    """
+    Yield the examples of a raw SQuAD file one at a time. Accepts JSON Lines
+    (one example per line), the official nested JSON ({"data": [articles]})
+    and JSON mapping each column to a list. JSON is streamed with ijson, one
+    article or one value per column at a time.
+    """
+    if path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield _squad_example(json.loads(line))
+        return
+    
+    if _json_layout(path) == 'nested':
+        with open(path, 'rb') as f:
+            for article in ijson.items(f, 'data.item'):
+                yield from _article_examples(article)
+        return
+    
+    # One parser per column, advanced together; a missing or short column ends early
+    files = [open(path, 'rb') for _ in SQUAD_COLUMNS]
+    try:
+        columns = [ijson.items(f, f'{column}.item') for f, column in zip(files, SQUAD_COLUMNS)]
+        missing = object()
+        for values in itertools.zip_longest(*columns, fillvalue=missing):
+            if any(value is missing for value in values):
+                short = [column for column, value in zip(SQUAD_COLUMNS, values) if value is missing]
+                if short == ["title"]:
+                    values = tuple("" if value is missing else value for value in values)
+                else:
+                    raise ValueError(f"Columns {', '.join(short)} of {path} are missing or shorter than the others")
+            yield _squad_example(dict(zip(SQUAD_COLUMNS, values)))
+    finally:
+        for f in files:
+            f.close()
+
+def _generate_squad(path, content_hash=None):
+    # content_hash is only part of the Dataset.from_generator cache key, so
+    # that an edited file is not served from the cache of its old contents
+    yield from iter_squad_examples(path)
+
+def load_squad_file(path, batch_size=1000, content_hash=None):
+    """
+    Build a Dataset from a raw SQuAD file without loading the file whole:
+    examples are streamed into the Arrow cache batch_size at a time, so peak
+    memory does not grow with the file size
+    """
+    return Dataset.from_generator(
+        _generate_squad,
+        features=SQUAD_FEATURES,
+        gen_kwargs={"path": path, "content_hash": content_hash or file_sha256(path)},
+        writer_batch_size=batch_size,
+    )
+
+def _first_true(mask):
+    """Index of the first True in each row, or the row length when there is none"""
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), mask.shape[1])
+
+def locate_answer_spans(offset_mapping, start_chars, end_chars, sequence_ids=None, has_answer=None, max_length=384):
+    """
+    Token start/end positions of the answer of every feature in a batch,
+    computed on (features x tokens) arrays instead of per-token loops.
+    
+    Args:
+        offset_mapping: Per-feature lists of (start, end) character offsets;
+            rows may have different lengths
+        start_chars: Answer start character of each feature's example
+        end_chars: Answer end character of each feature's example
+        sequence_ids: Per-feature token type ids (1 marks context tokens).
+            Without them the original loops are reproduced exactly: the
+            start is the token before the first one starting after
+            start_chars, searched over all tokens including the question.
+            With them only context tokens are searched, and features whose
+            context window does not contain the whole answer, or whose
+            example has no answer, get (0, 0)
+        has_answer: Whether each feature's example has an answer (context mode)
+        max_length: Positions at or beyond it are replaced by (0, 0)
+    
+    Returns:
+        (start_positions, end_positions) lists
+    """
+    start_chars = np.asarray(start_chars, dtype=np.int64)
+    end_chars = np.asarray(end_chars, dtype=np.int64)
+    lengths = np.array([len(offsets) for offsets in offset_mapping])
+    width = int(lengths.max()) if len(lengths) else 0
+    if len(lengths) and (lengths == width).all() and width:
+        offsets = np.asarray(offset_mapping, dtype=np.int64).reshape(len(lengths), width, 2)
+    else:
+        # Pad ragged rows so that padding satisfies every "stop here" test below
+        big = np.iinfo(np.int64).max
+        offsets = np.full((len(offset_mapping), width, 2), big, dtype=np.int64)
+        for row, row_offsets in enumerate(offset_mapping):
+            if len(row_offsets):
+                offsets[row, :len(row_offsets)] = row_offsets
+    starts, ends = offsets[..., 0], offsets[..., 1]
+    positions = np.arange(width)
+    
+    if sequence_ids is None:
+        token_start = _first_true(starts > start_chars[:, None]) - 1
+        token_end = _first_true((ends > end_chars[:, None]) & (positions >= token_start[:, None])) - 1
+        # A feature whose first token starts after the answer makes the
+        # original end loop begin at index -1; replay it for those rows
+        for row in np.flatnonzero(token_start < 0):
+            index = -1
+            row_offsets = offset_mapping[row]
+            while index < len(row_offsets) and row_offsets[index][1] <= end_chars[row]:
+                index += 1
+            token_end[row] = index - 1
+        out_of_bounds = (token_start >= max_length) | (token_end >= max_length)
+    else:
+        types = np.zeros((len(offset_mapping), width), dtype=np.int64)
+        for row, row_types in enumerate(sequence_ids):
+            types[row, :len(row_types)] = row_types
+        # Special tokens have empty (0, 0) offsets and are not context
+        context = (types == 1) & (ends > starts) & (positions < lengths[:, None])
+        has_context = context.any(axis=1)
+        context_start = context.argmax(axis=1)
+        context_end = width - 1 - context[:, ::-1].argmax(axis=1)
+        rows = np.arange(len(offset_mapping))
+        # Context offsets increase, so counting tokens is a search over them
+        token_start = context_start + (context & (starts <= start_chars[:, None])).sum(axis=1) - 1
+        token_end = context_end - (context & (ends >= end_chars[:, None])).sum(axis=1) + 1
+        inside = (
+            has_context
+            & (starts[rows, context_start] <= start_chars)
+            & (ends[rows, context_end] >= end_chars)
+        )
+        if has_answer is not None:
+            inside &= np.asarray(has_answer, dtype=bool)
+        out_of_bounds = ~inside | (token_start >= max_length) | (token_end >= max_length)
+    
+    token_start = np.where(out_of_bounds, 0, token_start)
+    token_end = np.where(out_of_bounds, 0, token_end)
+    return token_start.tolist(), token_end.tolist()
+
+def padding_ratio(lengths, padded_lengths):
+    """Share of pad tokens when sequences of the given lengths are padded to padded_lengths"""
+    total = int(np.sum(padded_lengths))
+    return 1.0 - int(np.sum(lengths)) / total if total else 0.0
+
+def _report_padding(model_type, report):
+    """
+    Print the padding report of the rebuilt splits and save it next to the
+    processed datasets, keeping the entries of splits that were not rebuilt
+    """
+    path = f'data/processed/{model_type}/padding_report.json'
+    try:
+        with open(path) as f:
+            report = {**json.load(f), **report}
+    except (OSError, ValueError):
+        pass
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    for split, entry in report.items():
+        print(
+            f"{model_type.upper()} {split} padding ratio: {entry['padding_ratio_before']:.1%} before, "
+            f"{entry['padding_ratio_after']:.1%} after"
+        )
+
+def _cut_blocks(input_ids, position_ids, block_size, pad_token_id):
+    """Cut flat token and position arrays into block_size rows, padding the last one"""
+    total = len(input_ids)
+    blocks = -(-total // block_size)
+    padded_ids = np.full(blocks * block_size, pad_token_id, dtype=np.int64)
+    padded_positions = np.zeros(blocks * block_size, dtype=np.int64)
+    padded_ids[:total] = input_ids
+    padded_positions[:total] = position_ids
+    attention_mask = (np.arange(blocks * block_size) < total).astype(np.int64)
+    labels = np.where(attention_mask == 1, padded_ids, -100)
+    shape = (blocks, block_size)
+    return {
+        "input_ids": padded_ids.reshape(shape).tolist(),
+        "attention_mask": attention_mask.reshape(shape).tolist(),
+        "labels": labels.reshape(shape).tolist(),
+        "position_ids": padded_positions.reshape(shape).tolist(),
+    }
+
+def _flatten(sequences, eos_token_id):
+    """Token ids of the sequences, each followed by EOS, with positions restarting at each one"""
+    sequences = [np.append(np.asarray(sequence, dtype=np.int64), eos_token_id) for sequence in sequences]
+    if not sequences:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(sequences), np.concatenate([np.arange(len(sequence)) for sequence in sequences])
+
+def pack_sequences(sequences, block_size, eos_token_id, pad_token_id):
+    """
+    Concatenate token sequences, each followed by EOS, and cut them into
+    blocks of block_size tokens. Only the last block is padded: its pad
+    positions get attention_mask 0 and labels -100. position_ids restart at
+    every example, for attention implementations that use them to keep
+    packed examples apart.
+    """
+    input_ids, position_ids = _flatten(sequences, eos_token_id)
+    return _cut_blocks(input_ids, position_ids, block_size, pad_token_id)
+
+class SequencePacker:
+    """
+    Batched Dataset.map function (with_indices=True) that packs the
+    "input_ids" column of a whole dataset like pack_sequences. Tokens that
+    do not fill a block are carried into the next batch and only the block
+    holding the end of the dataset is padded, so the blocks do not depend on
+    batch_size. The carry makes it order dependent: run it in one process.
+    """
+    
+    def __init__(self, num_rows, block_size, eos_token_id, pad_token_id):
+        self.num_rows = num_rows
+        self.block_size = block_size
+        self.eos_token_id = eos_token_id
+        self.pad_token_id = pad_token_id
+        self._carry = _flatten([], eos_token_id)
+    
+    def __call__(self, examples, indices):
+        if len(indices) and indices[0] == 0:
+            self._carry = _flatten([], self.eos_token_id)
+        input_ids, position_ids = _flatten(examples["input_ids"], self.eos_token_id)
+        input_ids = np.concatenate([self._carry[0], input_ids])
+        position_ids = np.concatenate([self._carry[1], position_ids])
+        if len(indices) and indices[-1] == self.num_rows - 1:
+            cut = len(input_ids)
+        else:
+            cut = len(input_ids) // self.block_size * self.block_size
+        self._carry = input_ids[cut:], position_ids[cut:]
+        return _cut_blocks(input_ids[:cut], position_ids[:cut], self.block_size, self.pad_token_id)
+
+def _configure_workers(num_proc):
+    # Rust tokenizer threads in every map worker would oversubscribe the
+    # cores, and fork after the tokenizer has run can deadlock them
+    if num_proc and num_proc > 1:
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+def preprocess_for_bert(train_dataset, val_dataset, num_proc=None, batch_size=1000, answer_spans="legacy",
+                        bucket_size=None, input_hashes=None, force=False):
+    """
+    Preprocess for BERT-based models
+    
+    answer_spans="legacy" keeps the original answer positions, which also
+    match question tokens and answers outside the feature's window;
+    "context" searches context tokens only and labels features that do not
+    contain the whole answer with (0, 0). See locate_answer_spans.
+    
+    With bucket_size, features are stored unpadded with a "length" column
+    and a "bucket" column (length rounded up to a multiple of bucket_size),
+    sorted by bucket, so batches drawn from one bucket only need padding to
+    the bucket length. Buckets require answer_spans="context": legacy answer
+    positions of answers outside the window would differ from the padded
+    ones, as pads no longer extend the search.
+    
+    Each split is saved with a fingerprint of its input (input_hashes, by
+    split, or the dataset's own fingerprint), the tokenizer and these
+    parameters; splits whose saved fingerprint matches are loaded instead of
+    rebuilt unless force is set.
+    """
+    if answer_spans not in ("legacy", "context"):
+        raise ValueError(f"Unknown answer_spans: {answer_spans}")
+    if bucket_size and answer_spans != "context":
+        raise ValueError("bucket_size requires answer_spans=\"context\"")
+    _configure_workers(num_proc)
+    tokenizer = BertTokenizerFast.from_pretrained('bert-base-uncased')
     
     def preprocess_function(examples):
         questions = [q.strip() for q in examples["question"]]
@@ -63,145 +447,317 @@ def preprocess_for_bert(train_dataset, val_dataset):
             stride=128,
             return_overflowing_tokens=True,
             return_offsets_mapping=True,
-            padding="max_length",
+            padding=False if bucket_size else "max_length",
         )
         
         # Get answer positions
         offset_mapping = inputs.pop("offset_mapping")
         sample_map = inputs.pop("overflow_to_sample_mapping")
         
-        start_positions = []
-        end_positions = []
+        start_chars = np.array([
+            answer["answer_start"][0] if len(answer["answer_start"]) > 0 else 0
+            for answer in examples["answers"]
+        ])
+        end_chars = start_chars + np.array([
+            len(answer["text"][0]) if len(answer["text"]) > 0 else 0
+            for answer in examples["answers"]
+        ])
+        has_answer = np.array([len(answer["text"]) > 0 for answer in examples["answers"]])
+        sample_map = np.asarray(sample_map)
         
-        for i, offset in enumerate(offset_mapping):
-            sample_idx = sample_map[i]
-            answer = examples["answers"][sample_idx]
-            start_char = answer["answer_start"][0] if len(answer["answer_start"]) > 0 else 0
-            end_char = start_char + len(answer["text"][0]) if len(answer["text"]) > 0 else 0
-            
-            # Find token positions that correspond to the answer
-            token_start_index = 0
-            while token_start_index < len(offset) and offset[token_start_index][0] <= start_char:
-                token_start_index += 1
-            token_start_index -= 1
-            
-            token_end_index = token_start_index
-            while token_end_index < len(offset) and offset[token_end_index][1] <= end_char:
-                token_end_index += 1
-            token_end_index -= 1
-            
-            # If answer is out of bounds or truncated
-            if token_start_index >= 384 or token_end_index >= 384:
-                start_positions.append(0)
-                end_positions.append(0)
-            else:
-                start_positions.append(token_start_index)
-                end_positions.append(token_end_index)
+        start_positions, end_positions = locate_answer_spans(
+            offset_mapping,
+            start_chars[sample_map],
+            end_chars[sample_map],
+            sequence_ids=inputs["token_type_ids"] if answer_spans == "context" else None,
+            has_answer=has_answer[sample_map],
+            max_length=384,
+        )
         
         inputs["start_positions"] = start_positions
         inputs["end_positions"] = end_positions
+        if bucket_size:
+            lengths = [len(input_ids) for input_ids in inputs["input_ids"]]
+            inputs["length"] = lengths
+            inputs["bucket"] = [-(-length // bucket_size) * bucket_size for length in lengths]
         return inputs
     
-    # Apply preprocessing
-    train_processed = train_dataset.map(
-        preprocess_function,
-        batched=True,
-        remove_columns=train_dataset.column_names,
-    )
-    
-    val_processed = val_dataset.map(
-        preprocess_function,
-        batched=True,
-        remove_columns=val_dataset.column_names,
-    )
+    processed = {}
+    report = {}
+    for split, dataset in (("train", train_dataset), ("validation", val_dataset)):
+        path = f'data/processed/bert/{split}'
+        fingerprint, description = artifact_fingerprint(
+            _input_hash(dataset, split, input_hashes), tokenizer,
+            max_length=384, stride=128, truncation="only_second",
+            padding="bucketed" if bucket_size else "max_length",
+            answer_spans=answer_spans, bucket_size=bucket_size,
+        )
+        if not force and is_fresh(path, fingerprint):
+            print(f"BERT {split} is up to date, loading {path}")
+            processed[split] = load_from_disk(path)
+            continue
+        _invalidate(path)
+        
+        # Apply preprocessing
+        features = dataset.map(
+            preprocess_function,
+            batched=True,
+            remove_columns=dataset.column_names,
+            num_proc=num_proc,
+            batch_size=batch_size,
+        )
+        
+        if bucket_size:
+            lengths = np.asarray(features["length"])
+            report[split] = {
+                "features": len(lengths),
+                "padding_ratio_before": padding_ratio(lengths, np.full_like(lengths, 384)),
+                "padding_ratio_after": padding_ratio(lengths, np.asarray(features["bucket"])),
+            }
+            features = features.sort("bucket").flatten_indices()
+        
+        # Save processed dataset
+        features.save_to_disk(path)
+        _write_fingerprint(path, fingerprint, description)
+        processed[split] = features
     
-    # Save processed datasets
-    train_processed.save_to_disk('data/processed/bert/train')
-    val_processed.save_to_disk('data/processed/bert/validation')
+    if report:
+        _report_padding("bert", report)
+    train_processed, val_processed = processed["train"], processed["validation"]
     
     print(f"BERT preprocessing complete. Examples: {len(train_processed)}")
     return train_processed, val_processed
 
-def preprocess_for_gpt(train_dataset, val_dataset):
-    """Preprocess for GPT-based models"""
-    tokenizer = AutoTokenizer.from_pretrained('gpt2')
+def preprocess_for_gpt(train_dataset, val_dataset, num_proc=None, batch_size=1000, packing=False, block_size=512,
+                       input_hashes=None, force=False):
+    """
+    Preprocess for GPT-based models
+    
+    With packing=True, examples are tokenized without padding and packed
+    into block_size-token blocks separated by EOS (see pack_sequences), with
+    labels for causal language modelling. Tokenization runs on num_proc
+    workers; packing is a separate pass in this process (see SequencePacker),
+    so the blocks are the same for any num_proc and batch_size.
+    
+    Splits are fingerprinted and reused as in preprocess_for_bert.
+    """
+    _configure_workers(num_proc)
+    tokenizer = AutoTokenizer.from_pretrained('gpt2', use_fast=True)
     tokenizer.pad_token = tokenizer.eos_token
     
-    def preprocess_function(examples):
+    def format_examples(examples):
         # Format for GPT: "Context: {context} Question: {question} Answer:"
-        texts = [
+        return [
             f"Context: {context} Question: {question} Answer: {answer['text'][0] if len(answer['text']) > 0 else 'No answer'}"
             for context, question, answer in zip(examples["context"], examples["question"], examples["answers"])
         ]
+    
+    def preprocess_function(examples):
+        texts = format_examples(examples)
         
-        # Tokenize
+        # Tokenize; Dataset.map stores plain lists, so no tensors are needed
         encodings = tokenizer(
             texts,
             truncation=True,
             max_length=512,
-            padding="max_length",
-            return_tensors="pt"
+            padding="max_length"
         )
         
         return encodings
     
-    # Apply preprocessing
-    train_processed = train_dataset.map(
-        preprocess_function,
-        batched=True,
-        remove_columns=train_dataset.column_names,
-    )
+    def tokenize_function(examples):
+        input_ids = tokenizer(format_examples(examples))["input_ids"]
+        return {"input_ids": input_ids, "length": [len(ids) for ids in input_ids]}
     
-    val_processed = val_dataset.map(
-        preprocess_function,
-        batched=True,
-        remove_columns=val_dataset.column_names,
-    )
+    processed = {}
+    report = {}
+    for split, dataset in (("train", train_dataset), ("validation", val_dataset)):
+        path = f'data/processed/gpt/{split}'
+        fingerprint, description = artifact_fingerprint(
+            _input_hash(dataset, split, input_hashes), tokenizer,
+            max_length=None if packing else 512, truncation=not packing,
+            padding="packed" if packing else "max_length",
+            block_size=block_size if packing else None,
+        )
+        if not force and is_fresh(path, fingerprint):
+            print(f"GPT {split} is up to date, loading {path}")
+            processed[split] = load_from_disk(path)
+            continue
+        _invalidate(path)
+        
+        if packing:
+            tokenized = dataset.map(
+                tokenize_function,
+                batched=True,
+                remove_columns=dataset.column_names,
+                num_proc=num_proc,
+                batch_size=batch_size,
+            )
+            lengths = np.asarray(tokenized["length"])
+            features = tokenized.map(
+                SequencePacker(len(tokenized), block_size, tokenizer.eos_token_id, tokenizer.pad_token_id),
+                batched=True,
+                with_indices=True,
+                remove_columns=tokenized.column_names,
+                batch_size=batch_size,
+            )
+            # Count real tokens a batch of blocks at a time rather than loading every block
+            real_tokens = sum(
+                int(batch["attention_mask"].sum())
+                for batch in features.select_columns(["attention_mask"]).with_format("numpy").iter(batch_size=1024)
+            )
+            report[split] = {
+                "examples": len(lengths),
+                "blocks": len(features),
+                # Padded mode truncates to block_size and pads every example to it
+                "padding_ratio_before": padding_ratio(np.minimum(lengths, block_size), np.full_like(lengths, block_size)),
+                "padding_ratio_after": padding_ratio([real_tokens], [len(features) * block_size]),
+            }
+        else:
+            # Apply preprocessing
+            features = dataset.map(
+                preprocess_function,
+                batched=True,
+                remove_columns=dataset.column_names,
+                num_proc=num_proc,
+                batch_size=batch_size,
+            )
+        
+        # Save processed dataset
+        features.save_to_disk(path)
+        _write_fingerprint(path, fingerprint, description)
+        processed[split] = features
     
-    # Save processed datasets
-    train_processed.save_to_disk('data/processed/gpt/train')
-    val_processed.save_to_disk('data/processed/gpt/validation')
+    if report:
+        _report_padding("gpt", report)
+    train_processed, val_processed = processed["train"], processed["validation"]
     
     print(f"GPT preprocessing complete. Examples: {len(train_processed)}")
     return train_processed, val_processed
 
-def preprocess_for_lstm(train_dataset, val_dataset):
-    """Preprocess for LSTM-based models"""
-    # For LSTM, we'll convert text to indices and create embeddings
-    # This is a simplified version - in practice, you'd build a vocabulary
+def write_parquet(dataset, path, transform=None, batch_size=1000, compression="zstd"):
+    """
+    Stream a dataset into a Parquet file one record batch (and row group) at
+    a time, passing each Arrow batch through transform first, so the split is
+    never held in memory. The file is written under a temporary name and
+    renamed into place when complete.
+    """
+    import pyarrow.parquet as pq
+    transform = transform or (lambda batch: batch)
+    batches = dataset.with_format("arrow")
+    schema = transform(batches[:0]).schema
+    partial = f"{path}.partial"
+    with pq.ParquetWriter(partial, schema, compression=compression) as writer:
+        for batch in batches.iter(batch_size=batch_size):
+            writer.write_table(transform(batch).cast(schema), row_group_size=batch_size)
+    os.replace(partial, path)
+
+def read_parquet(path, columns=None):
+    """
+    Load a Parquet file written by write_parquet as an in-memory Dataset,
+    reading and decompressing only the given columns
+    """
+    import pyarrow.parquet as pq
+    from datasets.table import InMemoryTable
+    return Dataset(InMemoryTable(pq.read_table(path, columns=columns, memory_map=True)))
+
+def preprocess_for_lstm(train_dataset, val_dataset, num_proc=None, batch_size=1000, input_hashes=None, force=False,
+                        vocab_size=30000, min_freq=2):
+    """
+    Preprocess for LSTM-based models
     
-    def preprocess_function(examples):
-        # Extract features - simplified for this example
-        features = {
-            "context": examples["context"],
-            "question": examples["question"],
-            "answer_text": [answer["text"][0] if len(answer["text"]) > 0 else "" for answer in examples["answers"]],
-            "answer_start": [answer["answer_start"][0] if len(answer["answer_start"]) > 0 else -1 for answer in examples["answers"]]
-        }
-        
-        return features
+    Each split is streamed into data/processed/lstm/<split>.parquet (zstd,
+    one row group per batch_size examples) without loading it whole, and
+    returned as a disk-backed Dataset; read it with read_parquet to load
+    only the columns the model needs. The
+    conversion is a single pass over Arrow batches, so num_proc is not used.
     
-    # Apply preprocessing
-    train_processed = train_dataset.map(
-        preprocess_function,
-        batched=True,
-        remove_columns=["id", "title"],
-    )
+    Unless vocab_size is None, a vocabulary of up to vocab_size tokens seen
+    at least min_freq times in the training split is saved to vocab.json,
+    and every split is encoded into memory-mappable token id arrays in
+    data/processed/lstm/<split>_ids (see vocabulary.encode_split and
+    vocabulary.TokenArrays). Splits, the vocabulary and the id arrays are
+    fingerprinted as in preprocess_for_bert.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
     
-    val_processed = val_dataset.map(
-        preprocess_function,
-        batched=True,
-        remove_columns=["id", "title"],
-    )
+    def preprocess_function(batch):
+        # Extract features. Context and question stay Arrow columns;
+        # only the answers go through Python
+        answers = batch.column("answers").to_pylist()
+        return batch.drop_columns(["id", "title"]).append_column(
+            "answer_text", pa.array([answer["text"][0] if len(answer["text"]) > 0 else "" for answer in answers], pa.string())
+        ).append_column(
+            "answer_start", pa.array([answer["answer_start"][0] if len(answer["answer_start"]) > 0 else -1 for answer in answers], pa.int64())
+        )
     
-    # Save processed datasets
-    train_processed.to_pandas().to_csv('data/processed/lstm/train.csv', index=False)
-    val_processed.to_pandas().to_csv('data/processed/lstm/validation.csv', index=False)
+    processed = {}
+    fingerprints = {}
+    for split, dataset in (("train", train_dataset), ("validation", val_dataset)):
+        path = f'data/processed/lstm/{split}.parquet'
+        fingerprint, description = artifact_fingerprint(
+            _input_hash(dataset, split, input_hashes),
+            format="parquet", compression="zstd", removed_columns=["id", "title"],
+        )
+        if not force and is_fresh(path, fingerprint):
+            print(f"LSTM {split} is up to date, loading {path}")
+        else:
+            _invalidate(path)
+            write_parquet(dataset, path, preprocess_function, batch_size=batch_size)
+            _write_fingerprint(path, fingerprint, description)
+        # Returned disk-backed: the Parquet file is converted to a memory-mapped
+        # Arrow cache batch by batch. The trainer can use read_parquet instead
+        if pq.ParquetFile(path).metadata.num_rows:
+            processed[split] = Dataset.from_parquet(path)
+        else:
+            processed[split] = read_parquet(path)
+        fingerprints[split] = fingerprint
+    train_processed, val_processed = processed["train"], processed["validation"]
+    
+    if vocab_size:
+        from vocabulary import Vocabulary, encode_split
+        
+        def training_texts():
+            for batch in train_processed.select_columns(["context", "question"]).iter(batch_size=batch_size):
+                yield from batch["context"]
+                yield from batch["question"]
+        
+        path = 'data/processed/lstm/vocab.json'
+        vocab_fingerprint, description = artifact_fingerprint(
+            fingerprints["train"], vocab_size=vocab_size, min_freq=min_freq, lowercase=True,
+        )
+        if not force and is_fresh(path, vocab_fingerprint):
+            vocabulary = Vocabulary.load(path)
+        else:
+            _invalidate(path)
+            vocabulary = Vocabulary.build(training_texts(), max_size=vocab_size, min_freq=min_freq)
+            vocabulary.save(path)
+            _write_fingerprint(path, vocab_fingerprint, description)
+        
+        for split, dataset in processed.items():
+            path = f'data/processed/lstm/{split}_ids'
+            fingerprint, description = artifact_fingerprint(fingerprints[split], vocabulary=vocab_fingerprint)
+            if force or not is_fresh(path, fingerprint):
+                _invalidate(path)
+                encode_split(dataset, path, vocabulary, batch_size=batch_size)
+                _write_fingerprint(path, fingerprint, description)
+        print(f"LSTM vocabulary: {len(vocabulary)} tokens")
     
     print(f"LSTM preprocessing complete. Examples: {len(train_processed)}")
     return train_processed, val_processed
 
 if __name__ == "__main__":
-    for model_type in ["bert", "gpt", "lstm"]:
+    import argparse
+    parser = argparse.ArgumentParser(description="Preprocess SQuAD for the BERT, GPT and LSTM models")
+    parser.add_argument("--model-types", default="bert,gpt,lstm", help="Comma-separated subset of bert,gpt,lstm")
+    parser.add_argument("--num-proc", type=int, default=os.cpu_count(), help="Dataset.map worker processes")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Examples per Dataset.map batch")
+    parser.add_argument("--force", action="store_true", help="Rebuild splits whose saved outputs are up to date")
+    parser.add_argument("--offline", action="store_true", default=None,
+                        help="Fail instead of downloading SQuAD when data/raw has no raw files")
+    args = parser.parse_args()
+    for model_type in [m for m in args.model_types.split(",") if m]:
         print(f"\nPreprocessing for {model_type}...")
-        preprocess_squad(model_type)
\ No newline at end of file
+        preprocess_squad(model_type, num_proc=args.num_proc, batch_size=args.batch_size, force=args.force,
+                         offline=args.offline)
\ No newline at end of file
@@ -0,0 +1,90 @@
+# Paragraph splitting and sentiment-to-speech mapping shared by the web app
+# and the offline bulk scorer (score_corpus.py)
+import logging
+
+logger = logging.getLogger(__name__)
+
+def split_paragraphs(text):
+    """Split text into the non-empty paragraphs that are scored individually"""
+    return [p for p in text.split('\n') if p.strip()]
+
+def split_paragraph_spans(text):
+    """
+    Split text like split_paragraphs, returning (paragraph, start, end) with
+    the paragraph's offsets in UTF-16 code units, so that JavaScript's
+    text.slice(start, end) returns the paragraph.
+    """
+    spans = []
+    position = 0
+    for line in text.split('\n'):
+        length = len(line) if line.isascii() else len(line.encode('utf-16-le')) // 2
+        if line.strip():
+            spans.append((line, position, position + length))
+        position += length + 1
+    return spans
+
+def build_paragraph_result(paragraph, sentiment_result, offsets=None):
+    """
+    Build the per-paragraph response entry, including speech parameters.
+    With (start, end) offsets the compact form is returned, which refers to
+    the paragraph by offset instead of echoing its text.
+    """
+    result = {
+        'text': paragraph,
+        'sentiment': sentiment_result['sentiment'],
+        'score': sentiment_result['score'],
+        'speechParams': {
+            'rate': calculate_rate(sentiment_result),
+            'pitch': calculate_pitch(sentiment_result),
+            'volume': calculate_volume(sentiment_result)
+        }
+    }
+    if offsets is not None:
+        del result['text']
+        result['start'], result['end'] = offsets
+    return result
+
+def calculate_rate(sentiment_result):
+    try:
+        sentiment = sentiment_result['sentiment']
+        score = sentiment_result['score']
+        
+        if sentiment == 'positive':
+            return 1.1 + (score * 0.2)
+        elif sentiment == 'negative':
+            return 0.9 - (score * 0.1)
+        else:
+            return 1.0
+    except Exception as e:
+        logger.error(f"Error calculating rate: {str(e)}")
+        return 1.0
+
+def calculate_pitch(sentiment_result):
+    try:
+        sentiment = sentiment_result['sentiment']
+        score = sentiment_result['score']
+        
+        if sentiment == 'positive':
+            return 1.1 + (score * 0.2)
+        elif sentiment == 'negative':
+            return 0.9 - (score * 0.1)
+        else:
+            return 1.0
+    except Exception as e:
+        logger.error(f"Error calculating pitch: {str(e)}")
+        return 1.0
+
+def calculate_volume(sentiment_result):
+    try:
+        sentiment = sentiment_result['sentiment']
+        score = sentiment_result['score']
+        
+        if sentiment == 'positive' and score > 0.7:
+            return 1.2
+        elif sentiment == 'negative' and score > 0.7:
+            return 0.9
+        else:
+            return 1.0
+    except Exception as e:
+        logger.error(f"Error calculating volume: {str(e)}")
+        return 1.0
@@ -1,17 +1,83 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 from flask_cors import CORS
-from sentiment import analyze_sentiment
+from sentiment import (
+    analyze_sentiment, analyze_sentiment_batch, compose_sentiment, paragraph_cache,
+    score_paragraph, is_ready, startup_timings, warm_up
+)
+from analysis import (
+    split_paragraphs, split_paragraph_spans, build_paragraph_result,
+    calculate_rate, calculate_pitch, calculate_volume
+)
+from metrics import (
+    registry, log_sampled, STAGE_SECONDS, REQUEST_SECONDS, REQUESTS, PARAGRAPHS,
+    REQUEST_BYTES, RESPONSE_BYTES
+)
+from profiling import profile_request
+from backends import get_backend
+from batching import BatchingScorer, MicroBatcher
+from responses import compress_response, content_etag, dumps, etag_matches, json_response, not_modified
 import os
 import logging
 import sys
+import threading
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Upper bound on the number of documents accepted by /api/analyze/batch
+MAX_BATCH_DOCUMENTS = int(os.environ.get('SENTISPEECH_MAX_BATCH_DOCUMENTS', 1000))
+# "composed" derives the overall score from the paragraph passes,
+# "exact" re-scores the full text (see sentiment.compose_sentiment)
+OVERALL_MODE = os.environ.get('SENTISPEECH_OVERALL_MODE', 'composed')
+# Sentiment backend (see backends.py); backends other than VADER are
+# scored through a micro-batching scheduler shared by all requests
+SENTIMENT_BACKEND = os.environ.get('SENTISPEECH_BACKEND', 'vader')
+BATCH_MAX_SIZE = int(os.environ.get('SENTISPEECH_BATCH_MAX_SIZE', 32))
+BATCH_MAX_WAIT = float(os.environ.get('SENTISPEECH_BATCH_MAX_WAIT', 0.005))
+# Everything besides the request that determines an analyze response; part
+# of the response ETag. Bump the trailing revision when the response shape
+# or the speech parameters change.
+ANALYZER_VERSION = f"{SENTIMENT_BACKEND}:{get_backend(SENTIMENT_BACKEND).version}:{OVERALL_MODE}:2"
+
 app = Flask(__name__)
 # Enable CORS for all routes
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=['ETag'])
+
+paragraph_batcher = None
+if SENTIMENT_BACKEND != 'vader':
+    paragraph_batcher = MicroBatcher(
+        get_backend(SENTIMENT_BACKEND).score_batch,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait=BATCH_MAX_WAIT
+    )
+    app.config['PARAGRAPH_SCORER'] = BatchingScorer(paragraph_batcher)
+
+_process_started = time.perf_counter()
+_warm_up_pid = None
+_warm_up_lock = threading.Lock()
+
+def start_warm_up():
+    """
+    Warm the sentiment analyzer in a background thread, once per process.
+    Threads do not survive a fork, so a worker forked from a preloading
+    master that had not finished warming up starts its own warm-up.
+    """
+    global _warm_up_pid
+    with _warm_up_lock:
+        if is_ready() or _warm_up_pid == os.getpid():
+            return
+        _warm_up_pid = os.getpid()
+    threading.Thread(target=warm_up, name='sentiment-warm-up', daemon=True).start()
+
+def _reset_warm_up_lock():
+    # See sentiment._reset_after_fork
+    global _warm_up_lock
+    _warm_up_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_warm_up_lock)
 
 @app.route('/')
 def index():
@@ -22,98 +88,355 @@ def index():
         logger.error(f"Error serving index: {str(e)}")
         return str(e), 500
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness only: the process is up and serving requests
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # Readiness: the analyzer is loaded and has scored a warm-up request
+    start_warm_up()
+    timings = dict(startup_timings, uptime=round(time.perf_counter() - _process_started, 4))
+    if not is_ready():
+        return jsonify({'status': 'starting', 'timings': timings}), 503
+    return jsonify({'status': 'ready', 'timings': timings})
+
+def analysis_etag(endpoint, text, representation):
+    """
+    ETag of an analyze response: a hash of the analyzer version, the endpoint,
+    the response representation and the submitted text. Only the fields that
+    affect the response are hashed, so key order, whitespace and unrelated
+    fields in the request body do not change it.
+    """
+    return content_etag(ANALYZER_VERSION, endpoint, representation, text)
+
 @app.route('/api/analyze', methods=['POST', 'OPTIONS'])
+@profile_request
 def analyze():
-    logger.info(f"Received {request.method} request to /api/analyze")
+    log_sampled(logger, logging.INFO, "Received %s request to /api/analyze", request.method)
     
     # Handle preflight requests
     if request.method == 'OPTIONS':
-        logger.info("Handling OPTIONS request")
         response = app.make_default_options_response()
         response.headers.add('Access-Control-Allow-Methods', 'POST')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
         return response
 
+    endpoint = 'analyze'
+    started = time.perf_counter()
+    status = 500
     try:
-        logger.info("Processing POST request")
-        data = request.get_json()
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='parse'):
+            data = request.get_json()
+        REQUEST_BYTES.inc(request.content_length or 0, endpoint=endpoint)
         if not data:
             logger.error("No JSON data received")
+            status = 400
             return jsonify({"error": "No JSON data received"}), 400
             
         text = data.get('text', '')
-        logger.info(f"Analyzing text: {text[:100]}...")  # Log first 100 chars
+        # The compact format returns paragraph offsets instead of their text
+        compact = data.get('format') == 'compact'
+        
+        # Unchanged re-submissions are answered without re-analysis
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='etag'):
+            etag = analysis_etag(endpoint, text, 'compact' if compact else 'full')
+        if etag_matches(request.if_none_match, etag):
+            status = 304
+            return not_modified(etag)
+        
+        log_sampled(logger, logging.INFO, "Analyzing text: %.100s...", text)  # Log first 100 chars
         
         # Split into paragraphs
-        paragraphs = [p for p in text.split('\n') if p.strip()]
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='split'):
+            if compact:
+                spans = split_paragraph_spans(text)
+                paragraphs = [paragraph for paragraph, _, _ in spans]
+                offsets = [(start, end) for _, start, end in spans]
+            else:
+                paragraphs = split_paragraphs(text)
+                offsets = [None] * len(paragraphs)
         
-        results = []
-        for paragraph in paragraphs:
-            sentiment_result = analyze_sentiment(paragraph)
-            results.append({
-                'text': paragraph,
-                'sentiment': sentiment_result['sentiment'],
-                'score': sentiment_result['score'],
-                'speechParams': {
-                    'rate': calculate_rate(sentiment_result),
-                    'pitch': calculate_pitch(sentiment_result),
-                    'volume': calculate_volume(sentiment_result)
-                }
-            })
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='score'):
+            scored = score_paragraphs(paragraphs, cache=paragraph_cache)
+        PARAGRAPHS.inc(len(paragraphs), endpoint=endpoint)
+        
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='speech_params'):
+            results = [
+                build_paragraph_result(paragraph, sentiment_result, paragraph_offsets)
+                for paragraph, (sentiment_result, _), paragraph_offsets in zip(paragraphs, scored, offsets)
+            ]
         
-        logger.info(f"Analysis complete. Results: {results}")
-        return jsonify({
-            'overall': analyze_sentiment(text),
-            'paragraphs': results
-        })
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='overall'):
+            overall = score_overall(text, [components for _, components in scored])
+        
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='serialize'):
+            if compact:
+                response = json_response({
+                    'format': 'compact',
+                    'overall': overall,
+                    'paragraphs': results
+                })
+            else:
+                response = jsonify({
+                    'overall': overall,
+                    'paragraphs': results
+                })
+        # Weak: the body is the same data whichever content coding is applied
+        response.set_etag(etag, weak=True)
+        RESPONSE_BYTES.inc(response.content_length or 0, endpoint=endpoint)
+        log_sampled(logger, logging.INFO, "Analysis complete. Paragraphs: %d", len(results))
+        status = 200
+        return response
     except Exception as e:
         logger.error(f"Error in analyze endpoint: {str(e)}")
         return jsonify({"error": str(e)}), 500
+    finally:
+        REQUESTS.inc(endpoint=endpoint, status=status)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
 
-def calculate_rate(sentiment_result):
-    try:
-        sentiment = sentiment_result['sentiment']
-        score = sentiment_result['score']
-        
-        if sentiment == 'positive':
-            return 1.1 + (score * 0.2)
-        elif sentiment == 'negative':
-            return 0.9 - (score * 0.1)
-        else:
-            return 1.0
-    except Exception as e:
-        logger.error(f"Error calculating rate: {str(e)}")
-        return 1.0
+@app.route('/api/analyze/stream', methods=['POST', 'OPTIONS'])
+def analyze_stream():
+    """
+    Streaming variant of /api/analyze: one record per paragraph as soon as it
+    is scored, then a final record with the overall score. Records are
+    newline-delimited JSON, or Server-Sent Events when the client accepts
+    text/event-stream.
+    """
+    log_sampled(logger, logging.INFO, "Received %s request to /api/analyze/stream", request.method)
+    
+    # Handle preflight requests
+    if request.method == 'OPTIONS':
+        response = app.make_default_options_response()
+        response.headers.add('Access-Control-Allow-Methods', 'POST')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Accept, If-None-Match')
+        return response
 
-def calculate_pitch(sentiment_result):
-    try:
-        sentiment = sentiment_result['sentiment']
-        score = sentiment_result['score']
-        
-        if sentiment == 'positive':
-            return 1.1 + (score * 0.2)
-        elif sentiment == 'negative':
-            return 0.9 - (score * 0.1)
+    endpoint = 'analyze_stream'
+    started = time.perf_counter()
+    with STAGE_SECONDS.time(endpoint=endpoint, stage='parse'):
+        data = request.get_json(silent=True)
+    REQUEST_BYTES.inc(request.content_length or 0, endpoint=endpoint)
+    if not data:
+        logger.error("No JSON data received")
+        REQUESTS.inc(endpoint=endpoint, status=400)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        return jsonify({"error": "No JSON data received"}), 400
+    text = data.get('text', '')
+    compact = data.get('format') == 'compact'
+    use_sse = request.accept_mimetypes.best_match(
+        ['application/x-ndjson', 'text/event-stream']
+    ) == 'text/event-stream'
+    
+    etag = analysis_etag(
+        endpoint, text,
+        ('compact' if compact else 'full') + ('+sse' if use_sse else '+ndjson')
+    )
+    if etag_matches(request.if_none_match, etag):
+        REQUESTS.inc(endpoint=endpoint, status=304)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        return not_modified(etag)
+    
+    with STAGE_SECONDS.time(endpoint=endpoint, stage='split'):
+        if compact:
+            spans = split_paragraph_spans(text)
+            paragraphs = [paragraph for paragraph, _, _ in spans]
+            offsets = [(start, end) for _, start, end in spans]
         else:
-            return 1.0
-    except Exception as e:
-        logger.error(f"Error calculating pitch: {str(e)}")
-        return 1.0
+            paragraphs = split_paragraphs(text)
+            offsets = [None] * len(paragraphs)
+    PARAGRAPHS.inc(len(paragraphs), endpoint=endpoint)
+    
+    def encode(record):
+        payload = dumps(record).decode('utf-8')
+        if use_sse:
+            return f"event: {record['type']}\ndata: {payload}\n\n"
+        return payload + '\n'
+    
+    def generate():
+        # The status is only known once the stream has been produced; a client
+        # that goes away mid-stream is counted as 499, as nginx logs it
+        status = 500
+        scoring = 0.0
+        try:
+            components = []
+            scored = iter_paragraph_scores(paragraphs, cache=paragraph_cache)
+            for index, paragraph in enumerate(paragraphs):
+                # Time only the scoring, not the wait for the client to read
+                scoring_started = time.perf_counter()
+                sentiment_result, paragraph_components = next(scored)
+                scoring += time.perf_counter() - scoring_started
+                components.append(paragraph_components)
+                record = build_paragraph_result(paragraph, sentiment_result, offsets[index])
+                record.update(type='paragraph', index=index)
+                yield encode(record)
+            STAGE_SECONDS.observe(scoring, endpoint=endpoint, stage='score')
+            with STAGE_SECONDS.time(endpoint=endpoint, stage='overall'):
+                overall = score_overall(text, components)
+            yield encode({
+                'type': 'overall',
+                'overall': overall,
+                'count': len(paragraphs)
+            })
+            status = 200
+        except GeneratorExit:
+            status = 499
+            raise
+        except Exception as e:
+            logger.error(f"Error in analyze_stream endpoint: {str(e)}")
+            yield encode({'type': 'error', 'error': str(e)})
+        finally:
+            REQUESTS.inc(endpoint=endpoint, status=status)
+            REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+    
+    response = Response(
+        generate(),
+        mimetype='text/event-stream' if use_sse else 'application/x-ndjson'
+    )
+    response.set_etag(etag, weak=True)
+    # Ask proxies not to buffer the stream
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/analyze/batch', methods=['POST', 'OPTIONS'])
+def analyze_batch():
+    log_sampled(logger, logging.INFO, "Received %s request to /api/analyze/batch", request.method)
+    
+    # Handle preflight requests
+    if request.method == 'OPTIONS':
+        response = app.make_default_options_response()
+        response.headers.add('Access-Control-Allow-Methods', 'POST')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        return response
 
-def calculate_volume(sentiment_result):
+    endpoint = 'analyze_batch'
+    started = time.perf_counter()
+    status = 500
     try:
-        sentiment = sentiment_result['sentiment']
-        score = sentiment_result['score']
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='parse'):
+            data = request.get_json()
+        REQUEST_BYTES.inc(request.content_length or 0, endpoint=endpoint)
+        if not data:
+            logger.error("No JSON data received")
+            status = 400
+            return jsonify({"error": "No JSON data received"}), 400
         
-        if sentiment == 'positive' and score > 0.7:
-            return 1.2
-        elif sentiment == 'negative' and score > 0.7:
-            return 0.9
-        else:
-            return 1.0
+        documents = data.get('documents')
+        if not isinstance(documents, list):
+            status = 400
+            return jsonify({"error": "'documents' must be a list"}), 400
+        if len(documents) > MAX_BATCH_DOCUMENTS:
+            status = 413
+            return jsonify({"error": f"At most {MAX_BATCH_DOCUMENTS} documents per batch"}), 413
+        for document in documents:
+            if not isinstance(document, dict) or not isinstance(document.get('text', ''), str):
+                status = 400
+                return jsonify({"error": "Each document must be an object with a 'text' string"}), 400
+        
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='split'):
+            split_documents = [split_paragraphs(document.get('text', '')) for document in documents]
+        
+        # Score the paragraphs of every document in the batch in one call
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='score'):
+            scored = score_paragraphs(
+                [paragraph for paragraphs in split_documents for paragraph in paragraphs]
+            )
+        
+        document_scores = []
+        position = 0
+        for paragraphs in split_documents:
+            document_scores.append(scored[position:position + len(paragraphs)])
+            position += len(paragraphs)
+        PARAGRAPHS.inc(position, endpoint=endpoint)
+        
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='speech_params'):
+            document_paragraphs = [
+                [
+                    build_paragraph_result(paragraph, sentiment_result)
+                    for paragraph, (sentiment_result, _) in zip(paragraphs, paragraph_scores)
+                ]
+                for paragraphs, paragraph_scores in zip(split_documents, document_scores)
+            ]
+        
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='overall'):
+            overalls = [
+                score_overall(
+                    document.get('text', ''),
+                    [components for _, components in paragraph_scores]
+                )
+                for document, paragraph_scores in zip(documents, document_scores)
+            ]
+        
+        with STAGE_SECONDS.time(endpoint=endpoint, stage='serialize'):
+            response = jsonify({'results': [
+                {'id': document.get('id'), 'overall': overall, 'paragraphs': paragraphs}
+                for document, overall, paragraphs in zip(documents, overalls, document_paragraphs)
+            ]})
+        RESPONSE_BYTES.inc(response.content_length or 0, endpoint=endpoint)
+        log_sampled(logger, logging.INFO, "Batch analysis complete. Documents: %d", len(documents))
+        status = 200
+        return response
     except Exception as e:
-        logger.error(f"Error calculating volume: {str(e)}")
-        return 1.0
+        logger.error(f"Error in analyze_batch endpoint: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        REQUESTS.inc(endpoint=endpoint, status=status)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+@app.after_request
+def compress(response):
+    # Negotiate brotli/gzip for buffered JSON responses (see responses.py)
+    return compress_response(response, request.accept_encodings)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text exposition format
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/backend/stats', methods=['GET'])
+def backend_stats():
+    return jsonify({
+        'backend': SENTIMENT_BACKEND,
+        'batching': paragraph_batcher.stats() if paragraph_batcher is not None else None
+    })
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(paragraph_cache.stats())
+
+def score_paragraphs(paragraphs, cache=None):
+    """
+    Score paragraphs and return their (result, components) tuples.
+    Uses the PARAGRAPH_SCORER from the app config when one is set (see asgi.py).
+    """
+    scorer = app.config.get('PARAGRAPH_SCORER')
+    if scorer is None:
+        return analyze_sentiment_batch(paragraphs, with_components=True, cache=cache)
+    return list(scorer(paragraphs, cache))
+
+def iter_paragraph_scores(paragraphs, cache=None):
+    """Like score_paragraphs, but yields each paragraph's scores as soon as they are available"""
+    scorer = app.config.get('PARAGRAPH_SCORER')
+    if scorer is None:
+        return (score_paragraph(paragraph, cache) for paragraph in paragraphs)
+    return scorer(paragraphs, cache)
+
+def score_overall(text, components):
+    """
+    Document-level sentiment from the paragraph components, or from the full
+    text in exact mode. Model backends aggregate their paragraph results
+    (see SentimentBackend.aggregate) instead of truncating the document.
+    """
+    if paragraph_batcher is not None:
+        return get_backend(SENTIMENT_BACKEND).aggregate(components)
+    if OVERALL_MODE == 'exact':
+        # TEXT_SCORER moves the full-text pass off this process (see asgi.py)
+        return (app.config.get('TEXT_SCORER') or analyze_sentiment)(text)
+    return compose_sentiment(components)
+
+start_warm_up()
 
 # This is the application variable that PythonAnywhere will use
 application = app
@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from urllib.parse import parse_qs
+from a2wsgi import WSGIMiddleware
+
+# Add the project directory to Python path
+path = os.path.dirname(os.path.abspath(__file__))
+if path not in sys.path:
+    sys.path.append(path)
+
+from app import app, score_paragraphs, score_overall, paragraph_batcher, OVERALL_MODE
+from analysis import build_paragraph_result
+from sentiment import analyze_sentiment, analyze_sentiment_batch, paragraph_cache, warm_up
+from sessions import AnalysisSession, SessionError, SessionStore
+
+logger = logging.getLogger(__name__)
+
+# Scoring processes (defaults to one per CPU) and paragraphs per work unit
+POOL_WORKERS = int(os.environ.get('SENTISPEECH_POOL_WORKERS', 0)) or os.cpu_count()
+POOL_CHUNK_SIZE = int(os.environ.get('SENTISPEECH_POOL_CHUNK_SIZE', 16))
+# Chunks one request may have queued on the pool (defaults to the pool size)
+POOL_MAX_IN_FLIGHT = int(os.environ.get('SENTISPEECH_POOL_MAX_IN_FLIGHT', 0))
+# Threads running Flask views; they only wait on the pool while scoring
+WSGI_THREADS = int(os.environ.get('SENTISPEECH_WSGI_THREADS', 32))
+
+class ProcessPoolScorer:
+    """
+    Paragraph scorer that fans the paragraphs of a request out across a
+    process pool in chunks, so VADER scoring runs on every core instead of
+    contending for the GIL of the serving process. Installed as the app's
+    PARAGRAPH_SCORER (see app.score_paragraphs).
+    
+    The pool queue is first in, first out, so a request only has
+    max_in_flight chunks queued at a time and submits the next one as it
+    collects a result. A small request then waits behind a few chunks of
+    a large document rather than behind all of them.
+    """
+
+    def __init__(self, workers=POOL_WORKERS, chunk_size=POOL_CHUNK_SIZE, max_in_flight=POOL_MAX_IN_FLIGHT):
+        self.chunk_size = chunk_size
+        self.max_in_flight = max(1, max_in_flight or workers)
+        # Spawn rather than fork: the serving process already runs threads
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=warm_up
+        )
+
+    def __call__(self, paragraphs, cache=None):
+        entries = {}
+        if cache is not None:
+            for paragraph in paragraphs:
+                if paragraph not in entries:
+                    entries[paragraph] = cache.get(paragraph)
+
+        missing = list(dict.fromkeys(p for p in paragraphs if entries.get(p) is None))
+        chunks = [missing[start:start + self.chunk_size] for start in range(0, len(missing), self.chunk_size)]
+        return self._collect(paragraphs, entries, chunks, cache)
+
+    def _collect(self, paragraphs, entries, chunks, cache):
+        # Chunks hold the missing paragraphs in order of first appearance,
+        # so they are needed, and submitted, in order
+        chunk_index = {paragraph: i for i, chunk in enumerate(chunks) for paragraph in chunk}
+        score_chunk = partial(analyze_sentiment_batch, with_components=True)
+        futures = []
+        try:
+            for paragraph in paragraphs:
+                if entries.get(paragraph) is None:
+                    index = chunk_index[paragraph]
+                    while len(futures) < min(index + self.max_in_flight, len(chunks)):
+                        futures.append(self.pool.submit(score_chunk, chunks[len(futures)]))
+                    for chunk_paragraph, entry in zip(chunks[index], futures[index].result()):
+                        entries[chunk_paragraph] = entry
+                        if cache is not None:
+                            cache.put(chunk_paragraph, entry)
+                    futures[index] = None
+                yield entries[paragraph]
+        finally:
+            # A client that went away leaves nothing queued behind it
+            for future in futures:
+                if future is not None:
+                    future.cancel()
+
+    def score_text(self, text):
+        """Whole-text scoring for the exact overall mode, off the serving process's GIL"""
+        return self.pool.submit(analyze_sentiment, text).result()
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+def paragraph_record(index, paragraph):
+    """Session update entry; the client already has the paragraph text"""
+    record = build_paragraph_result(paragraph.text, paragraph.result)
+    del record['text']
+    record['index'] = index
+    return record
+
+class SentimentASGI:
+    """
+    ASGI entry point: serves the Flask app from a thread pool and scores
+    paragraphs on a ProcessPoolScorer. The event loop itself never scores,
+    so small requests are not queued behind a large document.
+    
+    Also serves live-editing sessions over a WebSocket at /ws/analyze. The
+    client sends paragraph edits as JSON text frames:
+    
+        {"id": 1, "edits": [{"op": "insert", "index": 0, "text": "..."},
+                            {"op": "replace", "index": 2, "text": "..."},
+                            {"op": "delete", "index": 5}]}
+    
+    and receives {"type": "update", "id", "count", "paragraphs", "overall"}
+    with the results of the inserted and replaced paragraphs only, or
+    {"type": "error", "id", "error"} when the edits were rejected as a whole.
+    Connecting with ?session=<id> resumes a session that has not been evicted.
+    """
+
+    def __init__(self, wsgi_app, threads=WSGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.http = WSGIMiddleware(wsgi_app, workers=threads)
+        self.scorer = None
+        self.sessions = SessionStore(partial(
+            AnalysisSession,
+            score=partial(score_paragraphs, cache=paragraph_cache),
+            overall=score_overall,
+            composable=paragraph_batcher is None and OVERALL_MODE == 'composed'
+        ))
+
+    def start(self):
+        # Backends with their own scheduler (see app.SENTIMENT_BACKEND) keep it
+        if self.scorer is None and self.wsgi_app.config.get('PARAGRAPH_SCORER') is None:
+            self.scorer = ProcessPoolScorer()
+            self.wsgi_app.config['PARAGRAPH_SCORER'] = self.scorer
+            self.wsgi_app.config['TEXT_SCORER'] = self.scorer.score_text
+            logger.info(f"Scoring on a pool of {POOL_WORKERS} processes")
+
+    def stop(self):
+        if self.scorer is not None:
+            self.wsgi_app.config['PARAGRAPH_SCORER'] = None
+            self.wsgi_app.config['TEXT_SCORER'] = None
+            self.scorer.shutdown()
+            self.scorer = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    try:
+                        self.start()
+                    except Exception as e:
+                        logger.error(f"Error starting scoring pool: {str(e)}")
+                        await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                        return
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    self.stop()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        elif scope['type'] == 'websocket':
+            self.start()
+            await self.websocket(scope, receive, send)
+        else:
+            # Servers without lifespan support start the pool on first use
+            self.start()
+            await self.http(scope, receive, send)
+
+    async def websocket(self, scope, receive, send):
+        message = await receive()
+        if message['type'] != 'websocket.connect':
+            return
+        if scope['path'] != '/ws/analyze':
+            await send({'type': 'websocket.close', 'code': 1008})
+            return
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        try:
+            session = self.sessions.open(query.get('session', [None])[0])
+        except SessionError as e:
+            logger.error(f"Error opening analysis session: {str(e)}")
+            await send({'type': 'websocket.close', 'code': 1013, 'reason': str(e)})
+            return
+
+        async def send_json(record):
+            await send({'type': 'websocket.send', 'text': json.dumps(record, separators=(',', ':'))})
+
+        loop = asyncio.get_running_loop()
+        await send({'type': 'websocket.accept'})
+        await send_json({
+            'type': 'session',
+            'session': session.id,
+            'count': len(session),
+            'overall': await loop.run_in_executor(None, session.overall)
+        })
+        while True:
+            try:
+                message = await asyncio.wait_for(receive(), timeout=self.sessions.idle_seconds)
+            except asyncio.TimeoutError:
+                self.sessions.discard(session.id)
+                await send({'type': 'websocket.close', 'code': 1000, 'reason': 'idle'})
+                return
+            if message['type'] == 'websocket.disconnect':
+                # Kept until evicted so that the client can resume it
+                self.sessions.evict_idle()
+                return
+
+            request_id = None
+            try:
+                request = json.loads(message.get('text') or message.get('bytes') or b'')
+                if not isinstance(request, dict):
+                    raise SessionError("Message must be a JSON object")
+                request_id = request.get('id')
+                edits = request.get('edits', [request] if 'op' in request else [])
+                # Scoring blocks, so it runs off the event loop
+                touched = await loop.run_in_executor(None, session.apply, edits)
+                overall = await loop.run_in_executor(None, session.overall)
+            except (SessionError, ValueError) as e:
+                await send_json({'type': 'error', 'id': request_id, 'error': str(e)})
+                continue
+            except Exception as e:
+                logger.error(f"Error in analysis session {session.id}: {str(e)}")
+                await send_json({'type': 'error', 'id': request_id, 'error': str(e)})
+                continue
+            await send_json({
+                'type': 'update',
+                'id': request_id,
+                'count': len(session),
+                'paragraphs': [paragraph_record(index, p) for index, p in touched],
+                'overall': overall
+            })
+
+# Run with: uvicorn asgi:application
+application = SentimentASGI(app)
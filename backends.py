@@ -0,0 +1,157 @@
+# Pluggable sentiment backends.
+#
+# Every backend scores a list of texts in one call and returns results in the
+# analyze_sentiment shape ({'sentiment', 'score', 'details'}), so the web app
+# and the micro-batching scheduler (batching.py) can use any of them.
+import logging
+import os
+import threading
+from sentiment import analyze_sentiment_batch
+
+logger = logging.getLogger(__name__)
+
+_BACKENDS = {}
+_instances = {}
+_instances_lock = threading.Lock()
+
+def register_backend(name):
+    """Class decorator registering a backend under the given name"""
+    def decorator(cls):
+        cls.name = name
+        _BACKENDS[name] = cls
+        return cls
+    return decorator
+
+def available_backends():
+    return sorted(_BACKENDS)
+
+def get_backend(name, **kwargs):
+    """
+    Return the shared instance of a registered backend, creating it on first
+    use. Passing keyword arguments always creates a new instance.
+    """
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown sentiment backend: {name} (available: {', '.join(available_backends())})")
+    if kwargs:
+        return _BACKENDS[name](**kwargs)
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = _BACKENDS[name]()
+        return _instances[name]
+
+class SentimentBackend:
+    """Interface shared by all backends"""
+    name = None
+    # Positive and negative probabilities closer than this are labelled neutral
+    neutral_margin = 0.3
+
+    @property
+    def version(self):
+        """Identifies the model/lexicon, so cached responses change when it does"""
+        return 'unversioned'
+
+    def score_batch(self, texts):
+        """Score texts and return one analyze_sentiment-shaped result per text"""
+        raise NotImplementedError
+
+    def _result(self, positive, negative):
+        """analyze_sentiment-shaped result for a pair of class probabilities"""
+        if positive > negative:
+            sentiment, score = 'positive', positive
+        else:
+            sentiment, score = 'negative', negative
+        # If scores are close, consider it neutral
+        if abs(positive - negative) < self.neutral_margin:
+            sentiment, score = 'neutral', 0.5
+        return {
+            'sentiment': sentiment,
+            'score': float(score),
+            'details': {
+                'positive': float(positive),
+                'negative': float(negative)
+            }
+        }
+
+    def aggregate(self, results):
+        """
+        Document-level result from the results of its paragraphs: the mean of
+        their positive and negative probabilities. Models only see their first
+        max_length tokens, so scoring a long document as one text would only
+        reflect its opening paragraphs. Blank paragraphs carry no
+        probabilities and are skipped.
+        """
+        details = [result['details'] for result in results if 'positive' in result.get('details', {})]
+        if not details:
+            return {'sentiment': 'neutral', 'score': 0.5}
+        return self._result(
+            sum(d['positive'] for d in details) / len(details),
+            sum(d['negative'] for d in details) / len(details)
+        )
+
+@register_backend('vader')
+class VaderBackend(SentimentBackend):
+    """The default NLTK VADER analyzer from sentiment.py"""
+
+    @property
+    def version(self):
+        import nltk
+        return f"nltk-{nltk.__version__}"
+
+    def score_batch(self, texts):
+        return analyze_sentiment_batch(texts)
+
+@register_backend('transformer')
+class TransformerBackend(SentimentBackend):
+    """
+    Sequence-classification transformer on CPU, scoring each batch in a
+    single padded forward pass. The model is loaded on first use.
+    """
+
+    def __init__(self, model_name=None, max_length=512, neutral_margin=0.3):
+        self.model_name = model_name or os.environ.get(
+            'SENTISPEECH_TRANSFORMER_MODEL', 'distilbert-base-uncased-finetuned-sst-2-english'
+        )
+        self.max_length = max_length
+        self.neutral_margin = neutral_margin
+        self._model = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from transformers import AutoTokenizer, AutoModelForSequenceClassification
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self._model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+                self._model.eval()
+                logger.info(f"Loaded transformer sentiment model {self.model_name}")
+        return self._tokenizer, self._model
+
+    @property
+    def version(self):
+        return self.model_name
+
+    def score_batch(self, texts):
+        import torch
+
+        results = [{'sentiment': 'neutral', 'score': 0.5} for _ in texts]
+        batch = [(i, text) for i, text in enumerate(texts) if text.strip()]
+        if not batch:
+            return results
+
+        tokenizer, model = self._load()
+        inputs = tokenizer(
+            [text for _, text in batch],
+            return_tensors="pt",
+            truncation=True,
+            padding=True,
+            max_length=self.max_length
+        )
+        with torch.inference_mode():
+            logits = model(**inputs).logits
+        probabilities = torch.nn.functional.softmax(logits, dim=-1).tolist()
+
+        for (i, _), (neg_score, pos_score) in zip(batch, probabilities):
+            # DistilBERT SST-2 gives negative=0, positive=1
+            results[i] = self._result(pos_score, neg_score)
+        return results
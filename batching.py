@@ -0,0 +1,145 @@
+# Dynamic micro-batching for sentiment backends.
+#
+# Paragraphs submitted by concurrent requests are queued and scored together
+# by a single worker thread, in batches of up to max_batch_size texts or
+# whatever arrived within max_wait seconds of the oldest queued text.
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class MicroBatcher:
+    """
+    Collects texts across callers and scores them with score_batch(texts),
+    which must return one result per text in order.
+    """
+
+    def __init__(self, score_batch, max_batch_size=32, max_wait=0.005, stats_window=1024):
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = deque(maxlen=stats_window)
+        self._queue_waits = deque(maxlen=stats_window)
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                    self._worker.start()
+
+    def submit(self, text):
+        """Queue one text and return a Future for its result"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def score(self, texts):
+        """Queue texts and wait for all of their results"""
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Stop the worker after the texts already queued are scored"""
+        if self._worker is not None:
+            self._queue.put(_STOP)
+            self._worker.join()
+            self._worker = None
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            started = time.perf_counter()
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(batch)
+                self._batch_sizes.append(len(batch))
+                self._queue_waits.extend(started - enqueued for _, _, enqueued in batch)
+
+            try:
+                results = self.score_batch([text for text, _, _ in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f"Backend returned {len(results)} results for {len(batch)} texts")
+            except Exception as e:
+                logger.error(f"Error scoring batch of {len(batch)}: {str(e)}")
+                with self._stats_lock:
+                    self.errors += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        """Batch-size and queue-wait statistics over the recent window"""
+        with self._stats_lock:
+            sizes = sorted(self._batch_sizes)
+            waits = sorted(self._queue_waits)
+            stats = {
+                'batches': self.batches,
+                'items': self.items,
+                'errors': self.errors,
+                'queued': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait': self.max_wait,
+            }
+
+        def percentile(values, q):
+            return values[min(len(values) - 1, int(q * len(values)))] if values else 0
+
+        stats.update({
+            'mean_batch_size': sum(sizes) / len(sizes) if sizes else 0.0,
+            'p50_batch_size': percentile(sizes, 0.5),
+            'p95_batch_size': percentile(sizes, 0.95),
+            'mean_queue_wait': sum(waits) / len(waits) if waits else 0.0,
+            'p50_queue_wait': percentile(waits, 0.5),
+            'p95_queue_wait': percentile(waits, 0.95),
+        })
+        return stats
+
+class BatchingScorer:
+    """
+    PARAGRAPH_SCORER (see app.score_paragraphs) backed by a MicroBatcher.
+    Backends other than VADER have no VADER components: entries are
+    (result, result), the result itself standing in for the components
+    that app.score_overall aggregates. The paragraph cache is not used.
+    """
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+
+    def __call__(self, paragraphs, cache=None):
+        futures = [self.batcher.submit(paragraph) for paragraph in paragraphs]
+        return ((result, result) for result in (future.result() for future in futures))
@@ -0,0 +1,364 @@
+"""
+Append-only benchmark history.
+
+Every run recorded from a BenchmarkFramework is kept in a SQLite database,
+keyed by run id, commit, machine fingerprint and timestamp, so that results
+can be queried across runs and compared between commits.
+
+    python benchmark_history.py record evaluation/load_benchmark.json
+    python benchmark_history.py query --model 'analyze[inprocess]' --metric latency_p95
+    python benchmark_history.py compare <baseline-run-id> <candidate-run-id>
+    python benchmark_history.py compare --by commit 1a2b3c4 5d6e7f8
+
+compare exits with status 1 when a metric regressed significantly.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+
+DEFAULT_DB = os.environ.get('SENTISPEECH_BENCHMARK_DB', 'evaluation/benchmark_history.db')
+
+# Metrics whose name contains one of these are better when lower; all
+# others (accuracy, f1, requests_per_sec, ...) are better when higher
+LOWER_IS_BETTER = ('latency', 'time', 'duration', 'seconds', 'rss', 'bytes', 'errors')
+
+# Run configuration recorded next to the metrics (load_benchmark,
+# evaluate_backends, preprocessing_benchmark); compare skips them, as a
+# changed configuration is neither an improvement nor a regression
+CONFIGURATION_KEYS = frozenset({'concurrency', 'requests', 'workers', 'batch_size', 'examples', 'items'})
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    commit_sha TEXT,
+    machine TEXT NOT NULL,
+    machine_info TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    model TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_series ON results (model, dataset, metric);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id);
+CREATE INDEX IF NOT EXISTS runs_commit ON runs (commit_sha);
+"""
+
+def machine_info():
+    return {
+        'system': platform.system(),
+        'release': platform.release(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+    }
+
+def machine_fingerprint(info=None):
+    """Short stable hash of the hardware and runtime a run was measured on"""
+    info = info or machine_info()
+    return hashlib.sha256(json.dumps(info, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+def current_commit():
+    """The checked-out git commit, or None outside a git work tree"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def lower_is_better(metric):
+    return any(part in metric for part in LOWER_IS_BETTER)
+
+def _betacf(a, b, x):
+    # Continued fraction for the incomplete beta function (modified Lentz)
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c = 1.0
+    d = 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 301):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < 3e-14:
+            break
+    return h
+
+def regularized_incomplete_beta(a, b, x):
+    """I_x(a, b)"""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = math.exp(
+        math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+        + a * math.log(x) + b * math.log1p(-x)
+    )
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+def welch_t_test(sample_a, sample_b):
+    """
+    Two-sided Welch's t-test. Returns (t, degrees_of_freedom, p_value);
+    both samples need at least two values.
+    """
+    n_a, n_b = len(sample_a), len(sample_b)
+    mean_a, mean_b = sum(sample_a) / n_a, sum(sample_b) / n_b
+    var_a = sum((v - mean_a) ** 2 for v in sample_a) / (n_a - 1)
+    var_b = sum((v - mean_b) ** 2 for v in sample_b) / (n_b - 1)
+    se2_a, se2_b = var_a / n_a, var_b / n_b
+    if se2_a + se2_b == 0:
+        # Both samples constant: any difference is certain
+        return (math.inf if mean_a != mean_b else 0.0), n_a + n_b - 2, (0.0 if mean_a != mean_b else 1.0)
+    t = (mean_b - mean_a) / math.sqrt(se2_a + se2_b)
+    df = (se2_a + se2_b) ** 2 / (se2_a ** 2 / (n_a - 1) + se2_b ** 2 / (n_b - 1))
+    p = regularized_incomplete_beta(df / 2.0, 0.5, df / (df + t * t))
+    return t, df, p
+
+class BenchmarkHistory:
+    """SQLite store of benchmark runs; rows are only ever inserted"""
+
+    def __init__(self, path=DEFAULT_DB):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def record(self, results, run_id=None, commit=None, created_at=None):
+        """
+        Append the results of a BenchmarkFramework ({model: {dataset: metrics}})
+        as a new run and return its run id. Only numeric metrics are stored.
+        """
+        run_id = run_id or uuid.uuid4().hex
+        info = machine_info()
+        created_at = time.time() if created_at is None else created_at
+        rows = []
+        for model, datasets in results.items():
+            for dataset, metrics in datasets.items():
+                recorded_at = metrics.get('timestamp', created_at)
+                for metric, value in metrics.items():
+                    if metric == 'timestamp' or isinstance(value, bool) or not isinstance(value, (int, float)):
+                        continue
+                    rows.append((run_id, model, dataset, metric, float(value), recorded_at))
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO runs (run_id, commit_sha, machine, machine_info, created_at) VALUES (?, ?, ?, ?, ?)",
+                (run_id, commit if commit is not None else current_commit(),
+                 machine_fingerprint(info), json.dumps(info, sort_keys=True), created_at)
+            )
+            self.connection.executemany(
+                "INSERT INTO results (run_id, model, dataset, metric, value, recorded_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return run_id
+
+    @staticmethod
+    def _filters(model=None, dataset=None, metric=None, run_id=None, commit=None, machine=None, since=None, until=None):
+        clauses, params = [], []
+        for column, value in (
+            ('r.model', model), ('r.dataset', dataset), ('r.metric', metric),
+            ('r.run_id', run_id), ('u.machine', machine)
+        ):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if commit is not None:
+            # Accept abbreviated commit hashes
+            clauses.append("u.commit_sha LIKE ?")
+            params.append(commit + '%')
+        if since is not None:
+            clauses.append("u.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("u.created_at < ?")
+            params.append(until)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def query(self, **filters):
+        """
+        Yield matching results, oldest run first, as dicts with run_id,
+        commit, machine, created_at, model, dataset, metric and value.
+        Rows are read from the cursor as they are consumed.
+        """
+        where, params = self._filters(**filters)
+        cursor = self.connection.execute(
+            "SELECT r.run_id, u.commit_sha, u.machine, u.created_at, r.model, r.dataset, r.metric, r.value "
+            "FROM results r JOIN runs u ON u.run_id = r.run_id" + where +
+            " ORDER BY u.created_at, r.rowid",
+            params
+        )
+        columns = ('run_id', 'commit', 'machine', 'created_at', 'model', 'dataset', 'metric', 'value')
+        for row in cursor:
+            yield dict(zip(columns, row))
+
+    def runs(self, commit=None, machine=None):
+        """Run ids, oldest first"""
+        where, params = self._filters(commit=commit, machine=machine)
+        cursor = self.connection.execute(f"SELECT u.run_id FROM runs u{where} ORDER BY u.created_at", params)
+        return [row[0] for row in cursor]
+
+    def average_performance(self, metric='f1', **filters):
+        """Average of metric per model over the matching results, computed in SQLite"""
+        where, params = self._filters(metric=metric, **filters)
+        cursor = self.connection.execute(
+            "SELECT r.model, AVG(r.value) FROM results r JOIN runs u ON u.run_id = r.run_id"
+            + where + " GROUP BY r.model ORDER BY r.model",
+            params
+        )
+        return dict(cursor.fetchall())
+
+    def samples(self, run_ids):
+        """{(model, dataset, metric): [values]} for the given runs"""
+        placeholders = ','.join('?' * len(run_ids))
+        cursor = self.connection.execute(
+            f"SELECT model, dataset, metric, value FROM results WHERE run_id IN ({placeholders})",
+            list(run_ids)
+        )
+        samples = {}
+        for model, dataset, metric, value in cursor:
+            samples.setdefault((model, dataset, metric), []).append(value)
+        return samples
+
+    def compare(self, baseline_runs, candidate_runs, alpha=0.05, min_change=0.02, single_sample_threshold=0.1,
+                configuration_keys=CONFIGURATION_KEYS):
+        """
+        Compare every metric present in both sets of runs, apart from the
+        run configuration in configuration_keys. With at least two
+        values on each side a metric regressed when Welch's t-test gives
+        p < alpha and it got worse by more than min_change (relative);
+        otherwise when it got worse by more than single_sample_threshold.
+        Returns a list of comparison dicts, regressions first.
+        """
+        baseline = self.samples(baseline_runs)
+        candidate = self.samples(candidate_runs)
+        comparisons = []
+        for key in sorted(baseline.keys() & candidate.keys()):
+            if key[2] in configuration_keys:
+                continue
+            before, after = baseline[key], candidate[key]
+            mean_before, mean_after = sum(before) / len(before), sum(after) / len(after)
+            change = (mean_after - mean_before) / abs(mean_before) if mean_before else (
+                0.0 if mean_after == mean_before else math.copysign(math.inf, mean_after - mean_before)
+            )
+            worse = -change if not lower_is_better(key[2]) else change
+            if len(before) >= 2 and len(after) >= 2:
+                _, _, p_value = welch_t_test(before, after)
+                regressed = p_value < alpha and worse > min_change
+            else:
+                p_value = None
+                regressed = worse > single_sample_threshold
+            comparisons.append({
+                'model': key[0],
+                'dataset': key[1],
+                'metric': key[2],
+                'baseline_mean': mean_before,
+                'candidate_mean': mean_after,
+                'baseline_n': len(before),
+                'candidate_n': len(after),
+                'change': change,
+                'p_value': p_value,
+                'regressed': regressed,
+            })
+        comparisons.sort(key=lambda c: not c['regressed'])
+        return comparisons
+
+def _resolve_runs(history, selector, by):
+    if by == 'commit':
+        runs = history.runs(commit=selector)
+    else:
+        runs = [run_id for run_id in selector.split(',') if run_id]
+    if not runs:
+        raise SystemExit(f"No runs found for {by} {selector}")
+    return runs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Append-only benchmark history and regression checks")
+    parser.add_argument('--db', default=DEFAULT_DB, help="SQLite history file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record = commands.add_parser('record', help="Append a saved BenchmarkFramework results file as a new run")
+    record.add_argument('results', help="JSON written by BenchmarkFramework.save_results")
+    record.add_argument('--run-id')
+    record.add_argument('--commit', help="Defaults to the checked-out git commit")
+
+    query = commands.add_parser('query', help="Print matching results as JSON lines")
+    for name in ('model', 'dataset', 'metric', 'run-id', 'commit', 'machine'):
+        query.add_argument(f"--{name}")
+
+    compare = commands.add_parser('compare', help="Flag significant regressions of a candidate against a baseline")
+    compare.add_argument('baseline', help="Run id(s), comma-separated, or a commit with --by commit")
+    compare.add_argument('candidate', help="Run id(s), comma-separated, or a commit with --by commit")
+    compare.add_argument('--by', choices=['run', 'commit'], default='run')
+    compare.add_argument('--alpha', type=float, default=0.05, help="Significance level of the t-test")
+    compare.add_argument('--min-change', type=float, default=0.02, help="Smallest relative change reported as a regression")
+    compare.add_argument('--single-sample-threshold', type=float, default=0.1,
+                         help="Relative change that counts as a regression when a side has a single value")
+    args = parser.parse_args(argv)
+
+    history = BenchmarkHistory(args.db)
+    try:
+        if args.command == 'record':
+            with open(args.results) as f:
+                results = json.load(f)
+            print(history.record(results, run_id=args.run_id, commit=args.commit))
+            return 0
+
+        if args.command == 'query':
+            for row in history.query(
+                model=args.model, dataset=args.dataset, metric=args.metric,
+                run_id=args.run_id, commit=args.commit, machine=args.machine
+            ):
+                print(json.dumps(row))
+            return 0
+
+        comparisons = history.compare(
+            _resolve_runs(history, args.baseline, args.by),
+            _resolve_runs(history, args.candidate, args.by),
+            alpha=args.alpha,
+            min_change=args.min_change,
+            single_sample_threshold=args.single_sample_threshold
+        )
+        for c in comparisons:
+            p_value = f"p={c['p_value']:.4f}" if c['p_value'] is not None else "p=n/a"
+            print(
+                f"{'REGRESSION' if c['regressed'] else 'ok':<10} {c['model']} {c['dataset']} {c['metric']}: "
+                f"{c['baseline_mean']:.6g} -> {c['candidate_mean']:.6g} ({c['change']:+.1%}, {p_value})"
+            )
+        return 1 if any(c['regressed'] for c in comparisons) else 0
+    finally:
+        history.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+Accuracy and latency evaluation of the sentiment backends.
+
+Scores a labelled CSV/JSONL dataset with each backend on a pool of worker
+processes and records accuracy, macro-F1, per-item latency percentiles and
+throughput per backend through BenchmarkFramework.add_result.
+
+    python evaluate_backends.py reviews.jsonl --backends vader,transformer --workers 4
+    python evaluate_backends.py reviews.csv --label-field stars --label-map 1=negative,3=neutral,5=positive
+"""
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from Benchmarking import BenchmarkFramework
+from score_corpus import detect_format, open_stream
+
+LABELS = ('negative', 'neutral', 'positive')
+
+def read_labelled(stream, fmt, text_field='text', label_field='label', label_map=None):
+    """Yield (text, label) pairs, with labels lower-cased and mapped through label_map"""
+    if fmt == 'csv':
+        csv.field_size_limit(sys.maxsize)
+        records = csv.DictReader(stream)
+    else:
+        records = (json.loads(line) for line in stream if line.strip())
+    for record in records:
+        label = str(record.get(label_field, '')).strip().lower()
+        label = (label_map or {}).get(label, label)
+        yield record.get(text_field) or '', label
+
+def classification_metrics(gold, predicted):
+    """Accuracy, macro-F1 and per-label F1 over the labels seen in either list"""
+    labels = sorted(set(gold) | set(predicted))
+    metrics = {'accuracy': sum(g == p for g, p in zip(gold, predicted)) / len(gold) if gold else 0.0}
+    f1_scores = []
+    for label in labels:
+        tp = sum(g == label and p == label for g, p in zip(gold, predicted))
+        fp = sum(g != label and p == label for g, p in zip(gold, predicted))
+        fn = sum(g == label and p != label for g, p in zip(gold, predicted))
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        metrics[f'f1_{label}'] = f1
+        f1_scores.append(f1)
+    metrics['f1'] = sum(f1_scores) / len(f1_scores) if f1_scores else 0.0
+    return metrics
+
+_backend = None
+_ready = None
+
+# Seconds a worker waits at the warm-up barrier for the others to load the backend
+WARM_UP_TIMEOUT = 600
+
+def _init_worker(backend_name, ready=None):
+    # Load and warm the backend once per process, outside the measurements
+    global _backend, _ready
+    from backends import get_backend
+    _backend = get_backend(backend_name)
+    _backend.score_batch(["Warm-up text."])
+    _ready = ready
+
+def _wait_ready(timeout):
+    # Hold this worker until every other worker holds a warm-up task too
+    _ready.wait(timeout)
+    return os.getpid()
+
+def start_workers(pool, workers, timeout=WARM_UP_TIMEOUT):
+    """
+    Bring up every worker of a pool created with _init_worker before the
+    clock starts. Each warm-up task blocks at the barrier until all workers
+    hold one, so no worker can take two and each has run _init_worker.
+    Returns the worker pids.
+    """
+    return set(pool.map(_wait_ready, [timeout] * workers))
+
+def _score_chunk(texts, batch_size):
+    """Score texts in batches; each item's latency is the time of its batch"""
+    sentiments, latencies = [], []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        started = time.perf_counter()
+        results = _backend.score_batch(batch)
+        elapsed = time.perf_counter() - started
+        sentiments.extend(result['sentiment'] for result in results)
+        latencies.extend([elapsed] * len(batch))
+    return sentiments, latencies
+
+def evaluate_backend(backend_name, texts, labels, workers=None, chunk_size=64, batch_size=1):
+    """Score the dataset with one backend and return its metrics"""
+    workers = workers or os.cpu_count()
+    context = multiprocessing.get_context('spawn')
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(backend_name, context.Barrier(workers))
+    )
+    try:
+        start_workers(pool, workers)
+        started = time.perf_counter()
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        predicted, latencies = [], []
+        for sentiments, chunk_latencies in pool.map(_score_chunk, chunks, [batch_size] * len(chunks)):
+            predicted.extend(sentiments)
+            latencies.extend(chunk_latencies)
+        wall = time.perf_counter() - started
+    finally:
+        pool.shutdown()
+
+    metrics = classification_metrics(labels, predicted)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    metrics.update({
+        'items': len(texts),
+        'workers': workers,
+        'batch_size': batch_size,
+        'duration': wall,
+        'items_per_sec': len(texts) / wall if wall else 0.0,
+        'latency_mean': float(np.mean(latencies)) if latencies else 0.0,
+        'latency_p50': float(p50),
+        'latency_p95': float(p95),
+        'latency_p99': float(p99),
+    })
+    return metrics
+
+def evaluate(dataset, backend_names, dataset_name=None, benchmark=None, **kwargs):
+    """
+    Evaluate every backend on a list of (text, label) pairs and add one
+    result per backend to the BenchmarkFramework, which is returned.
+    """
+    benchmark = benchmark or BenchmarkFramework()
+    texts = [text for text, _ in dataset]
+    labels = [label for _, label in dataset]
+    for backend_name in backend_names:
+        metrics = evaluate_backend(backend_name, texts, labels, **kwargs)
+        benchmark.add_result(model_name=backend_name, dataset_name=dataset_name or 'dataset', metrics=metrics)
+        print(
+            f"{backend_name:<12} accuracy {metrics['accuracy']:.3f}  macro-F1 {metrics['f1']:.3f}  "
+            f"p50 {metrics['latency_p50'] * 1000:.2f}ms  p95 {metrics['latency_p95'] * 1000:.2f}ms  "
+            f"{metrics['items_per_sec']:.1f} items/s",
+            file=sys.stderr
+        )
+    return benchmark
+
+def _label_map(value):
+    pairs = (item.split('=', 1) for item in value.split(',') if item)
+    return {key.strip().lower(): label.strip().lower() for key, label in pairs}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate sentiment backends for accuracy and latency")
+    parser.add_argument('dataset', help="Labelled CSV or JSONL file")
+    parser.add_argument('--input-format', choices=['jsonl', 'csv'], help="Defaults to the file extension")
+    parser.add_argument('--text-field', default='text')
+    parser.add_argument('--label-field', default='label')
+    parser.add_argument('--label-map', type=_label_map, default=None,
+                        help="Map dataset labels to negative/neutral/positive, e.g. 0=negative,1=positive")
+    parser.add_argument('--backends', default='vader', help="Comma-separated backend names (see backends.py)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (defaults to one per CPU)")
+    parser.add_argument('--chunk-size', type=int, default=64, help="Items per work unit")
+    parser.add_argument('--batch-size', type=int, default=1, help="Items per score_batch call")
+    parser.add_argument('--limit', type=int, default=None, help="Evaluate only the first N items")
+    parser.add_argument('--output', default='evaluation/backend_evaluation.json')
+    parser.add_argument('--history', help="Also append the run to this benchmark history database")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    with open_stream(args.dataset, 'r') as source:
+        dataset = list(read_labelled(
+            source, detect_format(args.dataset, args.input_format),
+            args.text_field, args.label_field, args.label_map
+        ))
+    if args.limit:
+        dataset = dataset[:args.limit]
+    unknown = {label for _, label in dataset} - set(LABELS)
+    if unknown:
+        parser.error(f"Labels {sorted(unknown)} are not one of {', '.join(LABELS)}; use --label-map")
+
+    benchmark = evaluate(
+        dataset,
+        [name for name in args.backends.split(',') if name],
+        dataset_name=os.path.splitext(os.path.basename(args.dataset))[0],
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size
+    )
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        benchmark.save_results(args.output)
+    if args.history:
+        from benchmark_history import BenchmarkHistory
+        history = BenchmarkHistory(args.history)
+        print(f"Recorded run {benchmark.record_run(history)}", file=sys.stderr)
+        history.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import zipfile
+from nltk.sentiment import SentimentIntensityAnalyzer
+from nltk.sentiment.vader import VaderConstants
+
+# Compiled lexicon layout (little endian):
+#   header  MAGIC, SHA-256 of the source zip, lexicon size, booster size,
+#           negation size, key blob sizes
+#   values  float64 lexicon valences followed by float64 booster scalars
+#   keys    lexicon words, booster words and negation words, each section
+#           UTF-8 encoded and joined with newlines
+MAGIC = b'VADERLX2'
+HEADER = struct.Struct('<8s32sIIIIII')
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+LEXICON_ZIP = os.path.join(current_dir, 'nltk_data', 'sentiment', 'vader_lexicon.zip')
+COMPILED_LEXICON = os.path.join(current_dir, 'nltk_data', 'sentiment', 'vader_lexicon.bin')
+
+def read_lexicon_zip(zip_path=LEXICON_ZIP):
+    """Parse the VADER lexicon text from the NLTK zip the same way make_lex_dict does"""
+    with zipfile.ZipFile(zip_path) as archive:
+        text = archive.read('vader_lexicon/vader_lexicon.txt').decode('utf-8')
+    lexicon = {}
+    for line in text.split('\n'):
+        if not line.strip():
+            continue
+        (word, measure) = line.strip().split('\t')[0:2]
+        lexicon[word] = float(measure)
+    return lexicon
+
+def source_hash(zip_path=LEXICON_ZIP):
+    """SHA-256 digest of the lexicon zip, stored in the compiled header"""
+    with open(zip_path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+def compile_lexicon(zip_path=LEXICON_ZIP, output_path=COMPILED_LEXICON):
+    """
+    Compile the lexicon, booster and negation tables into the binary format
+    read by load_compiled_analyzer.
+    """
+    lexicon = read_lexicon_zip(zip_path)
+    booster = VaderConstants.BOOSTER_DICT
+    negate = list(VaderConstants.NEGATE)
+
+    values = struct.pack(f'<{len(lexicon)}d', *lexicon.values())
+    values += struct.pack(f'<{len(booster)}d', *booster.values())
+    blobs = [
+        '\n'.join(words).encode('utf-8')
+        for words in (lexicon.keys(), booster.keys(), negate)
+    ]
+    header = HEADER.pack(MAGIC, source_hash(zip_path), len(lexicon), len(booster), len(negate),
+                         *map(len, blobs))
+
+    # Write to a temporary file first so running workers never map a partial file
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(values)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def _split_words(blob):
+    return blob.decode('utf-8').split('\n') if blob else []
+
+def is_current(path=COMPILED_LEXICON, zip_path=LEXICON_ZIP):
+    """
+    True when path is a compiled lexicon in the current format built from
+    the zip as it is now, so a zip updated after compiling is not shadowed
+    by a stale compiled file
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return False
+        magic, compiled_hash, *_ = HEADER.unpack(header)
+        return magic == MAGIC and compiled_hash == source_hash(zip_path)
+    except OSError:
+        return False
+
+def load_compiled_tables(path=COMPILED_LEXICON):
+    """
+    Read a compiled lexicon file and return (lexicon, booster, negate).
+    The tables are built from packed floats and word lists, so no text
+    parsing is needed; the mapping is closed once they are copied into
+    dicts. Workers share those dicts copy-on-write when the analyzer is
+    loaded before forking (gunicorn --preload).
+    """
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, _, n_lexicon, n_booster, n_negate, *blob_sizes = HEADER.unpack_from(mapped)
+            if magic != MAGIC:
+                raise ValueError(f"Not a compiled VADER lexicon: {path}")
+
+            offset = HEADER.size
+            with memoryview(mapped) as view:
+                values = view[offset:offset + 8 * (n_lexicon + n_booster)].cast('d').tolist()
+            offset += 8 * (n_lexicon + n_booster)
+
+            words = []
+            for size in blob_sizes:
+                words.append(_split_words(mapped[offset:offset + size]))
+                offset += size
+
+    lexicon_words, booster_words, negate = words
+    if len(lexicon_words) != n_lexicon or len(booster_words) != n_booster or len(negate) != n_negate:
+        raise ValueError(f"Corrupt compiled VADER lexicon: {path}")
+    lexicon = dict(zip(lexicon_words, values[:n_lexicon]))
+    booster = dict(zip(booster_words, values[n_lexicon:]))
+    return lexicon, booster, negate
+
+class CompiledSentimentIntensityAnalyzer(SentimentIntensityAnalyzer):
+    """
+    SentimentIntensityAnalyzer backed by a compiled lexicon file instead of
+    the zipped lexicon text loaded through nltk.data.
+    """
+
+    def __init__(self, path=COMPILED_LEXICON):
+        lexicon, booster, negate = load_compiled_tables(path)
+        self.lexicon_file = path
+        self.lexicon = lexicon
+        self.constants = VaderConstants()
+        self.constants.BOOSTER_DICT = booster
+        self.constants.NEGATE = negate
+
+if __name__ == '__main__':
+    zip_path = sys.argv[1] if len(sys.argv) > 1 else LEXICON_ZIP
+    output_path = sys.argv[2] if len(sys.argv) > 2 else COMPILED_LEXICON
+    compile_lexicon(zip_path, output_path)
+    print(f"Compiled VADER lexicon written to {output_path}")
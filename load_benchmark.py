@@ -0,0 +1,321 @@
+"""
+Load benchmark for the /api/analyze endpoint.
+
+Drives the app with synthetic documents at several concurrency levels and
+records latency percentiles, throughput and peak RSS into a
+BenchmarkFramework, either in process through the Flask test client or over
+HTTP against a local gunicorn started for the run.
+
+Peak RSS is a process-lifetime high-water mark, so each level records the
+peak so far (peak_rss_so_far_bytes): a level only shows a new peak when it
+exceeds every earlier one. In process it also includes the benchmark client.
+
+    python load_benchmark.py --concurrency 1,4,16 --requests 500
+    python load_benchmark.py --target gunicorn --gunicorn-workers 4 --paragraphs 1,5,20 --weights 6,3,1
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from Benchmarking import BenchmarkFramework
+
+# Word pool for synthetic paragraphs: mostly neutral filler with some
+# lexicon words, so that scoring exercises the valence rules
+NEUTRAL_WORDS = (
+    "the service order delivery team product update account support week "
+    "report customer meeting price screen battery app call email invoice "
+    "was is it we they and but very really not today after before again"
+).split()
+SENTIMENT_WORDS = (
+    "good great love excellent happy helpful fast amazing bad terrible "
+    "slow angry disappointed broken awful hate wonderful poor"
+).split()
+
+class DocumentGenerator:
+    """
+    Synthetic documents whose paragraph count is drawn from the given
+    choices and weights, with paragraph lengths around words_per_paragraph.
+    """
+
+    def __init__(self, paragraph_counts=(1, 5, 20), weights=None, words_per_paragraph=40, seed=0):
+        self.paragraph_counts = list(paragraph_counts)
+        self.weights = list(weights) if weights else None
+        self.words_per_paragraph = words_per_paragraph
+        self.seed = seed
+
+    def paragraph(self, rng):
+        length = max(1, int(rng.gauss(self.words_per_paragraph, self.words_per_paragraph / 4)))
+        words = [
+            rng.choice(SENTIMENT_WORDS) if rng.random() < 0.15 else rng.choice(NEUTRAL_WORDS)
+            for _ in range(length)
+        ]
+        return ' '.join(words).capitalize() + rng.choice('.!?')
+
+    def documents(self, count, stream=0):
+        """
+        Return count (text, paragraph_count) pairs. The same seed and stream
+        give the same documents; different streams give different ones, so
+        that runs do not hit the paragraph cache warmed by earlier runs.
+        """
+        rng = random.Random(f"{self.seed}-{stream}")
+        documents = []
+        for _ in range(count):
+            paragraphs = rng.choices(self.paragraph_counts, weights=self.weights)[0]
+            documents.append(('\n'.join(self.paragraph(rng) for _ in range(paragraphs)), paragraphs))
+        return documents
+
+    def label(self):
+        counts = '/'.join(map(str, self.paragraph_counts))
+        weights = '/'.join(map(str, self.weights)) if self.weights else 'uniform'
+        return f"p{counts}-w{weights}-len{self.words_per_paragraph}"
+
+class InProcessTarget:
+    """Posts to the Flask app through a test client per thread"""
+    name = 'inprocess'
+
+    def __init__(self):
+        from app import app
+        self.app = app
+        self._local = threading.local()
+
+    def post(self, text):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.post('/api/analyze', json={'text': text})
+        response.get_data()
+        return response.status_code
+
+    def peak_rss(self):
+        # Peak since the process started, benchmark client included; ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def close(self):
+        pass
+
+class HttpTarget:
+    """Posts to a running server over HTTP"""
+    name = 'http'
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def post(self, text):
+        request = urllib.request.Request(
+            self.url + '/api/analyze',
+            data=json.dumps({'text': text}).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def peak_rss(self):
+        return None
+
+    def close(self):
+        pass
+
+class GunicornTarget(HttpTarget):
+    """Starts gunicorn on a free local port for the duration of the run"""
+    name = 'gunicorn'
+
+    def __init__(self, workers=2, threads=1, startup_timeout=60):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        super().__init__(f"http://127.0.0.1:{port}")
+        self.process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn', '--preload',
+                '--bind', f"127.0.0.1:{port}",
+                '--workers', str(workers), '--threads', str(threads),
+                '--log-level', 'warning', 'app:application'
+            ],
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        self._wait_ready(startup_timeout)
+
+    def _wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {self.process.returncode}")
+            try:
+                with urllib.request.urlopen(self.url + '/readyz', timeout=1) as response:
+                    if response.status == 200:
+                        return
+            except OSError:
+                pass
+            time.sleep(0.25)
+        self.close()
+        raise RuntimeError(f"gunicorn was not ready within {timeout}s")
+
+    def peak_rss(self):
+        """Sum of the peak RSS of the master and its workers since they started (Linux only)"""
+        pids = {self.process.pid}
+        for stat_path in glob.glob('/proc/[0-9]*/stat'):
+            try:
+                with open(stat_path) as f:
+                    # The parent pid follows the parenthesised command name
+                    fields = f.read().rsplit(')', 1)[1].split()
+                if int(fields[1]) == self.process.pid:
+                    pids.add(int(stat_path.split('/')[2]))
+            except (OSError, IndexError, ValueError):
+                continue
+        total = 0
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith('VmHWM:'):
+                            total += int(line.split()[1]) * 1024
+            except OSError:
+                return None
+        return total or None
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+def run_level(target, documents, concurrency):
+    """Send every document once from concurrency threads and summarize the latencies"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def send(document):
+        nonlocal errors
+        text, _ = document
+        started = time.perf_counter()
+        try:
+            status = target.post(text)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Request failed: {str(e)}")
+            status = None
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, documents))
+    wall = time.perf_counter() - started
+
+    latencies = np.array(latencies)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    peak_rss_so_far = target.peak_rss()
+    return {
+        'concurrency': concurrency,
+        'requests': len(documents),
+        'errors': errors,
+        'duration': wall,
+        'requests_per_sec': len(documents) / wall,
+        'paragraphs_per_sec': sum(paragraphs for _, paragraphs in documents) / wall,
+        'latency_mean': float(latencies.mean()),
+        'latency_p50': float(p50),
+        'latency_p95': float(p95),
+        'latency_p99': float(p99),
+        'peak_rss_so_far_bytes': peak_rss_so_far,
+    }
+
+def run_benchmark(target, generator, concurrency_levels=(1, 4, 16), requests=200, warmup=20, benchmark=None):
+    """
+    Run every concurrency level against the target and add one result per
+    level to the BenchmarkFramework, which is returned.
+    """
+    benchmark = benchmark or BenchmarkFramework()
+    run_level(target, generator.documents(warmup, stream='warmup'), max(concurrency_levels))
+    for concurrency in concurrency_levels:
+        documents = generator.documents(requests, stream=concurrency)
+        metrics = run_level(target, documents, concurrency)
+        metrics['distribution'] = generator.label()
+        benchmark.add_result(
+            model_name=f"analyze[{target.name}]",
+            dataset_name=f"{generator.label()}@c{concurrency}",
+            metrics=metrics
+        )
+        print(
+            f"c={concurrency:<4} {metrics['requests_per_sec']:8.1f} req/s "
+            f"{metrics['paragraphs_per_sec']:9.1f} para/s  "
+            f"p50 {metrics['latency_p50'] * 1000:7.2f}ms  p95 {metrics['latency_p95'] * 1000:7.2f}ms  "
+            f"p99 {metrics['latency_p99'] * 1000:7.2f}ms  errors {metrics['errors']}",
+            file=sys.stderr
+        )
+    return benchmark
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+def _float_list(value):
+    return [float(v) for v in value.split(',') if v]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the SentiSpeech /api/analyze endpoint")
+    parser.add_argument('--target', choices=['inprocess', 'gunicorn', 'url'], default='inprocess')
+    parser.add_argument('--url', help="Server to test when --target url")
+    parser.add_argument('--gunicorn-workers', type=int, default=2)
+    parser.add_argument('--gunicorn-threads', type=int, default=1)
+    parser.add_argument('--concurrency', type=_int_list, default=[1, 4, 16], help="Comma-separated client thread counts")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument('--warmup', type=int, default=20, help="Unmeasured requests sent first")
+    parser.add_argument('--paragraphs', type=_int_list, default=[1, 5, 20], help="Paragraph counts to draw documents from")
+    parser.add_argument('--weights', type=_float_list, default=None, help="Relative weight of each paragraph count")
+    parser.add_argument('--words', type=int, default=40, help="Mean words per paragraph")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='evaluation/load_benchmark.json', help="Where to save the BenchmarkFramework results")
+    parser.add_argument('--history', help="Also append the run to this benchmark history database")
+    args = parser.parse_args(argv)
+
+    if args.weights and len(args.weights) != len(args.paragraphs):
+        parser.error("--weights needs one weight per --paragraphs entry")
+    logging.basicConfig(level=logging.WARNING)
+    # Keep per-request logging out of the measurements
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+    if args.target == 'gunicorn':
+        target = GunicornTarget(workers=args.gunicorn_workers, threads=args.gunicorn_threads)
+    elif args.target == 'url':
+        if not args.url:
+            parser.error("--target url requires --url")
+        target = HttpTarget(args.url)
+    else:
+        target = InProcessTarget()
+
+    generator = DocumentGenerator(args.paragraphs, args.weights, args.words, args.seed)
+    try:
+        benchmark = run_benchmark(target, generator, args.concurrency, args.requests, args.warmup)
+    finally:
+        target.close()
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        benchmark.save_results(args.output)
+    if args.history:
+        from benchmark_history import BenchmarkHistory
+        history = BenchmarkHistory(args.history)
+        print(f"Recorded run {benchmark.record_run(history)}", file=sys.stderr)
+        history.close()
+
+if __name__ == '__main__':
+    main()
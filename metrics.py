@@ -0,0 +1,161 @@
+# Lightweight in-process metrics exposed in the Prometheus text format on /metrics.
+# Values are per process: with several gunicorn workers each scrape sees
+# the worker that served it, so scrape workers individually or aggregate
+# with sum()/histogram_quantile() on the Prometheus side.
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from 100us to 10s
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Fraction of hot-path log records that are emitted, see log_sampled
+LOG_SAMPLE_RATE = float(os.environ.get('SENTISPEECH_LOG_SAMPLE_RATE', 0.01))
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket latency histogram with optional labels"""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][index] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time spent in the with block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        series = self._series.get(key)
+        return series['count'] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['counts']):
+                    cumulative += count
+                    labels = _format_labels(key + (('le', repr(bound)),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+class Registry:
+    """Collection of metrics rendered together for a scrape"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    'sentispeech_stage_seconds',
+    'Time spent in each stage of an analyze request',
+    labelnames=('endpoint', 'stage')
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    'sentispeech_request_seconds',
+    'End-to-end analyze request latency',
+    labelnames=('endpoint',)
+))
+REQUESTS = registry.register(Counter(
+    'sentispeech_requests_total',
+    'Analyze requests by endpoint and status code',
+    labelnames=('endpoint', 'status')
+))
+PARAGRAPHS = registry.register(Counter(
+    'sentispeech_paragraphs_total',
+    'Paragraphs scored',
+    labelnames=('endpoint',)
+))
+REQUEST_BYTES = registry.register(Counter(
+    'sentispeech_request_bytes_total',
+    'Request body bytes received',
+    labelnames=('endpoint',)
+))
+RESPONSE_BYTES = registry.register(Counter(
+    'sentispeech_response_bytes_total',
+    'Response body bytes before compression (excluding streamed responses)',
+    labelnames=('endpoint',)
+))
+
+def log_sampled(logger, level, msg, *args, rate=None):
+    """
+    Log a hot-path record for a random sample of calls. Arguments are only
+    formatted when the record is actually emitted.
+    """
+    rate = LOG_SAMPLE_RATE if rate is None else rate
+    if rate < 1.0 and random.random() >= rate:
+        return
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, *args)
@@ -0,0 +1,174 @@
+"""
+Throughput benchmark for the PreProcessing pipelines.
+
+Runs preprocess_for_bert/gpt/lstm on synthetic SQuAD-shaped data at several
+dataset sizes and worker counts. Each configuration runs in its own
+subprocess and temporary working directory, so peak RSS and bytes written
+are measured per configuration. Wall time, examples/sec, peak RSS, output
+size and the speed-up over the first worker count are reported through
+BenchmarkFramework.
+
+    python preprocessing_benchmark.py --pipelines lstm,bert --sizes 1000,10000 --workers 1,2,4
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from Benchmarking import BenchmarkFramework
+
+PIPELINES = ('bert', 'gpt', 'lstm')
+
+WORDS = (
+    "the river city council museum library bridge tower island harbour "
+    "century empire treaty army king queen university students science "
+    "built opened founded located during after before around famous large "
+    "small northern southern ancient modern public private national"
+).split()
+
+def synthetic_squad(size, seed=0, context_words=120):
+    """
+    SQuAD-shaped columns (id, title, context, question, answers) for size
+    examples, each answer a span of its context.
+    """
+    rng = random.Random(seed)
+    columns = {'id': [], 'title': [], 'context': [], 'question': [], 'answers': []}
+    for index in range(size):
+        words = [rng.choice(WORDS) for _ in range(max(10, int(rng.gauss(context_words, context_words / 4))))]
+        context = ' '.join(words) + '.'
+        start_word = rng.randrange(len(words) - 3)
+        answer = ' '.join(words[start_word:start_word + rng.randint(1, 3)])
+        answer_start = len(' '.join(words[:start_word])) + (1 if start_word else 0)
+        columns['id'].append(f"synthetic-{seed}-{index}")
+        columns['title'].append(rng.choice(WORDS).capitalize())
+        columns['context'].append(context)
+        columns['question'].append(f"What {rng.choice(WORDS)} {rng.choice(WORDS)} the {words[start_word]}?")
+        columns['answers'].append({'text': [answer], 'answer_start': [answer_start]})
+    return columns
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def run_configuration(pipeline, size, workers, seed=0):
+    """
+    Run one pipeline in the current process and working directory and
+    return its measurements. Used by the subprocess that measure() starts.
+    """
+    from datasets import Dataset
+    import PreProcessing
+
+    train = Dataset.from_dict(synthetic_squad(size, seed))
+    val = Dataset.from_dict(synthetic_squad(max(1, size // 10), seed + 1))
+    os.makedirs(f'data/processed/{pipeline}', exist_ok=True)
+    preprocess = getattr(PreProcessing, f'preprocess_for_{pipeline}')
+
+    started = time.perf_counter()
+    preprocess(train, val, num_proc=workers if workers > 1 else None)
+    wall = time.perf_counter() - started
+
+    examples = len(train) + len(val)
+    # ru_maxrss is in kilobytes on Linux; Dataset.map workers are children
+    return {
+        'pipeline': pipeline,
+        'examples': examples,
+        'workers': workers,
+        'wall_time': wall,
+        'examples_per_sec': examples / wall,
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'peak_rss_children_bytes': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+        'bytes_written': _directory_size('data/processed'),
+    }
+
+def measure(pipeline, size, workers, seed=0, timeout=None):
+    """Run one configuration in a fresh subprocess inside a temporary directory"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory(prefix='preprocess-bench-') as workdir:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get('PYTHONPATH')])))
+        completed = subprocess.run(
+            [sys.executable, os.path.join(here, 'preprocessing_benchmark.py'), '--run-one',
+             pipeline, str(size), str(workers), str(seed)],
+            cwd=workdir, env=env, capture_output=True, text=True, timeout=timeout
+        )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{pipeline} n={size} workers={workers} failed:\n{completed.stderr[-2000:]}")
+    # The pipelines print progress; the measurements are the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def run_benchmark(pipelines, sizes, worker_counts, seed=0, benchmark=None):
+    """
+    Measure every pipeline/size/worker combination and add one result per
+    combination to the BenchmarkFramework, which is returned.
+    """
+    benchmark = benchmark or BenchmarkFramework()
+    for pipeline in pipelines:
+        for size in sizes:
+            baseline = None
+            for workers in worker_counts:
+                metrics = measure(pipeline, size, workers, seed)
+                if baseline is None:
+                    baseline = metrics
+                # Scaling relative to the first worker count
+                metrics['speedup'] = baseline['wall_time'] / metrics['wall_time']
+                metrics['efficiency'] = metrics['speedup'] * baseline['workers'] / workers
+                benchmark.add_result(
+                    model_name=f"preprocess[{pipeline}]",
+                    dataset_name=f"n{size}-w{workers}",
+                    metrics=metrics
+                )
+                print(
+                    f"{pipeline:<5} n={size:<7} workers={workers:<3} {metrics['wall_time']:8.2f}s "
+                    f"{metrics['examples_per_sec']:9.1f} ex/s  speedup {metrics['speedup']:5.2f}  "
+                    f"rss {metrics['peak_rss_bytes'] / 2 ** 20:7.1f}MiB  "
+                    f"out {metrics['bytes_written'] / 2 ** 20:8.1f}MiB",
+                    file=sys.stderr
+                )
+    return benchmark
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['--run-one']:
+        pipeline, size, workers, seed = argv[1], int(argv[2]), int(argv[3]), int(argv[4])
+        print(json.dumps(run_configuration(pipeline, size, workers, seed)))
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark the PreProcessing pipelines on synthetic SQuAD data")
+    parser.add_argument('--pipelines', default='lstm,bert,gpt', help="Comma-separated subset of bert,gpt,lstm")
+    parser.add_argument('--sizes', type=_int_list, default=[1000, 10000], help="Training examples per run")
+    parser.add_argument('--workers', type=_int_list, default=[1, 2, 4], help="Dataset.map process counts")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='evaluation/preprocessing_benchmark.json')
+    parser.add_argument('--plot', help="Save an examples/sec comparison chart to this path")
+    parser.add_argument('--history', help="Also append the run to this benchmark history database")
+    args = parser.parse_args(argv)
+
+    pipelines = [p for p in args.pipelines.split(',') if p]
+    unknown = set(pipelines) - set(PIPELINES)
+    if unknown:
+        parser.error(f"Unknown pipelines: {', '.join(sorted(unknown))}")
+
+    benchmark = run_benchmark(pipelines, args.sizes, args.workers, args.seed)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        benchmark.save_results(args.output)
+    if args.plot:
+        os.makedirs(os.path.dirname(args.plot) or '.', exist_ok=True)
+        benchmark.visualize_results(metric='examples_per_sec', save_path=args.plot)
+    if args.history:
+        from benchmark_history import BenchmarkHistory
+        history = BenchmarkHistory(args.history)
+        print(f"Recorded run {benchmark.record_run(history)}", file=sys.stderr)
+        history.close()
+
+if __name__ == '__main__':
+    main()
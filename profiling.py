@@ -0,0 +1,196 @@
+# Opt-in request profiling for the Flask views.
+#
+# A request is profiled when it carries the admin token in the
+# X-Profile-Token header (SENTISPEECH_PROFILE_TOKEN) or is picked by
+# random sampling (SENTISPEECH_PROFILE_SAMPLE_RATE). Each profile is
+# written as a .pstats file and a .collapsed file for flamegraph.pl or
+# speedscope. When neither option is configured, profile_request returns
+# the view unchanged, so there is no overhead at all.
+import cProfile
+import functools
+import hmac
+import itertools
+import logging
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+from flask import make_response, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN = os.environ.get('SENTISPEECH_PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.environ.get('SENTISPEECH_PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get(
+    'SENTISPEECH_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'sentispeech-profiles')
+)
+# Ring buffer limits: number of profiles kept and their total size
+PROFILE_KEEP = int(os.environ.get('SENTISPEECH_PROFILE_KEEP', 20))
+PROFILE_MAX_BYTES = int(os.environ.get('SENTISPEECH_PROFILE_MAX_BYTES', 50 * 1024 * 1024))
+
+PROFILE_HEADER = 'X-Profile-Token'
+MAX_STACK_DEPTH = 64
+
+class RequestProfiler:
+    """Profiles selected requests and keeps the most recent profiles on disk"""
+
+    def __init__(self, directory=PROFILE_DIR, token=PROFILE_TOKEN, sample_rate=PROFILE_SAMPLE_RATE,
+                 keep=PROFILE_KEEP, max_bytes=PROFILE_MAX_BYTES):
+        self.directory = directory
+        self.token = token
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.max_bytes = max_bytes
+        self._sequence = itertools.count()
+        # Only one profiler can be active per process
+        self._active = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.token) or self.sample_rate > 0
+
+    def should_profile(self, headers):
+        if self.token:
+            supplied = headers.get(PROFILE_HEADER, '')
+            if supplied and hmac.compare_digest(supplied, self.token):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def run(self, name, func, *args, **kwargs):
+        """
+        Call func under cProfile and save the profile. Returns (result,
+        profile id); the id is None if another request is being profiled or
+        the profile could not be kept, as the result is returned regardless.
+        """
+        if not self._active.acquire(blocking=False):
+            return func(*args, **kwargs), None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                profiler.disable()
+            try:
+                profile_id = self.save(name, profiler)
+            except Exception as e:
+                logger.error(f"Error saving request profile: {str(e)}")
+                profile_id = None
+            return result, profile_id
+        finally:
+            self._active.release()
+
+    def save(self, name, profiler):
+        """
+        Write .pstats and .collapsed files for a profile and trim the ring
+        buffer. Returns the profile id, or None if the profile was trimmed
+        right away (it is larger than max_bytes on its own).
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{int(time.time() * 1000)}-{os.getpid()}-{next(self._sequence):06d}-{name}"
+        base = os.path.join(self.directory, profile_id)
+        stats = pstats.Stats(profiler)
+        stats.dump_stats(f"{base}.pstats")
+        with open(f"{base}.collapsed", 'w') as f:
+            for stack, microseconds in collapse_stacks(stats):
+                f.write(f"{stack} {microseconds}\n")
+        self._trim()
+        if not (os.path.exists(f"{base}.pstats") and os.path.exists(f"{base}.collapsed")):
+            logger.warning(f"Request profile {base} was trimmed, it exceeds {self.max_bytes} bytes")
+            return None
+        logger.info(f"Saved request profile {base}.pstats")
+        return profile_id
+
+    def _trim(self):
+        # Workers sharing the directory trim it concurrently, so any file
+        # may already be gone by the time it is sized or removed
+        profiles = {}
+        sizes = {}
+        for entry in os.scandir(self.directory):
+            profile_id, ext = os.path.splitext(entry.name)
+            if ext not in ('.pstats', '.collapsed'):
+                continue
+            try:
+                size = entry.stat().st_size
+            except FileNotFoundError:
+                continue
+            profiles.setdefault(profile_id, []).append(entry)
+            sizes[profile_id] = sizes.get(profile_id, 0) + size
+        # Profile ids start with a millisecond timestamp
+        ordered = sorted(profiles)
+        total = sum(sizes.values())
+        while ordered and (len(ordered) > self.keep or total > self.max_bytes):
+            profile_id = ordered.pop(0)
+            total -= sizes[profile_id]
+            for entry in profiles[profile_id]:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+def _label(func):
+    filename, line, name = func
+    label = name if filename == '~' else f"{name} ({os.path.basename(filename)}:{line})"
+    return label.replace(';', ':')
+
+def collapse_stacks(stats):
+    """
+    Convert pstats caller/callee edges into collapsed stacks ("a;b;c value"
+    in microseconds of self time). cProfile only records one level of
+    callers, so a function's time is split across call paths in proportion
+    to the cumulative time of each incoming edge.
+    """
+    children = {}
+    roots = []
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, edge in callers.items():
+            # edge is (cc, nc, tt, ct) for calls from caller to func
+            children.setdefault(caller, []).append((func, edge[3]))
+
+    collapsed = {}
+
+    def walk(func, path, fraction):
+        self_time = stats.stats[func][2]
+        path = path + (func,)
+        stack = ';'.join(_label(f) for f in path)
+        collapsed[stack] = collapsed.get(stack, 0) + self_time * fraction
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for child, edge_time in children.get(func, ()):
+            child_cumulative = stats.stats[child][3]
+            if child in path or not child_cumulative:
+                continue
+            walk(child, path, fraction * edge_time / child_cumulative)
+
+    for root in roots:
+        walk(root, (), 1.0)
+
+    for stack, seconds in collapsed.items():
+        microseconds = int(seconds * 1e6)
+        if microseconds > 0:
+            yield stack, microseconds
+
+request_profiler = RequestProfiler()
+
+def profile_request(view, profiler=request_profiler):
+    """Decorator profiling selected calls of a Flask view; a no-op when profiling is off"""
+    if not profiler.enabled:
+        return view
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method == 'OPTIONS' or not profiler.should_profile(request.headers):
+            return view(*args, **kwargs)
+        result, profile_id = profiler.run(view.__name__, view, *args, **kwargs)
+        if profile_id is None:
+            return result
+        # Views may return (response, status) tuples
+        response = make_response(result)
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    return wrapper
@@ -0,0 +1,87 @@
+# JSON encoding and content negotiation for API responses.
+#
+# orjson and brotli are optional: without them responses fall back to the
+# standard json module and gzip.
+import gzip
+import hashlib
+import json
+from flask import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson'}
+
+def dumps(obj):
+    """Serialize obj to compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+def json_response(obj, status=200):
+    return Response(dumps(obj), status=status, mimetype='application/json')
+
+def content_etag(*parts):
+    """Hash the given strings into an ETag value"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        data = part.encode('utf-8', 'surrogatepass')
+        # Length-prefix each part so that ('ab', 'c') and ('a', 'bc') differ
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.hexdigest()
+
+def etag_matches(if_none_match, etag):
+    """
+    True when a werkzeug If-None-Match header names etag (weak comparison).
+    The * wildcard does not match: the analyze endpoints are POSTs that
+    compute their response, which * would answer with an empty 304.
+    """
+    return etag in if_none_match.as_set(include_weak=True)
+
+def not_modified(etag):
+    """Empty 304 response for a request whose If-None-Match matched etag"""
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+def negotiate_encoding(accept_encodings):
+    """Pick the best supported content coding from a werkzeug Accept-Encoding header"""
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return accept_encodings.best_match(offered)
+
+def compress_response(response, accept_encodings):
+    """
+    Compress a buffered JSON response in place when the client accepts
+    brotli or gzip. Streamed and already encoded responses are left alone.
+    """
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_BYTES:
+        return response
+    encoding = negotiate_encoding(accept_encodings)
+    if encoding == 'br':
+        body = brotli.compress(body, quality=5)
+    elif encoding == 'gzip':
+        body = gzip.compress(body, compresslevel=5)
+    else:
+        return response
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
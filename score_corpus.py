@@ -0,0 +1,204 @@
+"""
+Offline bulk scoring for JSONL/CSV corpora.
+
+Streams documents from the input, scores them on a process pool in chunks
+and streams one result per document (JSONL) or per paragraph (CSV) to the
+output, so memory stays flat regardless of corpus size.
+
+    python score_corpus.py tickets.jsonl scored.jsonl --workers 8
+    python score_corpus.py tickets.csv scored.csv --text-field body --id-field ticket_id
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from analysis import split_paragraphs, build_paragraph_result
+from sentiment import analyze_sentiment_batch, compose_sentiment, warm_up
+
+CSV_COLUMNS = [
+    'id', 'paragraph', 'text', 'sentiment', 'score', 'rate', 'pitch', 'volume',
+    'overall_sentiment', 'overall_score'
+]
+
+def detect_format(path, fmt=None):
+    """The explicit format, else csv for .csv paths and jsonl for anything else"""
+    if fmt:
+        return fmt
+    if path.endswith('.csv'):
+        return 'csv'
+    return 'jsonl'
+
+def open_stream(path, mode):
+    """Open path for reading or writing; - is stdin or stdout, which is left open on exit"""
+    if path == '-':
+        return nullcontext(sys.stdin if 'r' in mode else sys.stdout)
+    return open(path, mode, encoding='utf-8', newline='')
+
+def read_documents(stream, fmt, text_field='text', id_field='id'):
+    """Yield (id, text) pairs one document at a time"""
+    if fmt == 'csv':
+        # Support long tickets in a single CSV field
+        csv.field_size_limit(sys.maxsize)
+        for line_number, row in enumerate(csv.DictReader(stream), start=1):
+            yield row.get(id_field, line_number), row.get(text_field) or ''
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield record.get(id_field, line_number), record.get(text_field) or ''
+
+def _chunks(documents, chunk_size):
+    chunk = []
+    for document in documents:
+        chunk.append(document)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def score_documents(documents, include_text=True):
+    """
+    Score a chunk of (id, text) documents the way /api/analyze does.
+    Runs in the worker processes.
+    """
+    results = []
+    for document_id, text in documents:
+        paragraphs = split_paragraphs(text)
+        scored = analyze_sentiment_batch(paragraphs, with_components=True)
+        paragraph_results = []
+        for paragraph, (sentiment_result, _) in zip(paragraphs, scored):
+            result = build_paragraph_result(paragraph, sentiment_result)
+            if not include_text:
+                del result['text']
+            paragraph_results.append(result)
+        results.append({
+            'id': document_id,
+            'overall': compose_sentiment([components for _, components in scored]),
+            'paragraphs': paragraph_results
+        })
+    return results
+
+class ResultWriter:
+    """
+    Write scored documents as JSONL (one per line) or CSV (one row per
+    paragraph; a document without paragraphs gets one row with an empty
+    paragraph index, so it is not lost)
+    """
+
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(stream, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+            self.writer.writeheader()
+
+    def write(self, result):
+        if self.fmt != 'csv':
+            self.stream.write(json.dumps(result, separators=(',', ':')) + '\n')
+            return
+        overall = result['overall']
+        if not result['paragraphs']:
+            self.writer.writerow({
+                'id': result['id'],
+                'overall_sentiment': overall['sentiment'],
+                'overall_score': overall['score']
+            })
+        for index, paragraph in enumerate(result['paragraphs']):
+            self.writer.writerow({
+                'id': result['id'],
+                'paragraph': index,
+                'text': paragraph.get('text', ''),
+                'sentiment': paragraph['sentiment'],
+                'score': paragraph['score'],
+                'rate': paragraph['speechParams']['rate'],
+                'pitch': paragraph['speechParams']['pitch'],
+                'volume': paragraph['speechParams']['volume'],
+                'overall_sentiment': overall['sentiment'],
+                'overall_score': overall['score']
+            })
+
+def _init_worker():
+    # Per-call INFO logging would dominate the cost of scoring
+    logging.getLogger().setLevel(logging.WARNING)
+    warm_up()
+
+def score_corpus(documents, writer, workers=None, chunk_size=256, include_text=True,
+                 progress_interval=10.0, progress_stream=sys.stderr):
+    """
+    Score an iterable of (id, text) documents on a process pool and write the
+    results in input order. At most two chunks per worker are in flight, so
+    neither the input nor the output is ever held in memory.
+    Returns (documents scored, elapsed seconds).
+    """
+    workers = workers or os.cpu_count()
+    started = time.perf_counter()
+    last_report = started
+    count = 0
+
+    def report(final=False):
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed > 0 else 0.0
+        label = 'Done' if final else 'Progress'
+        print(f"{label}: {count} documents in {elapsed:.1f}s ({rate:.1f} docs/sec)", file=progress_stream)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        in_flight = deque()
+        for chunk in _chunks(documents, chunk_size):
+            in_flight.append(pool.submit(score_documents, chunk, include_text))
+            if len(in_flight) < 2 * workers:
+                continue
+            results = in_flight.popleft().result()
+            for result in results:
+                writer.write(result)
+            count += len(results)
+            if progress_interval and time.perf_counter() - last_report >= progress_interval:
+                report()
+                last_report = time.perf_counter()
+        while in_flight:
+            results = in_flight.popleft().result()
+            for result in results:
+                writer.write(result)
+            count += len(results)
+
+    report(final=True)
+    return count, time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a JSONL or CSV corpus with the SentiSpeech analyzer")
+    parser.add_argument('input', help="Input file, or - for stdin")
+    parser.add_argument('output', help="Output file, or - for stdout")
+    parser.add_argument('--input-format', choices=['jsonl', 'csv'], help="Defaults to the input file extension")
+    parser.add_argument('--output-format', choices=['jsonl', 'csv'], help="Defaults to the output file extension")
+    parser.add_argument('--text-field', default='text', help="Field holding the document text")
+    parser.add_argument('--id-field', default='id', help="Field holding the document id (defaults to the line number)")
+    parser.add_argument('--workers', type=int, default=None, help="Scoring processes (defaults to one per CPU)")
+    parser.add_argument('--chunk-size', type=int, default=256, help="Documents per work unit")
+    parser.add_argument('--no-text', action='store_true', help="Do not echo paragraph text in the output")
+    parser.add_argument('--progress-interval', type=float, default=10.0, help="Seconds between progress reports (0 disables)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    input_format = detect_format(args.input, args.input_format)
+    output_format = detect_format(args.output, args.output_format)
+
+    with open_stream(args.input, 'r') as source, open_stream(args.output, 'w') as sink:
+        documents = read_documents(source, input_format, args.text_field, args.id_field)
+        score_corpus(
+            documents,
+            ResultWriter(sink, output_format),
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            include_text=not args.no_text,
+            progress_interval=args.progress_interval
+        )
+
+if __name__ == '__main__':
+    main()
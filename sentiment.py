@@ -1,124 +1,374 @@
 import nltk
 from nltk.sentiment import SentimentIntensityAnalyzer
+from nltk.sentiment.vader import SentiText
+import math
 import os
 import warnings
 import sys
 import logging
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from lexicon import COMPILED_LEXICON, CompiledSentimentIntensityAnalyzer, is_current
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Suppress deprecation warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-# Add nltk_data to the path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 nltk_data_path = os.path.join(current_dir, 'nltk_data')
-logger.info(f"Using NLTK data path: {nltk_data_path}")
-nltk.data.path.append(nltk_data_path)
 
-# Initialize the sentiment analyzer
-try:
-    sia = SentimentIntensityAnalyzer()
-    logger.info("Successfully initialized SentimentIntensityAnalyzer")
-except Exception as e:
-    logger.error(f"Error initializing SentimentIntensityAnalyzer: {str(e)}")
-    raise
+# Synthetic text scored by warm_up before a worker reports ready
+WARM_UP_TEXT = "I love this product! It's not bad at all.\nThis is VERY disappointing, but fine??"
 
-def analyze_sentiment(text):
+# Start-up timings in seconds, reported by the /readyz endpoint
+startup_timings = {}
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+_ready = threading.Event()
+
+def _load_analyzer():
     """
-    Analyze the sentiment of the given text.
-    Returns a dictionary with sentiment label and score.
+    Build the sentiment analyzer, preferring the lexicon compiled by
+    `python lexicon.py` over parsing the zipped lexicon text
     """
+    started = time.perf_counter()
     try:
-        if not text.strip():
-            return {'sentiment': 'neutral', 'score': 0.5}
-        
-        scores = sia.polarity_scores(text)
-        logger.info(f"Sentiment scores: {scores}")
-        
-        # Determine sentiment based on compound score
-        compound = scores['compound']
-        
-        if compound >= 0.05:
-            sentiment = 'positive'
-            # Normalize score for positive sentiment (0.05 to 1 -> 0.5 to 1)
-            score = 0.5 + (compound - 0.05) * 0.5 / 0.95
-        elif compound <= -0.05:
-            sentiment = 'negative'
-            # Normalize score for negative sentiment (-0.05 to -1 -> 0.5 to 1)
-            score = 0.5 + (abs(compound) - 0.05) * 0.5 / 0.95
+        compiled = os.path.exists(COMPILED_LEXICON)
+        if compiled and not is_current(COMPILED_LEXICON):
+            logger.warning(f"{COMPILED_LEXICON} was not compiled from the current lexicon zip, "
+                           "loading the zip instead; re-run `python lexicon.py`")
+            compiled = False
+        if compiled:
+            analyzer = CompiledSentimentIntensityAnalyzer(COMPILED_LEXICON)
         else:
-            sentiment = 'neutral'
-            # Normalize score for neutral sentiment (-0.05 to 0.05 -> 0 to 0.5)
-            score = 0.5 * (compound + 0.05) / 0.1
-        
-        return {
-            'sentiment': sentiment,
-            'score': round(score, 2),
-            'details': {
-                'positive': scores['pos'],
-                'negative': scores['neg'],
-                'neutral': scores['neu'],
-                'compound': scores['compound']
-            }
-        }
+            # Add nltk_data to the path
+            logger.info(f"Using NLTK data path: {nltk_data_path}")
+            if nltk_data_path not in nltk.data.path:
+                nltk.data.path.append(nltk_data_path)
+            analyzer = SentimentIntensityAnalyzer()
+        logger.info("Successfully initialized SentimentIntensityAnalyzer")
     except Exception as e:
-        logger.error(f"Error in analyze_sentiment: {str(e)}")
+        logger.error(f"Error initializing SentimentIntensityAnalyzer: {str(e)}")
         raise
+    startup_timings['analyzer_load'] = round(time.perf_counter() - started, 4)
+    return analyzer
 
-# For more advanced implementations:
-# Uncomment if you want to use a transformer model instead
-"""
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
-import numpy as np
+def get_analyzer():
+    """Return the shared analyzer, loading it on first use"""
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = _load_analyzer()
+    return _analyzer
 
-# This would normally be in a setup function or done at startup
-model_name = "distilbert-base-uncased-finetuned-sst-2-english"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForSequenceClassification.from_pretrained(model_name)
+def warm_up():
+    """
+    Load the analyzer and run a synthetic analysis through the scoring path,
+    so the first real request does not pay for lazy initialization.
+    """
+    try:
+        get_analyzer()
+        started = time.perf_counter()
+        compose_sentiment([
+            score_with_components(paragraph)[1]
+            for paragraph in WARM_UP_TEXT.split('\n')
+        ])
+        startup_timings['warm_up'] = round(time.perf_counter() - started, 4)
+        _ready.set()
+    except Exception as e:
+        startup_timings['error'] = str(e)
+        logger.error(f"Error warming up the sentiment analyzer: {str(e)}")
+        raise
 
-def analyze_sentiment_with_transformer(text):
-    if not text.strip():
-        return {'sentiment': 'neutral', 'score': 0.5}
+def is_ready():
+    """True once warm_up has completed in this process"""
+    return _ready.is_set()
+
+class ParagraphCache:
+    """
+    Bounded LRU cache of paragraph scoring results, keyed by a hash of the
+    paragraph text. Entries older than ttl seconds are treated as misses.
+    A capacity of 0 disables caching.
+    """
     
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
-    with torch.no_grad():
-        outputs = model(**inputs)
+    def __init__(self, capacity=10000, ttl=3600.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
     
-    scores = torch.nn.functional.softmax(outputs.logits, dim=-1)
-    scores = scores.numpy()[0]
+    @staticmethod
+    def _key(text):
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
     
-    # DistilBERT model gives negative=0, positive=1
-    neg_score = scores[0]
-    pos_score = scores[1]
+    def get(self, text):
+        """Return the cached entry for text, or None on a miss"""
+        key = self._key(text)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            stored_at, entry = item
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
     
-    if pos_score > neg_score:
+    def put(self, text, entry):
+        """Store entry for text, evicting the least recently used entries"""
+        if self.capacity <= 0:
+            return
+        key = self._key(text)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+    
+    def stats(self):
+        """Return the cache size and hit/miss/eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'capacity': self.capacity,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+# Shared cache for paragraph scoring, see analyze_sentiment_batch
+paragraph_cache = ParagraphCache(
+    capacity=int(os.environ.get('SENTISPEECH_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('SENTISPEECH_CACHE_TTL', 3600))
+)
+
+def _reset_after_fork():
+    # A fork taken while another thread holds one of these locks, such as the
+    # warm-up thread started when a preloading master imports the app, leaves
+    # the child's copy locked with no thread to release it. The child starts
+    # over: an analyzer the parent had not finished loading is still None.
+    global _analyzer_lock
+    _analyzer_lock = threading.Lock()
+    paragraph_cache._lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _format_scores(scores):
+    """
+    Map raw VADER polarity scores onto the sentiment label and the
+    normalized 0-1 score used by the rest of the application.
+    """
+    # Determine sentiment based on compound score
+    compound = scores['compound']
+    
+    if compound >= 0.05:
         sentiment = 'positive'
-        score = pos_score
-    else:
+        # Normalize score for positive sentiment (0.05 to 1 -> 0.5 to 1)
+        score = 0.5 + (compound - 0.05) * 0.5 / 0.95
+    elif compound <= -0.05:
         sentiment = 'negative'
-        score = neg_score
-    
-    # If scores are close, consider it neutral
-    if abs(pos_score - neg_score) < 0.3:
+        # Normalize score for negative sentiment (-0.05 to -1 -> 0.5 to 1)
+        score = 0.5 + (abs(compound) - 0.05) * 0.5 / 0.95
+    else:
         sentiment = 'neutral'
-        score = 0.5
+        # Normalize score for neutral sentiment (-0.05 to 0.05 -> 0 to 0.5)
+        score = 0.5 * (compound + 0.05) / 0.1
     
     return {
         'sentiment': sentiment,
-        'score': float(score),
+        'score': round(score, 2),
         'details': {
-            'positive': float(pos_score),
-            'negative': float(neg_score)
+            'positive': scores['pos'],
+            'negative': scores['neg'],
+            'neutral': scores['neu'],
+            'compound': scores['compound']
         }
     }
-"""
+
+def analyze_sentiment(text):
+    """
+    Analyze the sentiment of the given text.
+    Returns a dictionary with sentiment label and score.
+    """
+    try:
+        if not text.strip():
+            return {'sentiment': 'neutral', 'score': 0.5}
+        
+        scores = get_analyzer().polarity_scores(text)
+        logger.debug("Sentiment scores: %s", scores)
+        
+        return _format_scores(scores)
+    except Exception as e:
+        logger.error(f"Error in analyze_sentiment: {str(e)}")
+        raise
+
+def score_with_components(text):
+    """
+    Analyze the sentiment of the given text like analyze_sentiment, and also
+    return the intermediate VADER sums that compose_sentiment needs to derive
+    a document-level score without re-scoring the text.
+    Returns a (result, components) tuple.
+    """
+    if not text.strip():
+        return {'sentiment': 'neutral', 'score': 0.5}, None
+    
+    sia = get_analyzer()
+    
+    # Same token pass as SentimentIntensityAnalyzer.polarity_scores
+    sentitext = SentiText(text, sia.constants.PUNC_LIST, sia.constants.REGEX_REMOVE_PUNCTUATION)
+    words_and_emoticons = sentitext.words_and_emoticons
+    first_index = {}
+    for idx, token in enumerate(words_and_emoticons):
+        first_index.setdefault(token, idx)
+    
+    sentiments = []
+    for item in words_and_emoticons:
+        i = first_index[item]
+        if (
+            i < len(words_and_emoticons) - 1
+            and item.lower() == "kind"
+            and words_and_emoticons[i + 1].lower() == "of"
+        ) or item.lower() in sia.constants.BOOSTER_DICT:
+            sentiments.append(0)
+            continue
+        sentiments = sia.sentiment_valence(0, sentitext, item, i, sentiments)
+    sentiments = sia._but_check(words_and_emoticons, sentiments)
+    
+    pos_sum, neg_sum, neu_count = sia._sift_sentiment_scores(sentiments)
+    components = {
+        'tokens': len(sentiments),
+        'valence_sum': float(sum(sentiments)),
+        'pos_sum': pos_sum,
+        'neg_sum': neg_sum,
+        'neu_count': neu_count,
+        'exclamations': text.count('!'),
+        'questions': text.count('?')
+    }
+    return _format_scores(sia.score_valence(sentiments, text)), components
+
+def compose_sentiment(components_list):
+    """
+    Derive the document-level result from per-paragraph components returned
+    by score_with_components, without tokenizing the document again.
+    
+    The valence sums, pos/neg/neu counts and punctuation counts add up
+    exactly, so the result matches analyze_sentiment on the joined text
+    whenever VADER's context rules stay inside a paragraph. It differs when
+    they cross a paragraph boundary: a "but" rescales the valence of the whole
+    text rather than its own paragraph, negations and boosters look back into
+    the previous paragraph, the ALL-CAPS differential is measured over the
+    whole text, and a token repeated in several paragraphs takes its context
+    from the first occurrence. Set SENTISPEECH_OVERALL_MODE=exact in app.py
+    to score the full text instead when the exact legacy value is required.
+    """
+    components_list = [c for c in components_list if c is not None]
+    if not components_list:
+        return {'sentiment': 'neutral', 'score': 0.5}
+    
+    if not any(c['tokens'] for c in components_list):
+        return _format_scores({'neg': 0.0, 'neu': 0.0, 'pos': 0.0, 'compound': 0.0})
+    
+    constants = get_analyzer().constants
+    sum_s = sum(c['valence_sum'] for c in components_list)
+    pos_sum = sum(c['pos_sum'] for c in components_list)
+    neg_sum = sum(c['neg_sum'] for c in components_list)
+    neu_count = sum(c['neu_count'] for c in components_list)
+    
+    # Punctuation emphasis is counted over the whole text, as in score_valence
+    ep_count = min(sum(c['exclamations'] for c in components_list), 4)
+    qm_count = sum(c['questions'] for c in components_list)
+    punct_emph_amplifier = ep_count * 0.292
+    if qm_count > 1:
+        punct_emph_amplifier += qm_count * 0.18 if qm_count <= 3 else 0.96
+    
+    if sum_s > 0:
+        sum_s += punct_emph_amplifier
+    elif sum_s < 0:
+        sum_s -= punct_emph_amplifier
+    compound = constants.normalize(sum_s)
+    
+    if pos_sum > math.fabs(neg_sum):
+        pos_sum += punct_emph_amplifier
+    elif pos_sum < math.fabs(neg_sum):
+        neg_sum -= punct_emph_amplifier
+    
+    total = pos_sum + math.fabs(neg_sum) + neu_count
+    return _format_scores({
+        'neg': round(math.fabs(neg_sum / total), 3),
+        'neu': round(math.fabs(neu_count / total), 3),
+        'pos': round(math.fabs(pos_sum / total), 3),
+        'compound': round(compound, 4)
+    })
+
+def score_paragraph(text, cache=None):
+    """
+    Return the (result, components) tuple for one paragraph, reusing the
+    entry from the given ParagraphCache when there is one.
+    """
+    entry = cache.get(text) if cache is not None else None
+    if entry is None:
+        entry = score_with_components(text)
+        if cache is not None:
+            cache.put(text, entry)
+    return entry
+
+def analyze_sentiment_batch(texts, with_components=False, cache=None):
+    """
+    Analyze the sentiment of many texts in one call.
+    Returns a list of results in the same order and shape as
+    analyze_sentiment, but skips the per-call logging and scores each
+    distinct text only once. With with_components=True each entry is the
+    (result, components) tuple returned by score_with_components.
+    If a ParagraphCache is given, texts scored by earlier calls are reused.
+    """
+    try:
+        scored = {}
+        results = []
+        for text in texts:
+            entry = scored.get(text)
+            if entry is None:
+                entry = scored[text] = score_paragraph(text, cache)
+            results.append(entry if with_components else entry[0])
+        
+        logger.debug("Scored batch of %d texts (%d distinct)", len(results), len(scored))
+        return results
+    except Exception as e:
+        logger.error(f"Error in analyze_sentiment_batch: {str(e)}")
+        raise
+
+# For more advanced implementations, see backends.py for a transformer
+# classifier behind the same interface
 
 # Testing the module
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    
     test_texts = [
         "I love this product! It's amazing and works perfectly.",
         "This is terrible. I'm very disappointed and angry.",
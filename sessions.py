@@ -0,0 +1,219 @@
+# Incremental analysis sessions for live editing (see the /ws/analyze
+# endpoint in asgi.py).
+#
+# A session holds a document as a list of paragraphs with their scores and
+# VADER components. Edits re-score only the paragraphs they insert or replace,
+# and running totals of the components let the overall score be composed
+# without visiting every paragraph again.
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+from sentiment import compose_sentiment
+
+logger = logging.getLogger(__name__)
+
+# Sessions without activity for this many seconds are closed and evicted
+SESSION_IDLE_SECONDS = float(os.environ.get('SENTISPEECH_SESSION_IDLE_SECONDS', 300))
+# Upper bound on the estimated memory held by one session
+SESSION_MAX_BYTES = int(os.environ.get('SENTISPEECH_SESSION_MAX_BYTES', 1 << 20))
+MAX_SESSIONS = int(os.environ.get('SENTISPEECH_MAX_SESSIONS', 1000))
+
+# Rough cost of a paragraph's result and components, on top of its text
+PARAGRAPH_OVERHEAD_BYTES = 512
+# Re-add the running totals from scratch every so many edits to bound float drift
+RESUM_INTERVAL = 1024
+COMPONENT_KEYS = ('tokens', 'valence_sum', 'pos_sum', 'neg_sum', 'neu_count', 'exclamations', 'questions')
+
+class SessionError(Exception):
+    """An edit or session request that cannot be honoured"""
+
+class _Paragraph:
+    __slots__ = ('text', 'result', 'components', 'size')
+
+    def __init__(self, text):
+        self.text = text
+        self.result = None
+        self.components = None
+        self.size = sys.getsizeof(text) + PARAGRAPH_OVERHEAD_BYTES
+
+class AnalysisSession:
+    """
+    One live document. score(texts) returns a (result, components) tuple per
+    text, like app.score_paragraphs. When composable is false (exact overall
+    mode or a backend without components) the overall score comes from
+    overall(text, components_list) on the whole document instead.
+    """
+
+    def __init__(self, session_id, score, overall, composable=True, max_bytes=SESSION_MAX_BYTES):
+        self.id = session_id
+        self.score = score
+        self.fallback_overall = overall
+        self.composable = composable
+        self.max_bytes = max_bytes
+        self.paragraphs = []
+        self.size = 0
+        self.last_active = time.monotonic()
+        self.lock = threading.Lock()
+        self._totals = dict.fromkeys(COMPONENT_KEYS, 0)
+        self._composed = 0
+        self._edits = 0
+        self._overall = None
+
+    def __len__(self):
+        return len(self.paragraphs)
+
+    def apply(self, edits):
+        """
+        Apply a list of edits as one unit: either all of them are applied or,
+        on a SessionError or scoring failure, none are. Each edit is
+        {'op': 'insert' | 'replace' | 'delete', 'index': int, 'text': str},
+        with the index referring to the document after the preceding edits.
+        Returns [(index, paragraph)] for the paragraphs that were scored.
+        """
+        if not isinstance(edits, list):
+            raise SessionError("edits must be a list")
+        with self.lock:
+            self.last_active = time.monotonic()
+            paragraphs = list(self.paragraphs)
+            size = self.size
+            for edit in edits:
+                op, index = self._validate(edit, len(paragraphs))
+                if op == 'delete':
+                    size -= paragraphs.pop(index).size
+                    continue
+                paragraph = _Paragraph(edit['text'])
+                size += paragraph.size
+                if op == 'insert':
+                    paragraphs.insert(index, paragraph)
+                else:
+                    size -= paragraphs[index].size
+                    paragraphs[index] = paragraph
+            if size > self.max_bytes:
+                raise SessionError(f"Session would exceed its {self.max_bytes} byte limit")
+
+            # New paragraphs are the only ones without a result; those
+            # replaced or deleted again within the same edits are not scored
+            touched = [(index, p) for index, p in enumerate(paragraphs) if p.result is None]
+            if touched:
+                scored = self.score([p.text for _, p in touched])
+                for (_, paragraph), (result, components) in zip(touched, scored):
+                    paragraph.result, paragraph.components = result, components
+
+            kept = {id(p) for p in paragraphs}
+            removed = [p for p in self.paragraphs if id(p) not in kept]
+            self.paragraphs = paragraphs
+            self.size = size
+            self._update_totals(removed, [p for _, p in touched])
+            return touched
+
+    @staticmethod
+    def _validate(edit, length):
+        if not isinstance(edit, dict):
+            raise SessionError("Each edit must be an object")
+        op = edit.get('op')
+        index = edit.get('index')
+        if op not in ('insert', 'replace', 'delete'):
+            raise SessionError(f"Unknown edit op: {op}")
+        if not isinstance(index, int) or isinstance(index, bool):
+            raise SessionError("Edit index must be an integer")
+        upper = length if op == 'insert' else length - 1
+        if not 0 <= index <= upper:
+            raise SessionError(f"Edit index {index} out of range for {length} paragraphs")
+        if op != 'delete':
+            text = edit.get('text')
+            if not isinstance(text, str):
+                raise SessionError("Edit text must be a string")
+            if '\n' in text:
+                raise SessionError("Edit text must be a single paragraph")
+        return op, index
+
+    def _update_totals(self, removed, added):
+        self._overall = None
+        self._edits += 1
+        if self._edits % RESUM_INTERVAL == 0:
+            self._totals = dict.fromkeys(COMPONENT_KEYS, 0)
+            self._composed = 0
+            removed, added = [], self.paragraphs
+        for paragraphs, sign in ((removed, -1), (added, 1)):
+            for paragraph in paragraphs:
+                if paragraph.components is not None:
+                    self._composed += sign
+                    for key in COMPONENT_KEYS:
+                        self._totals[key] += sign * paragraph.components[key]
+
+    def overall(self):
+        """Overall result for the current document"""
+        with self.lock:
+            if self._overall is None:
+                if self.composable:
+                    # compose_sentiment only adds the components up, so the
+                    # running totals compose like the full paragraph list
+                    self._overall = compose_sentiment([self._totals] if self._composed else [])
+                else:
+                    self._overall = self.fallback_overall(
+                        '\n'.join(p.text for p in self.paragraphs),
+                        [p.components for p in self.paragraphs]
+                    )
+            return self._overall
+
+class SessionStore:
+    """
+    Live sessions by id, so a client can reconnect and resume its document.
+    Sessions idle for longer than idle_seconds are evicted.
+    """
+
+    def __init__(self, session_factory, idle_seconds=SESSION_IDLE_SECONDS, max_sessions=MAX_SESSIONS):
+        self.session_factory = session_factory
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.evictions = 0
+
+    def open(self, session_id=None):
+        """Resume session_id if it is still live, otherwise start a new session"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                if len(self._sessions) >= self.max_sessions:
+                    raise SessionError("Too many open sessions")
+                session = self.session_factory(secrets.token_urlsafe(16))
+                self._sessions[session.id] = session
+            session.last_active = now
+            return session
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def evict_idle(self):
+        """Evict idle sessions, at most once per tenth of the idle timeout"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep >= self.idle_seconds / 10:
+                self._evict_idle(now)
+
+    def _evict_idle(self, now):
+        self._last_sweep = now
+        idle = [sid for sid, s in self._sessions.items() if now - s.last_active > self.idle_seconds]
+        for session_id in idle:
+            del self._sessions[session_id]
+        if idle:
+            self.evictions += len(idle)
+            logger.info(f"Evicted {len(idle)} idle analysis sessions")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'bytes': sum(s.size for s in self._sessions.values()),
+                'max_sessions': self.max_sessions,
+                'idle_seconds': self.idle_seconds,
+                'evictions': self.evictions,
+            }
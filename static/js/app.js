@@ -53,11 +53,11 @@ document.addEventListener('DOMContentLoaded', function() {
     `;
     document.head.appendChild(style);
 
-    // Check server status
+    // Check server status (200 once the analyzer is loaded and warmed up)
     async function checkServerStatus() {
         try {
-            const response = await fetch('/api/analyze', {
-                method: 'OPTIONS'
+            const response = await fetch('/readyz', {
+                cache: 'no-store'
             });
             return response.ok;
         } catch (error) {
@@ -77,19 +77,24 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Initialize server status check
     async function initializeServer() {
+        // Only show the overlay if the first readiness check fails
+        if (await checkServerStatus()) {
+            return true;
+        }
+
         showLoading();
-        let attempts = 0;
-        const maxAttempts = 10;
-        const checkInterval = 5000; // 5 seconds
+        const deadline = Date.now() + 60000; // 60 seconds
+        let checkInterval = 250;
 
-        while (attempts < maxAttempts) {
+        while (Date.now() < deadline) {
+            await new Promise(resolve => setTimeout(resolve, checkInterval));
             const isServerReady = await checkServerStatus();
             if (isServerReady) {
                 hideLoading();
                 return true;
             }
-            attempts++;
-            await new Promise(resolve => setTimeout(resolve, checkInterval));
+            // Back off up to 5 seconds between checks
+            checkInterval = Math.min(checkInterval * 2, 5000);
         }
 
         hideLoading();
@@ -131,17 +136,22 @@ document.addEventListener('DOMContentLoaded', function() {
             textForm.querySelector('button[type="submit"]').disabled = true;
             textForm.querySelector('button[type="submit"]').innerHTML = '<span class="spinner-border spinner-border-sm me-2"></span>Analyzing...';
             
-            // Call API to analyze text
-            analysisResults = await analyzeText(text);
-            
-            // Display results
-            displayResults(analysisResults);
-            
-            // Enable stop button
-            stopBtn.disabled = false;
-            
-            // Start speaking
-            speakText(analysisResults);
+            if (window.ReadableStream && window.TextDecoder) {
+                // Stream paragraphs so speech starts with the first one
+                await analyzeAndSpeakStreaming(text);
+            } else {
+                // Call API to analyze text
+                analysisResults = await analyzeText(text);
+                
+                // Display results
+                displayResults(analysisResults);
+                
+                // Enable stop button
+                stopBtn.disabled = false;
+                
+                // Start speaking
+                speakText(analysisResults);
+            }
             
         } catch (error) {
             console.error('Error:', error);
@@ -154,6 +164,32 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Render and speak paragraphs as they arrive from the streaming endpoint
+    async function analyzeAndSpeakStreaming(text) {
+        stopSpeaking();
+        analysisResults = { overall: null, paragraphs: [] };
+        paragraphResults.innerHTML = '';
+        resultsCard.style.display = 'block';
+        
+        await analyzeTextStream(
+            text,
+            para => {
+                if (analysisResults.paragraphs.length === 0) {
+                    hideLoading();
+                    resultsCard.scrollIntoView({ behavior: 'smooth' });
+                }
+                analysisResults.paragraphs.push(para);
+                appendParagraphResult(para, para.index);
+                enqueueParagraph(para);
+            },
+            overall => {
+                analysisResults.overall = overall;
+                updateSentimentUI(overall.sentiment, overall.score);
+                createVisualization(analysisResults);
+            }
+        );
+    }
+    
     // Display analysis results
     function displayResults(results) {
         // Show results card
@@ -215,27 +251,30 @@ document.addEventListener('DOMContentLoaded', function() {
     function renderParagraphResults(paragraphs) {
         paragraphResults.innerHTML = '';
         
-        paragraphs.forEach((para, index) => {
-            const paraDiv = document.createElement('div');
-            paraDiv.className = `paragraph-item ${para.sentiment}`;
-            paraDiv.dataset.index = index;
-            paraDiv.onclick = () => speakParagraph(index);
-            
-            paraDiv.innerHTML = `
-                <p class="mb-1">${para.text}</p>
-                <div class="paragraph-sentiment">
-                    <small>${capitalize(para.sentiment)}</small>
-                    <div class="progress">
-                        <div class="progress-bar ${getSentimentClass(para.sentiment)}" 
-                             role="progressbar" 
-                             style="width: ${para.score * 100}%"></div>
-                    </div>
-                    <small>${Math.round(para.score * 100)}%</small>
+        paragraphs.forEach((para, index) => appendParagraphResult(para, index));
+    }
+    
+    // Render a single paragraph result
+    function appendParagraphResult(para, index) {
+        const paraDiv = document.createElement('div');
+        paraDiv.className = `paragraph-item ${para.sentiment}`;
+        paraDiv.dataset.index = index;
+        paraDiv.onclick = () => speakParagraph(index);
+        
+        paraDiv.innerHTML = `
+            <p class="mb-1">${para.text}</p>
+            <div class="paragraph-sentiment">
+                <small>${capitalize(para.sentiment)}</small>
+                <div class="progress">
+                    <div class="progress-bar ${getSentimentClass(para.sentiment)}" 
+                         role="progressbar" 
+                         style="width: ${para.score * 100}%"></div>
                 </div>
-            `;
-            
-            paragraphResults.appendChild(paraDiv);
-        });
+                <small>${Math.round(para.score * 100)}%</small>
+            </div>
+        `;
+        
+        paragraphResults.appendChild(paraDiv);
     }
     
     // Create visualization chart
@@ -304,21 +343,110 @@ document.addEventListener('DOMContentLoaded', function() {
         return string.charAt(0).toUpperCase() + string.slice(1);
     }
 
+    // Last response per endpoint with its ETag. Re-submitting the same text
+    // sends If-None-Match, and a 304 Not Modified reuses the stored result.
+    const responseCache = {};
+
+    function conditionalHeaders(url, text) {
+        const cached = responseCache[url];
+        return cached && cached.text === text ? { 'If-None-Match': cached.etag } : {};
+    }
+
+    function storeResponse(url, text, response, data) {
+        const etag = response.headers.get('ETag');
+        if (etag) {
+            responseCache[url] = { text, etag, data };
+        }
+    }
+
+    // Compact responses carry paragraph offsets into the submitted text
+    // instead of echoing it back; restore the text for rendering and speech
+    function expandParagraph(text, para) {
+        if (para.text === undefined && para.start !== undefined) {
+            para.text = text.slice(para.start, para.end);
+        }
+        return para;
+    }
+
+    // Read newline-delimited JSON records from /api/analyze/stream
+    async function analyzeTextStream(text, onParagraph, onOverall) {
+        const response = await fetch('/api/analyze/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'application/x-ndjson',
+                ...conditionalHeaders('/api/analyze/stream', text),
+            },
+            body: JSON.stringify({ text, format: 'compact' })
+        });
+
+        if (response.status === 304) {
+            const cached = responseCache['/api/analyze/stream'].data;
+            cached.paragraphs.forEach(onParagraph);
+            onOverall(cached.overall);
+            return;
+        }
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        const received = { overall: null, paragraphs: [] };
+        const handleRecord = line => {
+            if (!line.trim()) {
+                return;
+            }
+            const record = JSON.parse(line);
+            if (record.type === 'paragraph') {
+                received.paragraphs.push(expandParagraph(text, record));
+                onParagraph(record);
+            } else if (record.type === 'overall') {
+                received.overall = record.overall;
+                onOverall(record.overall);
+            } else if (record.type === 'error') {
+                throw new Error(record.error);
+            }
+        };
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                handleRecord(buffer.slice(0, newline));
+                buffer = buffer.slice(newline + 1);
+            }
+        }
+        handleRecord(buffer + decoder.decode());
+        storeResponse('/api/analyze/stream', text, response, received);
+    }
+
     async function analyzeText(text) {
         try {
             const response = await fetch('/api/analyze', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    ...conditionalHeaders('/api/analyze', text),
                 },
-                body: JSON.stringify({ text })
+                body: JSON.stringify({ text, format: 'compact' })
             });
 
+            if (response.status === 304) {
+                return responseCache['/api/analyze'].data;
+            }
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
             const data = await response.json();
+            data.paragraphs.forEach(para => expandParagraph(text, para));
+            storeResponse('/api/analyze', text, response, data);
             return data;
         } catch (error) {
             console.error('Error:', error);
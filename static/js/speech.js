@@ -102,6 +102,21 @@ function speakText(results) {
     speakNextInQueue();
 }
 
+// Add a paragraph from the streaming endpoint to the end of the queue
+function enqueueParagraph(para) {
+    speechQueue.push({
+        text: para.text,
+        sentiment: para.sentiment,
+        score: para.score,
+        speechParams: para.speechParams,
+        index: para.index
+    });
+    document.getElementById('stop-btn').disabled = false;
+    
+    // Start speaking if nothing is playing yet
+    speakNextInQueue();
+}
+
 // Speak a specific paragraph
 function speakParagraph(index) {
     // Clear any current speech
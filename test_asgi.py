@@ -0,0 +1,103 @@
+import asyncio
+import json
+import pytest
+from app import app
+from asgi import ProcessPoolScorer, SentimentASGI
+from sentiment import ParagraphCache, analyze_sentiment, analyze_sentiment_batch
+
+PARAGRAPHS = [
+    "I love this product! It's amazing and works perfectly.",
+    "This is terrible. I'm very disappointed and angry.",
+    "The weather today is cloudy with some sunshine.",
+] * 4 + [f"Paragraph number {i} is quite good." for i in range(20)]
+
+@pytest.fixture(scope='module')
+def scorer():
+    scorer = ProcessPoolScorer(workers=2, chunk_size=3, max_in_flight=2)
+    yield scorer
+    scorer.shutdown()
+
+def test_pool_scorer_matches_batch_and_fills_cache(scorer):
+    cache = ParagraphCache(capacity=100)
+    expected = analyze_sentiment_batch(PARAGRAPHS, with_components=True)
+    assert list(scorer(PARAGRAPHS, cache)) == expected
+    for paragraph in PARAGRAPHS:
+        assert cache.get(paragraph) is not None
+    # A second pass is served from the cache without touching the pool
+    submit = scorer.pool.submit
+    scorer.pool.submit = None
+    try:
+        assert list(scorer(PARAGRAPHS, cache)) == expected
+    finally:
+        scorer.pool.submit = submit
+    assert scorer.score_text("\n".join(PARAGRAPHS)) == analyze_sentiment("\n".join(PARAGRAPHS))
+
+def test_pool_scorer_bounds_chunks_in_flight(scorer):
+    submitted = []
+    submit = scorer.pool.submit
+
+    def counting_submit(*args):
+        submitted.append(args)
+        return submit(*args)
+
+    scorer.pool.submit = counting_submit
+    try:
+        scored = scorer(PARAGRAPHS)
+        next(scored)
+        # Only max_in_flight of the document's chunks are queued at first
+        assert len(submitted) == 2
+        rest = list(scored)
+    finally:
+        scorer.pool.submit = submit
+    assert len(rest) == len(PARAGRAPHS) - 1
+    assert len(submitted) == len(set(PARAGRAPHS)) // 3 + (len(set(PARAGRAPHS)) % 3 > 0)
+
+def test_asgi_lifespan_and_http():
+    application = SentimentASGI(app, threads=2)
+    text = "\n".join(PARAGRAPHS[:5])
+    expected = app.test_client().post('/api/analyze', json={'text': text}).get_json()
+
+    async def post(path, payload):
+        body = json.dumps(payload).encode('utf-8')
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+        }
+        await application(scope, receive, send)
+        status = next(message['status'] for message in sent if message['type'] == 'http.response.start')
+        return status, json.loads(b''.join(message.get('body', b'') for message in sent
+                                           if message['type'] == 'http.response.body'))
+
+    async def run():
+        incoming = asyncio.Queue()
+        events = asyncio.Queue()
+        lifespan = asyncio.create_task(application({'type': 'lifespan'}, incoming.get, events.put))
+        incoming.put_nowait({'type': 'lifespan.startup'})
+        started = await asyncio.wait_for(events.get(), 60)
+        try:
+            assert app.config['PARAGRAPH_SCORER'] is application.scorer
+            response = await asyncio.wait_for(post('/api/analyze', {'text': text}), 60)
+        finally:
+            incoming.put_nowait({'type': 'lifespan.shutdown'})
+            stopped = await asyncio.wait_for(events.get(), 60)
+            await lifespan
+        return started['type'], response, stopped['type']
+
+    started, (status, body), stopped = asyncio.run(run())
+    assert started == 'lifespan.startup.complete'
+    assert (status, body) == (200, expected)
+    assert stopped == 'lifespan.shutdown.complete'
+    assert app.config['PARAGRAPH_SCORER'] is None and application.scorer is None
@@ -0,0 +1,109 @@
+import threading
+import time
+import pytest
+from backends import SentimentBackend, available_backends, get_backend, register_backend
+from batching import BatchingScorer, MicroBatcher
+
+@register_backend('stub')
+class StubBackend(SentimentBackend):
+    """Stands in for a model: records every batch it is asked to score"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def score_batch(self, texts):
+        self.batches.append(list(texts))
+        time.sleep(self.delay)
+        return [{'sentiment': 'positive', 'score': len(text) / 100} for text in texts]
+
+def test_registry():
+    assert {'vader', 'transformer', 'stub'} <= set(available_backends())
+    assert get_backend('stub') is get_backend('stub')
+    with pytest.raises(ValueError):
+        get_backend('missing')
+
+def test_vader_backend_matches_analyze_sentiment():
+    from sentiment import analyze_sentiment
+    texts = ["I love it!", "This is awful.", ""]
+    assert get_backend('vader').score_batch(texts) == [analyze_sentiment(t) for t in texts]
+
+def test_concurrent_requests_share_batches():
+    backend = StubBackend(delay=0.01)
+    batcher = MicroBatcher(backend.score_batch, max_batch_size=8, max_wait=0.05)
+    results = {}
+
+    def request(i):
+        texts = [f"request {i} paragraph {j}" for j in range(3)]
+        results[i] = batcher.score(texts)
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    assert all(len(batch) <= 8 for batch in backend.batches)
+    assert sum(len(batch) for batch in backend.batches) == 18
+    assert len(backend.batches) < 6
+    assert results[2][1] == {'sentiment': 'positive', 'score': len("request 2 paragraph 1") / 100}
+
+    stats = batcher.stats()
+    assert stats['items'] == 18
+    assert stats['batches'] == len(backend.batches)
+    assert stats['mean_batch_size'] == 18 / len(backend.batches)
+    assert stats['p95_queue_wait'] >= 0
+
+def test_max_wait_flushes_partial_batch():
+    backend = StubBackend()
+    batcher = MicroBatcher(backend.score_batch, max_batch_size=100, max_wait=0.01)
+    started = time.perf_counter()
+    assert batcher.submit("lonely").result(timeout=1)['sentiment'] == 'positive'
+    assert time.perf_counter() - started < 0.5
+    assert backend.batches == [["lonely"]]
+    batcher.close()
+
+def test_backend_errors_reach_every_caller():
+    def failing(texts):
+        raise RuntimeError("model unavailable")
+
+    batcher = MicroBatcher(failing, max_wait=0.01)
+    futures = [batcher.submit(text) for text in ("a", "b")]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=1)
+    assert batcher.stats()['errors'] >= 1
+    batcher.close()
+
+def test_batching_scorer_keeps_paragraph_order():
+    batcher = MicroBatcher(StubBackend().score_batch, max_batch_size=2, max_wait=0.001)
+    scored = list(BatchingScorer(batcher)(["a", "bb", "ccc"]))
+    assert [result['score'] for result, _ in scored] == [0.01, 0.02, 0.03]
+    assert all(components is result for result, components in scored)
+    batcher.close()
+
+def test_aggregate_averages_paragraph_probabilities():
+    backend = StubBackend()
+    results = [backend._result(0.9, 0.1), backend._result(0.2, 0.8), {'sentiment': 'neutral', 'score': 0.5},
+               backend._result(0.95, 0.05)]
+    overall = backend.aggregate(results)
+    assert overall['details']['positive'] == pytest.approx((0.9 + 0.2 + 0.95) / 3)
+    assert overall['sentiment'] == 'positive'
+    assert backend.aggregate([]) == {'sentiment': 'neutral', 'score': 0.5}
+    # Close averages are neutral, as for single texts
+    assert backend.aggregate([backend._result(0.9, 0.1), backend._result(0.1, 0.9)])['sentiment'] == 'neutral'
+
+def test_model_backend_overall_aggregates_paragraphs(monkeypatch):
+    import app as app_module
+    batcher = MicroBatcher(lambda texts: [StubBackend()._result(0.9 if 'good' in t else 0.1, 0.1 if 'good' in t else 0.9)
+                                          for t in texts], max_wait=0.001)
+    monkeypatch.setattr(app_module, 'paragraph_batcher', batcher)
+    monkeypatch.setattr(app_module, 'SENTIMENT_BACKEND', 'stub')
+    monkeypatch.setitem(app_module.app.config, 'PARAGRAPH_SCORER', BatchingScorer(batcher))
+    text = "\n".join(["good start"] + ["bad middle"] * 3)
+    overall = app_module.app.test_client().post('/api/analyze', json={'text': text}).get_json()['overall']
+    # The opening paragraph alone would be positive
+    assert overall['sentiment'] == 'negative'
+    assert overall['details']['negative'] == pytest.approx((0.1 + 0.9 * 3) / 4)
+    batcher.close()
@@ -0,0 +1,119 @@
+from Benchmarking import BenchmarkFramework
+from load_benchmark import DocumentGenerator, InProcessTarget, run_benchmark
+
+def test_load_benchmark_records_results():
+    generator = DocumentGenerator(paragraph_counts=[1, 3], weights=[1, 1], words_per_paragraph=10)
+    assert generator.documents(5) == generator.documents(5)
+    assert generator.documents(5) != generator.documents(5, stream=1)
+
+    benchmark = run_benchmark(InProcessTarget(), generator, concurrency_levels=[1, 2], requests=10, warmup=2)
+    assert isinstance(benchmark, BenchmarkFramework)
+    results = benchmark.results['analyze[inprocess]']
+    assert set(results) == {f"{generator.label()}@c1", f"{generator.label()}@c2"}
+    for metrics in results.values():
+        assert metrics['errors'] == 0
+        assert metrics['latency_p50'] <= metrics['latency_p95'] <= metrics['latency_p99']
+        assert metrics['requests_per_sec'] > 0
+        assert metrics['paragraphs_per_sec'] >= metrics['requests_per_sec']
+        assert metrics['peak_rss_so_far_bytes'] > 0
+    # A high-water mark: later levels never report less than earlier ones
+    assert (results[f"{generator.label()}@c1"]['peak_rss_so_far_bytes']
+            <= results[f"{generator.label()}@c2"]['peak_rss_so_far_bytes'])
+
+def test_welch_t_test_matches_t_distribution():
+    from benchmark_history import welch_t_test
+    t, df, p = welch_t_test([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], [3.0, 4.0, 5.0, 6.0, 7.0, 8.0])
+    # Equal variances and sizes: df = 10, and the two-sided p of t = 1.8516
+    # under Student's t with 10 degrees of freedom is 0.09371
+    assert abs(t - 1.8516) < 1e-4
+    assert abs(df - 10) < 1e-9
+    assert abs(p - 0.09371) < 1e-4
+    assert welch_t_test([1.0, 1.0], [1.0, 1.0])[2] == 1.0
+
+def test_history_append_query_and_compare(tmp_path):
+    from benchmark_history import BenchmarkHistory, main
+    db = str(tmp_path / 'history.db')
+    history = BenchmarkHistory(db)
+    baseline, candidate = [], []
+    for i in range(4):
+        results = {'analyze': {'docs': {'latency_p95': 0.010 + i * 0.0001, 'requests_per_sec': 100.0 + i,
+                                        'distribution': 'p1', 'timestamp': 1.0}}}
+        baseline.append(history.record(results, commit='aaaa1111', created_at=i))
+        results = {'analyze': {'docs': {'latency_p95': 0.020 + i * 0.0001, 'requests_per_sec': 101.0 + i,
+                                        'distribution': 'p1', 'timestamp': 2.0}}}
+        candidate.append(history.record(results, commit='bbbb2222', created_at=10 + i))
+
+    rows = list(history.query(metric='latency_p95', commit='aaaa'))
+    assert [row['run_id'] for row in rows] == baseline
+    assert {row['metric'] for row in history.query()} == {'latency_p95', 'requests_per_sec'}
+
+    framework = BenchmarkFramework()
+    averages = framework.calculate_average_performance('requests_per_sec', history=history, commit='bbbb')
+    assert averages == {'analyze': 102.5}
+
+    comparisons = {c['metric']: c for c in history.compare(baseline, candidate)}
+    assert comparisons['latency_p95']['regressed']
+    assert comparisons['latency_p95']['p_value'] < 0.001
+    assert not comparisons['requests_per_sec']['regressed']
+    history.close()
+
+    # A changed run configuration is not a metric, so it is neither compared nor a regression
+    history = BenchmarkHistory(str(tmp_path / 'configuration.db'))
+    before = [history.record({'analyze': {'c': {'concurrency': 16, 'workers': 4, 'errors': 0}}})]
+    after = [history.record({'analyze': {'c': {'concurrency': 1, 'workers': 1, 'errors': 0}}})]
+    assert [c['metric'] for c in history.compare(before, after)] == ['errors']
+    assert not any(c['regressed'] for c in history.compare(before, after))
+    history.close()
+
+    assert main(['--db', db, 'compare', '--by', 'commit', 'aaaa', 'bbbb']) == 1
+    assert main(['--db', db, 'compare', '--by', 'commit', 'aaaa', 'aaaa']) == 0
+
+def test_classification_metrics():
+    from evaluate_backends import classification_metrics
+    metrics = classification_metrics(
+        ['positive', 'positive', 'negative', 'neutral'],
+        ['positive', 'negative', 'negative', 'neutral']
+    )
+    assert metrics['accuracy'] == 0.75
+    assert metrics['f1_positive'] == 2 / 3
+    assert metrics['f1_negative'] == 2 / 3
+    assert metrics['f1_neutral'] == 1.0
+    assert abs(metrics['f1'] - (2 / 3 + 2 / 3 + 1) / 3) < 1e-12
+
+def test_evaluate_backends_cli(tmp_path):
+    import json
+    from evaluate_backends import main
+    dataset = tmp_path / 'reviews.jsonl'
+    rows = [("I love it, wonderful!", 1), ("Terrible and broken.", 0)] * 5
+    dataset.write_text(''.join(json.dumps({'text': t, 'stars': s}) + '\n' for t, s in rows))
+    output = tmp_path / 'results.json'
+    main([str(dataset), '--label-field', 'stars', '--label-map', '0=negative,1=positive',
+          '--workers', '1', '--chunk-size', '4', '--output', str(output)])
+    metrics = json.loads(output.read_text())['vader']['reviews']
+    assert metrics['accuracy'] == 1.0 and metrics['f1'] == 1.0
+    assert metrics['items'] == 10
+    assert metrics['latency_p50'] <= metrics['latency_p99']
+
+def test_start_workers_initializes_every_worker():
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from evaluate_backends import _init_worker, start_workers
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=3, mp_context=context, initializer=_init_worker,
+                             initargs=('vader', context.Barrier(3))) as pool:
+        pids = start_workers(pool, 3, timeout=60)
+        assert len(pids) == 3
+        assert pids == {process.pid for process in pool._processes.values()}
+
+def test_preprocessing_benchmark_lstm():
+    from preprocessing_benchmark import measure, synthetic_squad
+    columns = synthetic_squad(20)
+    for context, answer in zip(columns['context'], columns['answers']):
+        start = answer['answer_start'][0]
+        assert context[start:start + len(answer['text'][0])] == answer['text'][0]
+
+    metrics = measure('lstm', 50, 1)
+    assert metrics['examples'] == 55
+    assert metrics['examples_per_sec'] > 0
+    assert metrics['bytes_written'] > 0
+    assert metrics['peak_rss_bytes'] > 0
@@ -0,0 +1,378 @@
+import random
+import pytest
+
+pytest.importorskip('datasets')
+pytest.importorskip('transformers')
+pytest.importorskip('ijson')
+from PreProcessing import locate_answer_spans
+
+def legacy_answer_span(offset, start_char, end_char):
+    # The per-feature loops preprocess_for_bert used before locate_answer_spans
+    token_start_index = 0
+    while token_start_index < len(offset) and offset[token_start_index][0] <= start_char:
+        token_start_index += 1
+    token_start_index -= 1
+
+    token_end_index = token_start_index
+    while token_end_index < len(offset) and offset[token_end_index][1] <= end_char:
+        token_end_index += 1
+    token_end_index -= 1
+
+    if token_start_index >= 384 or token_end_index >= 384:
+        return 0, 0
+    return token_start_index, token_end_index
+
+def random_feature(rng, length):
+    # [CLS] question [SEP] context [SEP] padding, offsets as a tokenizer gives them
+    question = [(i * 4, i * 4 + 3) for i in range(rng.randint(1, 8))]
+    context_offset = rng.randint(0, 300)
+    context = []
+    position = context_offset
+    for _ in range(rng.randint(1, length - len(question) - 3)):
+        position += rng.randint(0, 2)
+        width = rng.randint(1, 6)
+        context.append((position, position + width))
+        position += width
+    offsets = [(0, 0)] + question + [(0, 0)] + context + [(0, 0)]
+    types = [0] * (len(question) + 2) + [1] * (len(context) + 1)
+    padding = length - len(offsets)
+    if rng.random() < 0.8:
+        offsets += [(0, 0)] * padding
+        types += [0] * padding
+    return offsets, types
+
+def test_locate_answer_spans_matches_legacy_loops():
+    rng = random.Random(0)
+    offset_mapping, start_chars, end_chars = [], [], []
+    for _ in range(500):
+        offsets, _ = random_feature(rng, rng.choice([16, 64, 400]))
+        start = rng.randint(0, 400)
+        offset_mapping.append(offsets)
+        start_chars.append(start)
+        end_chars.append(start + rng.randint(0, 20))
+    # First token starting after the answer: the legacy end loop starts at -1
+    offset_mapping.append([(5, 9), (10, 12), (13, 15)])
+    start_chars.append(2)
+    end_chars.append(14)
+
+    expected = [legacy_answer_span(o, s, e) for o, s, e in zip(offset_mapping, start_chars, end_chars)]
+    starts, ends = locate_answer_spans(offset_mapping, start_chars, end_chars)
+    assert list(zip(starts, ends)) == expected
+
+def test_locate_answer_spans_context_mode():
+    # [CLS] q q [SEP] context tokens at 10-14, 15-19, 20-24 [SEP] pad
+    offsets = [(0, 0), (0, 4), (5, 8), (0, 0), (10, 14), (15, 19), (20, 24), (0, 0), (0, 0)]
+    types = [0, 0, 0, 0, 1, 1, 1, 1, 0]
+    cases = [
+        ((15, 24, True), (5, 6)),    # answer inside the window
+        ((10, 14, True), (4, 4)),
+        ((2, 6, True), (0, 0)),      # falls on question characters only
+        ((20, 30, True), (0, 0)),    # runs past the window (truncated by the stride)
+        ((0, 0, False), (0, 0)),     # unanswerable
+    ]
+    starts, ends = locate_answer_spans(
+        [offsets] * len(cases),
+        [start for (start, _, _), _ in cases],
+        [end for (_, end, _), _ in cases],
+        sequence_ids=[types] * len(cases),
+        has_answer=[answered for (_, _, answered), _ in cases],
+    )
+    assert list(zip(starts, ends)) == [expected for _, expected in cases]
+
+def test_locate_answer_spans_with_tokenizer(tmp_path):
+    from transformers import BertTokenizerFast
+    words = "the tower was built in 1889 by gustave eiffel for world ' s fair paris . who ?".split()
+    vocab = tmp_path / 'vocab.txt'
+    vocab.write_text('\n'.join(['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + words) + '\n')
+    tokenizer = BertTokenizerFast(str(vocab))
+    context = "The tower was built in 1889 by Gustave Eiffel for the World's Fair in Paris. " * 12
+    answer_start = context.index("Gustave Eiffel", 600)
+    inputs = tokenizer(
+        ["Who built the tower?"], [context], max_length=64, truncation="only_second", stride=16,
+        return_overflowing_tokens=True, return_offsets_mapping=True, padding="max_length"
+    )
+    count = len(inputs["input_ids"])
+    starts, ends = locate_answer_spans(
+        inputs["offset_mapping"], [answer_start] * count, [answer_start + 14] * count,
+        sequence_ids=inputs["token_type_ids"], has_answer=[True] * count
+    )
+    found = [(i, s, e) for i, (s, e) in enumerate(zip(starts, ends)) if s]
+    assert found
+    for feature, start, end in found:
+        text = tokenizer.decode(inputs["input_ids"][feature][start:end + 1])
+        assert text == "gustave eiffel"
+
+    legacy = [legacy_answer_span(o, answer_start, answer_start + 14) for o in inputs["offset_mapping"]]
+    starts, ends = locate_answer_spans(inputs["offset_mapping"], [answer_start] * count, [answer_start + 14] * count)
+    assert list(zip(starts, ends)) == legacy
+
+def test_pack_sequences():
+    from PreProcessing import pack_sequences
+    packed = pack_sequences([[5, 6, 7], [8], [9, 10]], block_size=4, eos_token_id=1, pad_token_id=0)
+    assert packed["input_ids"] == [[5, 6, 7, 1], [8, 1, 9, 10], [1, 0, 0, 0]]
+    assert packed["attention_mask"] == [[1, 1, 1, 1], [1, 1, 1, 1], [1, 0, 0, 0]]
+    assert packed["labels"] == [[5, 6, 7, 1], [8, 1, 9, 10], [1, -100, -100, -100]]
+    assert packed["position_ids"] == [[0, 1, 2, 3], [0, 1, 0, 1], [2, 0, 0, 0]]
+
+def use_local_tokenizer(tmp_path, monkeypatch):
+    # The hub may be unreachable: serve both pipelines a tokenizer built from a local vocabulary
+    from transformers import BertTokenizerFast
+    import PreProcessing
+    from preprocessing_benchmark import WORDS
+
+    vocab = tmp_path / 'vocab.txt'
+    vocab.write_text('\n'.join(['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', 'what', '?', '.', ':', 'context',
+                                'question', 'answer'] + sorted(set(WORDS))) + '\n')
+    tokenizer = BertTokenizerFast(str(vocab), eos_token='[SEP]')
+
+    class LocalTokenizer:
+        @staticmethod
+        def from_pretrained(name, **kwargs):
+            return tokenizer
+
+    monkeypatch.setattr(PreProcessing, 'BertTokenizerFast', LocalTokenizer)
+    monkeypatch.setattr(PreProcessing, 'AutoTokenizer', LocalTokenizer)
+    return tokenizer
+
+def test_bucketing_and_packing(tmp_path, monkeypatch):
+    import json
+    from datasets import Dataset
+    import PreProcessing
+    from preprocessing_benchmark import synthetic_squad
+
+    tokenizer = use_local_tokenizer(tmp_path, monkeypatch)
+    monkeypatch.chdir(tmp_path)
+    for model_type in ('bert', 'gpt'):
+        (tmp_path / 'data' / 'processed' / model_type).mkdir(parents=True)
+    train = Dataset.from_dict(synthetic_squad(60, context_words=40))
+    val = Dataset.from_dict(synthetic_squad(10, seed=1, context_words=40))
+
+    padded, _ = PreProcessing.preprocess_for_bert(train, val, answer_spans="context")
+    bucketed, _ = PreProcessing.preprocess_for_bert(train, val, answer_spans="context", bucket_size=16)
+    with pytest.raises(ValueError):
+        PreProcessing.preprocess_for_bert(train, val, bucket_size=16)
+    assert bucketed["bucket"] == sorted(bucketed["bucket"])
+    assert all(len(ids) == length <= bucket for ids, length, bucket
+               in zip(bucketed["input_ids"], bucketed["length"], bucketed["bucket"]))
+    # Same features and answer positions as the padded path, just unpadded
+    expected = sorted(
+        (ids[:ids.index(0)] if 0 in ids else ids, start, end)
+        for ids, start, end in zip(padded["input_ids"], padded["start_positions"], padded["end_positions"])
+    )
+    assert sorted(zip(bucketed["input_ids"], bucketed["start_positions"], bucketed["end_positions"])) == expected
+    report = json.loads((tmp_path / 'data/processed/bert/padding_report.json').read_text())
+    assert report['train']['padding_ratio_after'] < report['train']['padding_ratio_before']
+
+    packed, _ = PreProcessing.preprocess_for_gpt(train, val, packing=True, block_size=128)
+    assert all(len(ids) == 128 for ids in packed["input_ids"])
+    tokens = [t for ids, mask in zip(packed["input_ids"], packed["attention_mask"])
+              for t, m in zip(ids, mask) if m]
+    # Every example is kept whole; the local tokenizer adds its own [SEP]
+    # besides the EOS separator, which GPT-2's does not
+    assert tokens.count(tokenizer.cls_token_id) == len(train)
+    assert tokens.count(tokenizer.eos_token_id) == 2 * len(train)
+    report = json.loads((tmp_path / 'data/processed/gpt/padding_report.json').read_text())
+    assert report['train']['padding_ratio_after'] < report['train']['padding_ratio_before']
+
+def test_padded_gpt_path(tmp_path, monkeypatch):
+    from datasets import Dataset
+    import PreProcessing
+    from preprocessing_benchmark import synthetic_squad
+
+    tokenizer = use_local_tokenizer(tmp_path, monkeypatch)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'processed' / 'gpt').mkdir(parents=True)
+    train = Dataset.from_dict(synthetic_squad(20, context_words=40))
+    val = Dataset.from_dict(synthetic_squad(5, seed=1, context_words=40))
+
+    processed, _ = PreProcessing.preprocess_for_gpt(train, val)
+    assert len(processed) == len(train)
+    assert all(len(ids) == 512 for ids in processed["input_ids"])
+    texts = [f"Context: {c} Question: {q} Answer: {a['text'][0]}"
+             for c, q, a in zip(train["context"], train["question"], train["answers"])]
+    assert [[t for t, m in zip(ids, mask) if m] for ids, mask
+            in zip(processed["input_ids"], processed["attention_mask"])] == tokenizer(texts)["input_ids"]
+
+def test_outputs_do_not_depend_on_workers(tmp_path, monkeypatch):
+    from datasets import Dataset
+    import PreProcessing
+    from preprocessing_benchmark import synthetic_squad
+
+    tokenizer = use_local_tokenizer(tmp_path, monkeypatch)
+    monkeypatch.chdir(tmp_path)
+    for model_type in ('bert', 'gpt'):
+        (tmp_path / 'data' / 'processed' / model_type).mkdir(parents=True)
+    train = Dataset.from_dict(synthetic_squad(50, context_words=40))
+    val = Dataset.from_dict(synthetic_squad(10, seed=1, context_words=40))
+
+    outputs = []
+    for num_proc, batch_size in ((None, 1000), (2, 7)):
+        bert, _ = PreProcessing.preprocess_for_bert(train, val, num_proc=num_proc, batch_size=batch_size,
+                                                    answer_spans="context", bucket_size=16, force=True)
+        gpt, _ = PreProcessing.preprocess_for_gpt(train, val, num_proc=num_proc, batch_size=batch_size,
+                                                  packing=True, block_size=64, force=True)
+        outputs.append((bert.data.table, gpt.data.table))
+    assert outputs[0][0].equals(outputs[1][0])
+    assert outputs[0][1].equals(outputs[1][1])
+    # Packing across batches gives the blocks of packing the whole split at once
+    texts = [f"Context: {c} Question: {q} Answer: {a['text'][0]}"
+             for c, q, a in zip(train["context"], train["question"], train["answers"])]
+    assert outputs[1][1].to_pydict() == PreProcessing.pack_sequences(
+        tokenizer(texts)["input_ids"], 64, tokenizer.eos_token_id, tokenizer.pad_token_id)
+
+def test_fresh_splits_are_reused(tmp_path, monkeypatch):
+    from datasets import Dataset
+    import PreProcessing
+    from preprocessing_benchmark import synthetic_squad
+
+    use_local_tokenizer(tmp_path, monkeypatch)
+    monkeypatch.chdir(tmp_path)
+    for model_type in ('bert', 'lstm'):
+        (tmp_path / 'data' / 'processed' / model_type).mkdir(parents=True)
+    train = Dataset.from_dict(synthetic_squad(20, context_words=30))
+    val = Dataset.from_dict(synthetic_squad(5, seed=1, context_words=30))
+    processed = tmp_path / 'data' / 'processed'
+
+    def modified():
+        return {path.relative_to(processed).as_posix(): path.stat().st_mtime_ns
+                for path in processed.rglob('*') if path.is_file()}
+
+    PreProcessing.preprocess_for_lstm(train, val)
+    PreProcessing.preprocess_for_bert(train, val, answer_spans="context")
+    built = modified()
+    reused, _ = PreProcessing.preprocess_for_bert(train, val, answer_spans="context")
+    PreProcessing.preprocess_for_lstm(train, val)
+    assert modified() == built
+    assert len(reused) == len(PreProcessing.load_from_disk('data/processed/bert/train'))
+
+    # Only the split whose input changed is rebuilt
+    PreProcessing.preprocess_for_lstm(train, Dataset.from_dict(synthetic_squad(5, seed=2, context_words=30)))
+    after = modified()
+    assert after['lstm/train.parquet'] == built['lstm/train.parquet']
+    assert after['lstm/validation.parquet'] != built['lstm/validation.parquet']
+
+    # Changing a parameter makes both splits stale
+    PreProcessing.preprocess_for_bert(train, val, answer_spans="legacy")
+    after = modified()
+    assert after['bert/train.fingerprint.json'] != built['bert/train.fingerprint.json']
+    assert after['bert/validation.fingerprint.json'] != built['bert/validation.fingerprint.json']
+
+def test_lstm_parquet_export(tmp_path, monkeypatch):
+    import pyarrow.parquet as pq
+    from datasets import Dataset
+    import PreProcessing
+    from preprocessing_benchmark import synthetic_squad
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'processed' / 'lstm').mkdir(parents=True)
+    columns = synthetic_squad(25, context_words=20)
+    columns['answers'][3] = {'text': [], 'answer_start': []}
+    train = Dataset.from_dict(columns)
+    val = Dataset.from_dict(synthetic_squad(0, seed=1))
+
+    processed, empty = PreProcessing.preprocess_for_lstm(train, val, batch_size=10)
+    path = 'data/processed/lstm/train.parquet'
+    metadata = pq.ParquetFile(path).metadata
+    assert metadata.num_row_groups == 3 and metadata.num_rows == 25
+    assert processed.column_names == ['context', 'question', 'answers', 'answer_text', 'answer_start']
+    # Returned memory-mapped from disk rather than decompressed into memory
+    assert processed.cache_files
+    assert processed[3]['answer_text'] == '' and processed[3]['answer_start'] == -1
+    assert processed['answer_start'][4] == columns['answers'][4]['answer_start'][0]
+    assert len(empty) == 0
+
+    projected = PreProcessing.read_parquet(path, columns=['context', 'question', 'answer_start'])
+    assert projected.column_names == ['context', 'question', 'answer_start']
+    assert projected['context'] == columns['context']
+
+def test_vocabulary_and_token_arrays(tmp_path, monkeypatch):
+    import numpy as np
+    from datasets import Dataset
+    import PreProcessing
+    from preprocessing_benchmark import synthetic_squad
+    from vocabulary import NpyWriter, TokenArrays, Vocabulary
+
+    with NpyWriter(str(tmp_path / 'rows.npy'), np.int32, row_shape=(2,)) as writer:
+        writer.append([[1, 2], [3, 4]])
+        writer.append(np.array([[5, 6]]))
+    assert np.load(tmp_path / 'rows.npy').tolist() == [[1, 2], [3, 4], [5, 6]]
+
+    vocabulary = Vocabulary.build(["The cat sat.", "the dog sat, the end"], max_size=5, min_freq=1)
+    assert vocabulary.tokens == ['<pad>', '<unk>', 'the', 'sat', ',']
+    assert vocabulary.encode("The bird sat").tolist() == [2, 1, 3]
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'processed' / 'lstm').mkdir(parents=True)
+    columns = synthetic_squad(30, context_words=25)
+    columns['answers'][0] = {'text': [], 'answer_start': []}
+    train = Dataset.from_dict(columns)
+    val = Dataset.from_dict(synthetic_squad(7, seed=1, context_words=25))
+    PreProcessing.preprocess_for_lstm(train, val, batch_size=8, vocab_size=40, min_freq=1)
+
+    vocabulary = Vocabulary.load('data/processed/lstm/vocab.json')
+    assert len(vocabulary) == 40
+    contexts = TokenArrays('data/processed/lstm/train_ids', 'context')
+    questions = TokenArrays('data/processed/lstm/train_ids', 'question')
+    assert len(contexts) == len(questions) == 30
+    assert contexts.ids.dtype == np.int32 and isinstance(contexts.ids, np.memmap)
+    for i in (0, 9, 29):
+        assert contexts[i].tolist() == vocabulary.encode(columns['context'][i]).tolist()
+        assert questions[i].tolist() == vocabulary.encode(columns['question'][i]).tolist()
+    batch = questions.batch([3, 4])
+    assert batch.shape == (2, max(len(questions[3]), len(questions[4])))
+
+    spans = np.load('data/processed/lstm/train_ids/answer_spans.npy', mmap_mode='r')
+    assert spans[0].tolist() == [-1, -1]
+    for i in range(1, 30):
+        _, starts, ends = vocabulary.encode(columns['context'][i], with_offsets=True)
+        start, end = spans[i]
+        answer = columns['answers'][i]
+        assert columns['context'][i][starts[start]:ends[end]] == answer['text'][0]
+    assert len(TokenArrays('data/processed/lstm/validation_ids', 'context')) == 7
+
+def test_streaming_squad_loader(tmp_path):
+    import json
+    import PreProcessing
+    from preprocessing_benchmark import synthetic_squad
+
+    columns = synthetic_squad(12, context_words=15)
+    columns['answers'][2] = {'text': [], 'answer_start': []}
+    examples = [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    (tmp_path / 'columns.json').write_text(json.dumps(columns))
+    (tmp_path / 'lines.jsonl').write_text(''.join(json.dumps(example) + '\n' for example in examples))
+    nested = {'version': '1.1', 'data': [
+        {'title': example['title'], 'paragraphs': [{'context': example['context'], 'qas': [{
+            'id': example['id'], 'question': example['question'],
+            'answers': [{'text': t, 'answer_start': s} for t, s in
+                        zip(example['answers']['text'], example['answers']['answer_start'])],
+        }]}]}
+        for example in examples
+    ]}
+    (tmp_path / 'nested.json').write_text(json.dumps(nested))
+    for name in ('columns.json', 'lines.jsonl', 'nested.json'):
+        assert list(PreProcessing.iter_squad_examples(str(tmp_path / name))) == examples
+    dataset = PreProcessing.load_squad_file(str(tmp_path / 'nested.json'), batch_size=5)
+    assert dataset.to_list() == examples
+
+    del columns['question']
+    (tmp_path / 'broken.json').write_text(json.dumps(columns))
+    with pytest.raises((ValueError, KeyError)):
+        list(PreProcessing.iter_squad_examples(str(tmp_path / 'broken.json')))
+
+def test_offline_mode_does_not_download(tmp_path, monkeypatch):
+    import json
+    import PreProcessing
+    from preprocessing_benchmark import synthetic_squad
+
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(FileNotFoundError):
+        PreProcessing.preprocess_squad('lstm', offline=True)
+
+    (tmp_path / 'data' / 'raw').mkdir(parents=True)
+    for split, size in (('train', 15), ('validation', 4)):
+        columns = synthetic_squad(size, seed=size, context_words=15)
+        (tmp_path / 'data' / 'raw' / f'squad_{split}.jsonl').write_text(''.join(
+            json.dumps(dict(zip(columns, values))) + '\n' for values in zip(*columns.values())))
+    train, val = PreProcessing.preprocess_squad('lstm', offline=True, vocab_size=50, min_freq=1)
+    assert (len(train), len(val)) == (15, 4)
@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+import sys
+from analysis import build_paragraph_result, split_paragraphs
+from score_corpus import main
+from sentiment import analyze_sentiment
+
+DOCUMENTS = [
+    {'id': f"doc-{i}", 'text': text}
+    for i, text in enumerate([
+        "I love this product! It's amazing and works perfectly.\nThe box was dented.",
+        "",
+        "This is terrible. I'm very disappointed and angry.",
+        "The weather today is cloudy with some sunshine.\n\nGreat support team!",
+    ] * 3)
+]
+
+def expected_paragraphs(text):
+    return [build_paragraph_result(paragraph, analyze_sentiment(paragraph))
+            for paragraph in split_paragraphs(text)]
+
+def test_jsonl_round_trip_keeps_input_order(tmp_path):
+    source, sink = tmp_path / 'in.jsonl', tmp_path / 'out.jsonl'
+    source.write_text(''.join(json.dumps(document) + '\n' for document in DOCUMENTS))
+    main([str(source), str(sink), '--workers', '2', '--chunk-size', '2', '--progress-interval', '0'])
+
+    results = [json.loads(line) for line in sink.read_text().splitlines()]
+    assert [result['id'] for result in results] == [document['id'] for document in DOCUMENTS]
+    for document, result in zip(DOCUMENTS, results):
+        assert result['paragraphs'] == expected_paragraphs(document['text'])
+
+def test_csv_round_trip_keeps_empty_documents(tmp_path):
+    source, sink = tmp_path / 'in.csv', tmp_path / 'out.csv'
+    with open(source, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['id', 'text'])
+        writer.writeheader()
+        writer.writerows(DOCUMENTS)
+    main([str(source), str(sink), '--workers', '2', '--chunk-size', '3', '--progress-interval', '0'])
+
+    with open(sink, newline='') as f:
+        rows = list(csv.DictReader(f))
+    expected = []
+    for document in DOCUMENTS:
+        paragraphs = expected_paragraphs(document['text'])
+        if not paragraphs:
+            expected.append((document['id'], '', '', ''))
+        for index, paragraph in enumerate(paragraphs):
+            expected.append((document['id'], str(index), paragraph['text'],
+                             str(paragraph['speechParams']['rate'])))
+    assert [(row['id'], row['paragraph'], row['text'], row['rate']) for row in rows] == expected
+    assert all(row['overall_sentiment'] for row in rows)
+
+def test_stdin_and_stdout_are_left_open(monkeypatch):
+    stdin = io.StringIO(json.dumps(DOCUMENTS[0]) + '\n')
+    stdout = io.StringIO()
+    monkeypatch.setattr(sys, 'stdin', stdin)
+    monkeypatch.setattr(sys, 'stdout', stdout)
+    main(['-', '-', '--workers', '1', '--progress-interval', '0'])
+    assert not stdin.closed and not stdout.closed
+    assert json.loads(stdout.getvalue())['id'] == DOCUMENTS[0]['id']
@@ -0,0 +1,357 @@
+import pytest
+from sentiment import analyze_sentiment, analyze_sentiment_batch
+from app import app
+
+TEXTS = [
+    "I love this product! It's amazing and works perfectly.",
+    "This is terrible. I'm very disappointed and angry.",
+    "The weather today is cloudy with some sunshine.",
+    "   ",
+    "I love this product! It's amazing and works perfectly.",
+]
+
+def test_batch_matches_single_calls():
+    assert analyze_sentiment_batch(TEXTS) == [analyze_sentiment(t) for t in TEXTS]
+
+def test_batch_endpoint_matches_analyze():
+    client = app.test_client()
+    text = "\n".join(TEXTS)
+    single = client.post('/api/analyze', json={'text': text}).get_json()
+    batch = client.post('/api/analyze/batch', json={
+        'documents': [{'id': 'doc-1', 'text': text}, {'id': 'doc-2', 'text': ''}]
+    }).get_json()
+
+    assert batch['results'][0] == dict(single, id='doc-1')
+    assert batch['results'][1]['id'] == 'doc-2'
+    assert batch['results'][1]['paragraphs'] == []
+
+def test_batch_endpoint_rejects_bad_payload():
+    client = app.test_client()
+    assert client.post('/api/analyze/batch', json={'documents': 'text'}).status_code == 400
+    assert client.post('/api/analyze/batch', json={'documents': [{'text': 3}]}).status_code == 400
+
+def test_composed_overall_matches_full_text():
+    from sentiment import compose_sentiment, score_with_components
+    documents = [
+        TEXTS,
+        ["Great service!!", "Why was it slow??", "Meh."],
+        ["...", "The food was not good.", "The staff were very friendly :)"],
+    ]
+    for paragraphs in documents:
+        paragraphs = [p for p in paragraphs if p.strip()]
+        components = [score_with_components(p)[1] for p in paragraphs]
+        assert compose_sentiment(components) == analyze_sentiment("\n".join(paragraphs))
+
+def test_paragraph_components_keep_paragraph_result():
+    from sentiment import score_with_components
+    for text in TEXTS:
+        assert score_with_components(text)[0] == analyze_sentiment(text)
+
+def test_paragraph_cache_lru_and_ttl():
+    from sentiment import ParagraphCache
+    cache = ParagraphCache(capacity=2, ttl=3600)
+    analyze_sentiment_batch(TEXTS[:3], cache=cache)
+    assert cache.stats()['evictions'] == 1
+
+    cached = analyze_sentiment_batch(TEXTS[1:3], cache=cache)
+    assert cached == [analyze_sentiment(t) for t in TEXTS[1:3]]
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (2, 3, 2)
+
+    cache.ttl = 1e-9
+    analyze_sentiment_batch(TEXTS[1:2], cache=cache)
+    assert cache.stats()['expirations'] == 1
+
+def test_cache_stats_endpoint():
+    client = app.test_client()
+    client.post('/api/analyze', json={'text': TEXTS[0]})
+    client.post('/api/analyze', json={'text': TEXTS[0]})
+    stats = client.get('/api/cache/stats').get_json()
+    assert stats['hits'] >= 1
+
+def test_compiled_lexicon_matches_zip(tmp_path):
+    from nltk.sentiment.vader import VaderConstants
+    from lexicon import CompiledSentimentIntensityAnalyzer, compile_lexicon, read_lexicon_zip
+    path = compile_lexicon(output_path=str(tmp_path / 'vader_lexicon.bin'))
+    compiled = CompiledSentimentIntensityAnalyzer(path)
+
+    assert compiled.lexicon == read_lexicon_zip()
+    assert compiled.constants.BOOSTER_DICT == VaderConstants.BOOSTER_DICT
+    assert compiled.constants.NEGATE == list(VaderConstants.NEGATE)
+    for text in TEXTS:
+        assert compiled.polarity_scores(text) == sia_scores(text)
+
+def test_stale_compiled_lexicon_falls_back_to_zip(tmp_path, monkeypatch):
+    import zipfile
+    import sentiment
+    from lexicon import CompiledSentimentIntensityAnalyzer, LEXICON_ZIP, compile_lexicon, is_current
+    path = compile_lexicon(output_path=str(tmp_path / 'vader_lexicon.bin'))
+    assert is_current(path)
+
+    # A zip updated after compiling makes the compiled file stale
+    updated = tmp_path / 'vader_lexicon.zip'
+    with zipfile.ZipFile(LEXICON_ZIP) as source, zipfile.ZipFile(updated, 'w') as target:
+        text = source.read('vader_lexicon/vader_lexicon.txt') + b'sentispeech\t2.0\t0.5\t[2, 2]\n'
+        target.writestr('vader_lexicon/vader_lexicon.txt', text)
+    stale = compile_lexicon(str(updated), str(tmp_path / 'stale.bin'))
+    assert not is_current(stale)
+
+    monkeypatch.setattr(sentiment, 'COMPILED_LEXICON', stale)
+    analyzer = sentiment._load_analyzer()
+    assert not isinstance(analyzer, CompiledSentimentIntensityAnalyzer)
+    assert 'sentispeech' not in analyzer.lexicon
+
+def sia_scores(text):
+    import nltk
+    from nltk.sentiment import SentimentIntensityAnalyzer
+    from sentiment import nltk_data_path
+    if nltk_data_path not in nltk.data.path:
+        nltk.data.path.append(nltk_data_path)
+    return SentimentIntensityAnalyzer().polarity_scores(text)
+
+def test_health_and_readiness_endpoints():
+    from sentiment import warm_up
+    warm_up()
+    client = app.test_client()
+    assert client.get('/healthz').status_code == 200
+    ready = client.get('/readyz')
+    assert ready.status_code == 200
+    assert ready.get_json()['status'] == 'ready'
+    assert 'warm_up' in ready.get_json()['timings']
+
+def test_fork_during_warm_up_does_not_deadlock(monkeypatch):
+    import os
+    import signal
+    import threading
+    import time
+    import pytest
+    import sentiment
+    if not hasattr(os, 'fork'):
+        pytest.skip("needs os.fork")
+
+    # Let the warm-up started by importing app finish before reloading
+    sentiment.warm_up()
+    loading = threading.Event()
+    load = sentiment._load_analyzer
+
+    def slow_load():
+        loading.set()
+        time.sleep(0.5)
+        return load()
+
+    monkeypatch.setattr(sentiment, '_analyzer', None)
+    monkeypatch.setattr(sentiment, '_load_analyzer', slow_load)
+    thread = threading.Thread(target=sentiment.get_analyzer)
+    thread.start()
+    # Fork while the warm-up thread holds the analyzer lock, as gunicorn
+    # --preload does right after importing the app
+    assert loading.wait(5)
+    pid = os.fork()
+    if pid == 0:
+        signal.alarm(10)
+        try:
+            sentiment.get_analyzer()
+            os._exit(0 if sentiment.analyze_sentiment("Great!")['sentiment'] == 'positive' else 1)
+        except BaseException:
+            os._exit(1)
+    _, status = os.waitpid(pid, 0)
+    thread.join()
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+def test_stream_endpoint_matches_analyze():
+    import json
+    client = app.test_client()
+    text = "\n".join(TEXTS)
+    expected = client.post('/api/analyze', json={'text': text}).get_json()
+
+    response = client.post('/api/analyze/stream', json={'text': text})
+    assert response.mimetype == 'application/x-ndjson'
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    paragraphs = [r for r in records if r.pop('type') == 'paragraph']
+    assert [p.pop('index') for p in paragraphs] == list(range(len(expected['paragraphs'])))
+    assert paragraphs == expected['paragraphs']
+    assert records[-1] == {'overall': expected['overall'], 'count': len(paragraphs)}
+
+    sse = client.post('/api/analyze/stream', json={'text': text},
+                      headers={'Accept': 'text/event-stream'})
+    assert sse.get_data(as_text=True).startswith('event: paragraph\ndata: {')
+
+def test_compact_format_offsets_and_compression():
+    import gzip
+    client = app.test_client()
+    text = "Caf\u00e9 was great \U0001F600!\n\nThe soup was cold.\n" + "\n".join(TEXTS) * 5
+    full = client.post('/api/analyze', json={'text': text}).get_json()
+    compact = client.post('/api/analyze', json={'text': text, 'format': 'compact'}).get_json()
+    assert compact['format'] == 'compact'
+    assert compact['overall'] == full['overall']
+
+    # Offsets are UTF-16 code units, as used by JavaScript's String.slice
+    utf16 = text.encode('utf-16-le')
+    for para, expected in zip(compact['paragraphs'], full['paragraphs']):
+        assert utf16[2 * para.pop('start'):2 * para.pop('end')].decode('utf-16-le') == expected.pop('text')
+        assert para == expected
+
+    response = client.post('/api/analyze', json={'text': text, 'format': 'compact'},
+                           headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    plain = client.post('/api/analyze', json={'text': text, 'format': 'compact'})
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+
+    brotli = pytest.importorskip('brotli')
+    response = client.post('/api/analyze', json={'text': text, 'format': 'compact'},
+                           headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(response.get_data()) == plain.get_data()
+
+def test_etag_conditional_requests(monkeypatch):
+    import json
+    import app as app_module
+    client = app.test_client()
+    text = "\n".join(TEXTS)
+    first = client.post('/api/analyze', json={'text': text, 'format': 'compact'})
+    etag = first.headers['ETag']
+    assert etag.startswith('W/"')
+    assert client.post('/api/analyze', json={'text': text}).headers['ETag'] != etag
+
+    # Key order and unrelated fields in the body do not change the ETag
+    body = json.dumps({'extra': 1, 'format': 'compact', 'text': text})
+    assert client.post('/api/analyze', data=body, content_type='application/json').headers['ETag'] == etag
+
+    stream_etag = client.post('/api/analyze/stream', json={'text': text}).headers['ETag']
+
+    def fail(*args, **kwargs):
+        raise AssertionError("re-analyzed an unchanged request")
+
+    monkeypatch.setattr(app_module, 'score_paragraphs', fail)
+    monkeypatch.setattr(app_module, 'iter_paragraph_scores', fail)
+    cached = client.post('/api/analyze', json={'text': text, 'format': 'compact'},
+                         headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.get_data() == b''
+    assert cached.headers['ETag'] == etag
+    assert client.post('/api/analyze/stream', json={'text': text},
+                       headers={'If-None-Match': stream_etag}).status_code == 304
+    assert client.post('/api/analyze', json={'text': text, 'format': 'compact'},
+                       headers={'If-None-Match': f'"other", {etag}'}).status_code == 304
+
+    # A different analyzer version invalidates earlier ETags
+    monkeypatch.undo()
+    monkeypatch.setattr(app_module, 'ANALYZER_VERSION', 'changed')
+    fresh = client.post('/api/analyze', json={'text': text, 'format': 'compact'},
+                        headers={'If-None-Match': etag})
+    assert fresh.status_code == 200
+    assert fresh.get_json() == first.get_json()
+
+    # The * wildcard is not a match: it would answer any analysis with an empty body
+    for path in ('/api/analyze', '/api/analyze/stream'):
+        wildcard = client.post(path, json={'text': text}, headers={'If-None-Match': '*'})
+        assert wildcard.status_code == 200 and wildcard.get_data()
+
+def test_metrics_endpoint_reports_stages():
+    from metrics import STAGE_SECONDS
+    client = app.test_client()
+    before = STAGE_SECONDS.count(endpoint='analyze', stage='score')
+    client.post('/api/analyze', json={'text': "\n".join(TEXTS)})
+    assert STAGE_SECONDS.count(endpoint='analyze', stage='score') == before + 1
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'sentispeech_stage_seconds_bucket{endpoint="analyze",stage="serialize",le="+Inf"}' in body
+    assert 'sentispeech_requests_total{endpoint="analyze",status="200"}' in body
+    assert 'sentispeech_paragraphs_total{endpoint="analyze"}' in body
+
+def test_metrics_batch_and_stream_statuses():
+    from metrics import REQUESTS, REQUEST_SECONDS, STAGE_SECONDS
+    client = app.test_client()
+    before = {status: REQUESTS.value(endpoint='analyze_batch', status=status) for status in (200, 400)}
+    timed = REQUEST_SECONDS.count(endpoint='analyze_batch')
+    client.post('/api/analyze/batch', json={'documents': [{'text': TEXTS[0]}]})
+    client.post('/api/analyze/batch', json={'documents': 'not a list'})
+    assert REQUESTS.value(endpoint='analyze_batch', status=200) == before[200] + 1
+    assert REQUESTS.value(endpoint='analyze_batch', status=400) == before[400] + 1
+    assert REQUEST_SECONDS.count(endpoint='analyze_batch') == timed + 2
+    assert STAGE_SECONDS.count(endpoint='analyze_batch', stage='score') > 0
+
+    # A stream is counted once its body has been produced, with the status it ended with
+    ok = REQUESTS.value(endpoint='analyze_stream', status=200)
+    response = client.post('/api/analyze/stream', json={'text': "\n".join(TEXTS)}, buffered=False)
+    assert REQUESTS.value(endpoint='analyze_stream', status=200) == ok
+    response.get_data()
+    assert REQUESTS.value(endpoint='analyze_stream', status=200) == ok + 1
+
+    failed = REQUESTS.value(endpoint='analyze_stream', status=500)
+    scorer = app.config.get('PARAGRAPH_SCORER')
+    app.config['PARAGRAPH_SCORER'] = lambda paragraphs, cache=None: iter(())
+    try:
+        client.post('/api/analyze/stream', json={'text': "\n".join(TEXTS)}).get_data()
+    finally:
+        app.config['PARAGRAPH_SCORER'] = scorer
+    assert REQUESTS.value(endpoint='analyze_stream', status=500) == failed + 1
+
+def test_request_profiler_ring_buffer(tmp_path):
+    from flask import Flask
+    from profiling import RequestProfiler, profile_request
+    profiler = RequestProfiler(directory=str(tmp_path), token='secret', sample_rate=0, keep=2)
+    assert profile_request(analyze_sentiment, RequestProfiler(token='', sample_rate=0)) is analyze_sentiment
+
+    def score():
+        return analyze_sentiment(TEXTS[0])
+    profiled_app = Flask(__name__)
+    profiled_app.add_url_rule('/score', view_func=profile_request(score, profiler), methods=['POST'])
+
+    client = profiled_app.test_client()
+    assert 'X-Profile-Id' not in client.post('/score').headers
+    for _ in range(3):
+        response = client.post('/score', headers={'X-Profile-Token': 'secret'})
+        assert response.status_code == 200
+    profile_id = response.headers['X-Profile-Id']
+    assert sorted(p.name for p in tmp_path.iterdir())[-2:] == [f"{profile_id}.collapsed", f"{profile_id}.pstats"]
+    assert len(list(tmp_path.iterdir())) == 4
+    assert 'analyze_sentiment' in (tmp_path / f"{profile_id}.collapsed").read_text()
+
+def test_request_profiler_failures_keep_the_response(tmp_path, monkeypatch):
+    import os
+    from flask import Flask
+    import profiling
+    from profiling import RequestProfiler, profile_request
+
+    def score():
+        return analyze_sentiment(TEXTS[0])
+
+    def post(profiler):
+        profiled_app = Flask(__name__)
+        profiled_app.add_url_rule('/score', view_func=profile_request(score, profiler), methods=['POST'])
+        return profiled_app.test_client().post('/score', headers={'X-Profile-Token': 'secret'})
+
+    # The profile directory cannot be created: a file is in the way
+    blocked = tmp_path / 'blocked'
+    blocked.write_text('')
+    response = post(RequestProfiler(directory=str(blocked / 'profiles'), token='secret', sample_rate=0))
+    assert response.status_code == 200 and response.get_json() == analyze_sentiment(TEXTS[0])
+    assert 'X-Profile-Id' not in response.headers
+
+    # A profile larger than max_bytes is trimmed at once, so no id points at it
+    oversized = tmp_path / 'oversized'
+    response = post(RequestProfiler(directory=str(oversized), token='secret', sample_rate=0, max_bytes=1))
+    assert response.status_code == 200 and 'X-Profile-Id' not in response.headers
+    assert list(oversized.iterdir()) == []
+
+    # Another worker removes the old profiles while this one is trimming
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    for name in ('1-1-000000-score.pstats', '1-1-000000-score.collapsed'):
+        (shared / name).write_text('x')
+    scandir = os.scandir
+
+    def racing_scandir(path):
+        entries = list(scandir(path))
+        for entry in entries:
+            if entry.name.startswith('1-1-'):
+                os.remove(entry.path)
+        return iter(entries)
+
+    monkeypatch.setattr(profiling.os, 'scandir', racing_scandir)
+    response = post(RequestProfiler(directory=str(shared), token='secret', sample_rate=0, keep=1))
+    assert response.status_code == 200
+    assert len(list(shared.iterdir())) == 2
+    assert (shared / f"{response.headers['X-Profile-Id']}.pstats").exists()
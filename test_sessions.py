@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+import pytest
+from app import app, score_paragraphs, score_overall
+from sessions import AnalysisSession, SessionError, SessionStore
+
+PARAGRAPHS = [
+    "I love this product! It's amazing and works perfectly.",
+    "This is terrible. I'm very disappointed and angry.",
+    "The weather today is cloudy with some sunshine.",
+]
+
+def make_session(calls=None, **kwargs):
+    def score(texts):
+        if calls is not None:
+            calls.append(list(texts))
+        return score_paragraphs(texts)
+    return AnalysisSession('test', score=score, overall=score_overall, **kwargs)
+
+def expected_overall(paragraphs):
+    client = app.test_client()
+    return client.post('/api/analyze', json={'text': "\n".join(paragraphs)}).get_json()['overall']
+
+def test_session_rescores_only_touched_paragraphs():
+    calls = []
+    session = make_session(calls)
+    touched = session.apply([{'op': 'insert', 'index': i, 'text': p} for i, p in enumerate(PARAGRAPHS)])
+    assert [index for index, _ in touched] == [0, 1, 2]
+    assert session.overall() == expected_overall(PARAGRAPHS)
+
+    touched = session.apply([
+        {'op': 'replace', 'index': 1, 'text': "This is wonderful!"},
+        {'op': 'delete', 'index': 0},
+    ])
+    assert calls[-1] == ["This is wonderful!"]
+    assert [index for index, _ in touched] == [0]
+    assert session.overall() == expected_overall(["This is wonderful!", PARAGRAPHS[2]])
+
+    session.apply([{'op': 'delete', 'index': 0}, {'op': 'delete', 'index': 0}])
+    assert len(session) == 0
+    assert session.overall() == {'sentiment': 'neutral', 'score': 0.5}
+
+def test_rejected_edits_leave_session_unchanged():
+    session = make_session(max_bytes=2048)
+    session.apply([{'op': 'insert', 'index': 0, 'text': PARAGRAPHS[0]}])
+    overall = session.overall()
+    for edits in (
+        [{'op': 'replace', 'index': 0, 'text': "Fine."}, {'op': 'delete', 'index': 3}],
+        [{'op': 'insert', 'index': 0, 'text': "two\nparagraphs"}],
+        [{'op': 'move', 'index': 0}],
+        [{'op': 'insert', 'index': 1, 'text': "x" * 4096}],
+    ):
+        with pytest.raises(SessionError):
+            session.apply(edits)
+    assert [p.text for p in session.paragraphs] == [PARAGRAPHS[0]]
+    assert session.overall() == overall
+
+def test_store_evicts_idle_sessions():
+    store = SessionStore(lambda sid: make_session(), idle_seconds=0.05, max_sessions=1)
+    session = store.open()
+    assert store.open(session.id) is session
+    with pytest.raises(SessionError):
+        store.open('other')
+    time.sleep(0.1)
+    assert store.open(session.id) is not session
+    assert store.stats()['evictions'] == 1
+
+def test_websocket_session():
+    from asgi import application
+
+    async def run():
+        incoming = asyncio.Queue()
+        sent = []
+
+        async def receive():
+            return await incoming.get()
+
+        async def send(message):
+            sent.append(message)
+
+        for message in (
+            {'type': 'websocket.connect'},
+            {'type': 'websocket.receive', 'text': json.dumps({'id': 1, 'edits': [
+                {'op': 'insert', 'index': i, 'text': p} for i, p in enumerate(PARAGRAPHS)
+            ]})},
+            {'type': 'websocket.receive', 'text': json.dumps({'id': 2, 'op': 'replace', 'index': 2, 'text': "Great!"})},
+            {'type': 'websocket.receive', 'text': json.dumps({'id': 3, 'op': 'delete', 'index': 9})},
+            {'type': 'websocket.disconnect', 'code': 1000},
+        ):
+            incoming.put_nowait(message)
+        scope = {'type': 'websocket', 'path': '/ws/analyze', 'query_string': b''}
+        await application.websocket(scope, receive, send)
+        return sent
+
+    sent = asyncio.run(run())
+    assert sent[0] == {'type': 'websocket.accept'}
+    records = [json.loads(message['text']) for message in sent[1:]]
+    assert records[0]['type'] == 'session'
+    assert [p['index'] for p in records[1]['paragraphs']] == [0, 1, 2]
+    assert [p['index'] for p in records[2]['paragraphs']] == [2]
+    assert 'text' not in records[2]['paragraphs'][0]
+    assert records[2]['overall'] == expected_overall(PARAGRAPHS[:2] + ["Great!"])
+    assert records[3]['type'] == 'error' and records[3]['id'] == 3
+    assert application.sessions.open(records[0]['session']).id == records[0]['session']
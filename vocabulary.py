@@ -0,0 +1,192 @@
+"""
+Word-level vocabulary and token-ID arrays for the LSTM pipeline.
+
+Texts are split into words and punctuation marks, encoded once into a flat
+int32 .npy array per field plus an int64 offsets array, and loaded back
+memory-mapped, so a training batch is a set of slices of the mapped files
+instead of a pass of Python string processing.
+"""
+import json
+import os
+import re
+import struct
+from collections import Counter
+import numpy as np
+
+PAD = "<pad>"
+UNK = "<unk>"
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def tokenize(text, lowercase=True):
+    """Yield (token, start, end) for every word and punctuation mark in text"""
+    for match in TOKEN_PATTERN.finditer(text or ""):
+        token = match.group()
+        yield (token.lower() if lowercase else token), match.start(), match.end()
+
+class Vocabulary:
+    """Token <-> id mapping; id 0 is padding and id 1 stands for every unknown token"""
+
+    def __init__(self, tokens, lowercase=True):
+        self.tokens = list(tokens)
+        self.lowercase = lowercase
+        self.index = {token: i for i, token in enumerate(self.tokens)}
+        self.pad_id = self.index[PAD]
+        self.unk_id = self.index[UNK]
+
+    @classmethod
+    def build(cls, texts, max_size=30000, min_freq=2, lowercase=True):
+        """
+        Keep the max_size - 2 most frequent tokens seen at least min_freq
+        times, ties broken alphabetically so the result is deterministic
+        """
+        counts = Counter()
+        for text in texts:
+            counts.update(token for token, _, _ in tokenize(text, lowercase))
+        kept = sorted((token for token, count in counts.items() if count >= min_freq),
+                      key=lambda token: (-counts[token], token))
+        return cls([PAD, UNK] + kept[:max(0, max_size - 2)], lowercase)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def encode(self, text, with_offsets=False):
+        """
+        Token ids of text as an int32 array; with_offsets also returns the
+        start and end character of every token
+        """
+        tokens = list(tokenize(text, self.lowercase))
+        ids = np.fromiter((self.index.get(token, self.unk_id) for token, _, _ in tokens),
+                          dtype=np.int32, count=len(tokens))
+        if not with_offsets:
+            return ids
+        starts = np.fromiter((start for _, start, _ in tokens), dtype=np.int64, count=len(tokens))
+        ends = np.fromiter((end for _, _, end in tokens), dtype=np.int64, count=len(tokens))
+        return ids, starts, ends
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({"lowercase": self.lowercase, "tokens": self.tokens}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            saved = json.load(f)
+        return cls(saved["tokens"], saved["lowercase"])
+
+def answer_token_span(starts, ends, answer_start, answer_end):
+    """
+    First and last token overlapping the characters [answer_start,
+    answer_end), or (-1, -1) when there is no answer or no such token
+    """
+    if answer_start < 0:
+        return -1, -1
+    first = int(np.searchsorted(ends, answer_start, side='right'))
+    last = int(np.searchsorted(starts, answer_end, side='left')) - 1
+    return (first, last) if first <= last else (-1, -1)
+
+class NpyWriter:
+    """
+    Write a .npy file whose length is not known up front. Rows are appended
+    as they come after a reserved, fixed-size header that is filled in with
+    the final shape on close; the file is renamed into place only then.
+    """
+    HEADER_BYTES = 128
+
+    def __init__(self, path, dtype, row_shape=()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.rows = 0
+        self._file = open(f"{path}.partial", 'wb')
+        self._file.write(b'\0' * self.HEADER_BYTES)
+
+    def append(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype).reshape((-1,) + self.row_shape)
+        self._file.write(rows.tobytes())
+        self.rows += len(rows)
+
+    def close(self):
+        header = repr({
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': (self.rows,) + self.row_shape,
+        })
+        # Version 1.0 header: magic, version, length, then the dict padded to HEADER_BYTES
+        header = header.ljust(self.HEADER_BYTES - 10 - 1) + '\n'
+        if len(header) != self.HEADER_BYTES - 10:
+            raise ValueError(f"Header of {self.path} does not fit in {self.HEADER_BYTES} bytes")
+        self._file.seek(0)
+        self._file.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
+        self._file.close()
+        os.replace(f"{self.path}.partial", self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(f"{self.path}.partial")
+
+def encode_split(dataset, directory, vocabulary, batch_size=1000):
+    """
+    Encode the context and question columns of a processed LSTM split into
+    <field>.ids.npy (int32) and <field>.offsets.npy (int64, one more entry
+    than there are examples) in directory, plus answer_spans.npy: the first
+    and last context token of each answer, (-1, -1) when there is none
+    """
+    os.makedirs(directory, exist_ok=True)
+    fields = ("context", "question")
+    writers = {}
+    for field in fields:
+        writers[field] = (NpyWriter(os.path.join(directory, f"{field}.ids.npy"), np.int32),
+                          NpyWriter(os.path.join(directory, f"{field}.offsets.npy"), np.int64))
+        writers[field][1].append([0])
+    spans = NpyWriter(os.path.join(directory, "answer_spans.npy"), np.int32, row_shape=(2,))
+    lengths = dict.fromkeys(fields, 0)
+    columns = ["context", "question", "answer_text", "answer_start"]
+    for batch in dataset.select_columns(columns).iter(batch_size=batch_size):
+        for field in fields:
+            ids_writer, offsets_writer = writers[field]
+            encoded = []
+            for i, text in enumerate(batch[field]):
+                if field == "context":
+                    ids, starts, ends = vocabulary.encode(text, with_offsets=True)
+                    answer_start = batch["answer_start"][i]
+                    spans.append(answer_token_span(starts, ends, answer_start,
+                                                   answer_start + len(batch["answer_text"][i])))
+                else:
+                    ids = vocabulary.encode(text)
+                encoded.append(ids)
+            if encoded:
+                ids_writer.append(np.concatenate(encoded))
+                offsets_writer.append(lengths[field] + np.cumsum([len(ids) for ids in encoded]))
+                lengths[field] += sum(len(ids) for ids in encoded)
+    for ids_writer, offsets_writer in writers.values():
+        ids_writer.close()
+        offsets_writer.close()
+    spans.close()
+
+class TokenArrays:
+    """Memory-mapped token ids of one field of an encoded split: example i is ids[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, directory, field):
+        self.ids = np.load(os.path.join(directory, f"{field}.ids.npy"), mmap_mode='r')
+        self.offsets = np.load(os.path.join(directory, f"{field}.offsets.npy"), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        # A view into the mapped file, not a copy
+        return self.ids[self.offsets[index]:self.offsets[index + 1]]
+
+    def batch(self, indices, pad_id=0):
+        """Token ids of the given examples padded into a (len(indices), longest) int32 array"""
+        rows = [self[index] for index in indices]
+        padded = np.full((len(rows), max((len(row) for row in rows), default=0)), pad_id, dtype=np.int32)
+        for i, row in enumerate(rows):
+            padded[i, :len(row)] = row
+        return padded